@@ -0,0 +1,88 @@
+"""
+Benchmark of the dataset catalog on a synthetic folder with many NAM files.
+
+Compares globbing and parsing the whole folder with a cold (new index) and a warm
+(existing index, unchanged folder) catalog lookup of a 54 hour window in the middle of the
+folder.
+"""
+import datetime
+import glob
+import os
+import tempfile
+import time
+
+import click
+
+from wrf_runner.datasets.catalog import Catalog
+from wrf_runner.datasets.filenames import parse_nam_filename
+
+START = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def create_folder(folder, files):
+    """
+    Create at least `files` empty files of 6 hourly cycles, returns the last cycle.
+    """
+    os.makedirs(folder)
+    cycle = START
+    created = 0
+    while True:
+        for hour in range(0, 85):
+            name = 'nam_218_{}_{:03d}.grb2'.format(cycle.strftime('%Y%m%d_%H%M'), hour)
+            open(os.path.join(folder, name), 'w').close()
+            created += 1
+        if created >= files:
+            return cycle
+        cycle += datetime.timedelta(hours=6)
+
+
+def glob_scan(folder, start, end):
+    result = []
+    for file in glob.glob(folder + '/nam_218_*.grb2'):
+        cycle, hour = parse_nam_filename(os.path.basename(file))
+        valid_time = cycle + datetime.timedelta(hours=hour)
+        if start <= valid_time <= end:
+            result.append(file)
+    return result
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--files', default=100000)
+def main(files):
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, 'NAM')
+        index = os.path.join(root, 'index.sqlite')
+        last_cycle = create_folder(folder, files)
+
+        # A window in the middle of the folder
+        start = START + (last_cycle - START) / 2
+        end = start + datetime.timedelta(hours=54)
+
+        scanned, glob_time = timed(glob_scan, folder, start, end)
+
+        def lookup():
+            catalog = Catalog(index)
+            catalog.update(folder)
+            result = catalog.query(folder, start, end)
+            catalog.close()
+            return result
+
+        cold, cold_time = timed(lookup)
+        warm, warm_time = timed(lookup)
+
+        assert len(scanned) == len(cold) == len(warm) > 0
+
+        print('Files in the folder: {}, selected: {}'.format(len(os.listdir(folder)), len(warm)))
+        print('glob + parse:        {:.3f} s'.format(glob_time))
+        print('catalog cold:        {:.3f} s'.format(cold_time))
+        print('catalog warm:        {:.3f} s'.format(warm_time))
+
+
+if __name__ == '__main__':
+    main()
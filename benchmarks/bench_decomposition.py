@@ -0,0 +1,108 @@
+"""
+Benchmark of the decomposition planner on the domains of the example namelist.
+
+Past runs are simulated by rsl.error files whose step times come from a hidden machine model that
+differs from the planner's cost model. The planner ranks all layouts from a few of these runs and
+the benchmark compares its choice with the best layout of the hidden model and with the layout
+WRF picks by itself for all cores.
+"""
+import math
+import os
+import random
+import tempfile
+import time
+
+import click
+import f90nml
+
+from wrf_runner import decomposition
+
+NAMELIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples',
+                        'spin_up_run', 'template', 'namelist.wps')
+
+
+def machine_seconds(domains, layout, halo_weight, thread_efficiency) -> float:
+    """
+    The hidden model of the machine, seconds per step of domain 1.
+    """
+    seconds = 0.0
+    for domain in domains:
+        x, y = decomposition.patch_size(domain, layout.nproc_x, layout.nproc_y)
+        compute = x * y / (1 + (layout.threads - 1) * thread_efficiency)
+        latency = 80 * math.log2(layout.tasks)
+        seconds += domain.steps * (compute + halo_weight * (x + y) + latency) * 2e-5
+    return seconds
+
+
+def default_layout(domains, cores) -> decomposition.Layout:
+    """
+    Layout WRF chooses without nproc_x/nproc_y: the most square factors of the task count.
+    """
+    nproc_x, nproc_y = min(decomposition.factor_pairs(cores),
+                           key=lambda pair: abs(pair[0] - pair[1]))
+    return decomposition.Layout(cores, nproc_x, nproc_y, 1)
+
+
+def write_history(directory, layout, seconds, steps) -> None:
+    os.makedirs(directory)
+    for rank in range(layout.tasks):
+        with open(os.path.join(directory, 'rsl.error.{:04d}'.format(rank)), 'w') as f:
+            f.write('Ntasks in X {:12d} , ntasks in Y {:12d}\n'.format(
+                layout.nproc_x, layout.nproc_y))
+            if layout.threads > 1:
+                f.write('WRF NUMBER OF TILES = {:3d}\n'.format(layout.threads))
+            for step in range(steps):
+                f.write('Timing for main: time 2016-01-01_00:{:02d}:00 on domain   1: {:12.5f} '
+                        'elapsed seconds\n'.format(step % 60,
+                                                   seconds * random.uniform(0.95, 1.05)))
+
+
+@click.command()
+@click.option('--cores', default=192)
+@click.option('--threads', default='1,2,4')
+@click.option('--runs', default=6, help='Number of past runs used for the ranking')
+@click.option('--steps', default=500, help='Timing lines in every log')
+@click.option('--seed', default=1)
+def main(cores, threads, runs, steps, seed):
+    random.seed(seed)
+    nml = f90nml.read(NAMELIST)['geogrid']
+    domains = decomposition.domains_from_namelist(
+        dict(nml, parent_time_step_ratio=nml['parent_grid_ratio']))
+    thread_counts = [int(value) for value in threads.split(',')]
+
+    start = time.perf_counter()
+    layouts = decomposition.candidate_layouts(domains, cores, thread_counts)
+    planned = decomposition.plan(domains, cores, thread_counts)
+    print('{} candidate layouts, planned {} in {:.4f} s'.format(len(layouts), planned,
+                                                                time.perf_counter() - start))
+
+    def machine(layout):
+        return machine_seconds(domains, layout, halo_weight=6.0, thread_efficiency=0.7)
+
+    with tempfile.TemporaryDirectory() as root:
+        history = []
+        for i, layout in enumerate(random.sample(layouts, min(runs, len(layouts)))):
+            directory = os.path.join(root, 'run_{}'.format(i))
+            write_history(directory, layout, machine(layout), steps)
+            history.append(directory)
+
+        start = time.perf_counter()
+        records = [record for record in map(decomposition.read_timing, history) if record]
+        ranking = decomposition.rank_layouts(domains, layouts, records)
+        elapsed = time.perf_counter() - start
+
+    best = min(layouts, key=machine)
+    ranked = ranking[0][0]
+    default = default_layout(domains, cores)
+
+    print('Ranked {} layouts from {} logs in {:.3f} s'.format(len(ranking), len(records), elapsed))
+    selected = [('best', best), ('ranked', ranked), ('planned', planned), ('default', default)]
+    for name, layout in selected:
+        valid = decomposition.is_valid(domains, layout.nproc_x, layout.nproc_y)
+        print('{:>8}: {:3d} tasks {:2d} x {:2d}, {} threads, {:.4f} s/step{}'.format(
+            name, layout.tasks, layout.nproc_x, layout.nproc_y, layout.threads, machine(layout),
+            '' if valid else ' (patches below the minimum)'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of an ensemble of physics variants with stub executables.
+
+All members share the met_em files of one WPS directory. The members run once with a budget
+for one wrf.exe at a time and once with the whole core budget of the node. The last run lets the
+ensemble run WPS itself for members from two initialization times, WPS runs once per forcing.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner.ensemble import Ensemble, EnsembleRunner, format_summary, sweep
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def create_met_em(directory, hours):
+    os.makedirs(directory, exist_ok=True)
+    for hour in range(hours + 1):
+        time_text = (START + datetime.timedelta(hours=hour)).strftime('%Y-%m-%d_%H:%M:%S')
+        with open(os.path.join(directory, 'met_em.d01.{}.nc'.format(time_text)), 'w') as f:
+            f.write('stub\n')
+
+
+@click.command()
+@click.option('--hours', default=12)
+@click.option('--cores', default=8, help='Core budget of the node')
+@click.option('--wrf-cores', default=2, help='Cores used by wrf.exe of every member')
+@click.option('--sleep', default=0.05, help='Seconds the stubs spend on every time step')
+def main(hours, cores, wrf_cores, sleep):
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    members = sweep({'physics': {'mp_physics': [3, 6, 8], 'cu_physics': [1, 3]}})
+
+    with tempfile.TemporaryDirectory() as root:
+        stubs.install_mpirun(os.path.join(root, 'bin'))
+        stubs.create_template(os.path.join(root, 'template'), START, hours)
+        stubs.create_wrf(os.path.join(root, 'WRF'))
+        create_met_em(os.path.join(root, 'WPS'), hours)
+        stubs.create_wps(os.path.join(root, 'WPS_install'), START, hours)
+        stubs.create_grib_files(os.path.join(root, 'data'), START, hours + 6)
+
+        timings = {}
+        for name, budget in [('one_at_a_time', wrf_cores), ('concurrent', cores)]:
+            ensemble = Ensemble(arrow.get(START), os.path.join(root, 'template'),
+                                os.path.join(root, 'WPS'), os.path.join(root, name),
+                                os.path.join(root, 'WRF'),
+                                simulation_hours=hours, wrf_cores=wrf_cores)
+
+            start = time.perf_counter()
+            results = EnsembleRunner(ensemble, budget).run(members)
+            timings[name] = time.perf_counter() - start
+
+            print(format_summary(results))
+
+        cycles = []
+        for i in range(2):
+            for member in sweep({'physics': {'mp_physics': [3, 6, 8], 'cu_physics': [1, 3]}},
+                                prefix='cycle{}'.format(i)):
+                member.initialization_time = arrow.get(START + datetime.timedelta(hours=6 * i))
+                cycles.append(member)
+
+        ensemble = Ensemble(arrow.get(START), os.path.join(root, 'template'), None,
+                            os.path.join(root, 'shared_wps'), os.path.join(root, 'WRF'),
+                            simulation_hours=hours, wrf_cores=wrf_cores,
+                            dataset_folder=os.path.join(root, 'data'),
+                            wps_install=os.path.join(root, 'WPS_install'))
+
+        start = time.perf_counter()
+        results = EnsembleRunner(ensemble, cores).run(cycles)
+        timings['shared_wps'] = time.perf_counter() - start
+
+        print(format_summary(results))
+        wps_runs = [name for name in os.listdir(os.path.join(root, 'shared_wps'))
+                    if name.startswith('wps_')]
+
+        print('One member at a time: {:.2f} s'.format(timings['one_at_a_time']))
+        print('Concurrent members:   {:.2f} s'.format(timings['concurrent']))
+        print('{} members from 2 cycles with {} WPS runs: {:.2f} s'.format(
+            len(cycles), len(wps_runs), timings['shared_wps']))
+
+
+if __name__ == '__main__':
+    main()
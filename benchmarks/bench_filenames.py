@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of NAM filename parsing: one arrow.get and regex per file against the batched
+parser.
+"""
+import datetime
+import re
+import time
+
+import arrow
+import click
+
+from wrf_runner.datasets import filenames
+from wrf_runner.datasets.nam import to_arrow
+
+
+def create_names(count):
+    names = []
+    cycle = datetime.datetime(2010, 1, 1)
+    while len(names) < count:
+        for hour in range(85):
+            names.append('/fileserver1/datasets/NAM/nam_218_{}_{:03d}.grb2'.format(
+                cycle.strftime('%Y%m%d_%H%M'), hour))
+        cycle += datetime.timedelta(hours=6)
+    return names[:count]
+
+
+def arrow_per_file(names):
+    # The previous implementation of NAM_forecast.filename_to_datetime
+    result = []
+    for name in names:
+        date = re.search(r'\d{8}_\d{4}', name).group(0)
+        datetime_ = arrow.get(date, 'YYYYMMDD_HHmm')
+        hours = int(re.match(r'nam_218_.*_.*_(\d\d\d)\.grb2', name.rsplit('/', 1)[-1]).group(1))
+        result.append(datetime_.shift(hours=hours))
+    return result
+
+
+def timed(function, names):
+    start = time.perf_counter()
+    result = function(names)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--count', default=100000)
+def main(count):
+    names = create_names(count)
+
+    reference, arrow_time = timed(arrow_per_file, names)
+    valid, batch_time = timed(filenames.nam_valid_times, names)
+    converted, compat_time = timed(lambda names: to_arrow(filenames.nam_valid_times(names)), names)
+
+    assert [time.datetime for time in reference] == valid == [time.datetime for time in converted]
+
+    print('Files:                       {}'.format(count))
+    print('arrow per file:              {:.3f} s'.format(arrow_time))
+    print('batched, datetime:           {:.3f} s'.format(batch_time))
+    print('batched, arrow (compatible): {:.3f} s'.format(compat_time))
+
+    try:
+        _, numpy_time = timed(filenames.parse_nam_filenames_datetime64, names)
+        print('batched, datetime64:         {:.3f} s'.format(numpy_time))
+    except ImportError:
+        print('numpy not installed, datetime64 parser skipped')
+
+
+if __name__ == '__main__':
+    main()
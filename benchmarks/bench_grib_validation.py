@@ -0,0 +1,89 @@
+"""
+Benchmark of the GRIB structure validation on synthetic GRIB2 files.
+
+Every file has --messages messages with a data section of --data-kb kilobytes. Some files are
+truncated or miss a field, the validator has to find exactly those.
+"""
+import os
+import struct
+import tempfile
+import time
+
+import click
+
+from wrf_runner.datasets import grib
+
+# (category, number, level type, level) of meteorological fields, discipline 0
+FIELDS = [(0, 0, 103, 2), (1, 0, 103, 2), (2, 2, 103, 10), (2, 3, 103, 10), (3, 1, 101, 0)]
+
+
+def section(number, body) -> bytes:
+    return struct.pack('>IB', 5 + len(body), number) + body
+
+
+def product_definition(category, number, level_type, level) -> bytes:
+    # Template 4.0: category, number, process, background, process id, cutoff, time unit,
+    # forecast time, first surface (type, scale, value), second surface missing
+    body = struct.pack('>HH', 0, 0)
+    body += struct.pack('>BBBBBHBBI', category, number, 2, 0, 84, 0, 0, 1, 0)
+    body += struct.pack('>BBI', level_type, 0, level)
+    body += struct.pack('>BBI', 255, 255, 0xFFFFFFFF)
+    return section(4, body)
+
+
+def message(field, data_size) -> bytes:
+    category, number, level_type, level = field
+    body = section(1, bytes(16))
+    body += section(3, bytes(67))
+    body += product_definition(category, number, level_type, level)
+    body += section(5, bytes(16))
+    body += section(6, b'\xff')
+    body += section(7, os.urandom(data_size))
+
+    length = 16 + len(body) + 4
+    return b'GRIB' + b'\x00\x00' + bytes([0, 2]) + struct.pack('>Q', length) + body + b'7777'
+
+
+def create_files(directory, count, messages, data_size):
+    paths = []
+    damaged = set()
+    for i in range(count):
+        path = os.path.join(directory, 'nam_218_20160101_0000_{:03d}.grb2'.format(i))
+        content = b''.join(message(FIELDS[j % len(FIELDS)], data_size) for j in range(messages))
+
+        if i % 10 == 3:
+            content = content[:len(content) * 2 // 3]
+            damaged.add(path)
+        elif i % 10 == 7:
+            content = b''.join(message(FIELDS[0], data_size) for _ in range(messages))
+            damaged.add(path)
+
+        with open(path, 'wb') as f:
+            f.write(content)
+        paths.append(path)
+    return paths, damaged
+
+
+@click.command()
+@click.option('--files', default=60)
+@click.option('--messages', default=400, help='Messages in every file')
+@click.option('--data-kb', default=64, help='Size of the data section of every message')
+@click.option('--workers', default=8)
+def main(files, messages, data_kb, workers):
+    with tempfile.TemporaryDirectory() as root:
+        paths, damaged = create_files(root, files, messages, data_kb * 1024)
+        total = sum(os.path.getsize(path) for path in paths)
+
+        expected = [(0,) + field for field in FIELDS]
+        for count in (1, workers):
+            start = time.perf_counter()
+            problems = grib.validate_files(paths, expected=expected, workers=count)
+            elapsed = time.perf_counter() - start
+
+            assert {report.path for report in problems} == damaged
+            print('{} workers: {} files, {:.0f} MB, {} problems found in {:.3f} s'.format(
+                count, files, total / 2 ** 20, len(problems), elapsed))
+
+
+if __name__ == '__main__':
+    main()
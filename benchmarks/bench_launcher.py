@@ -0,0 +1,72 @@
+"""
+Dry run of the whole pipeline with every launcher backend.
+
+No WPS or WRF is installed: the DryRunLauncher records the command lines and writes the success
+markers into the logs, so the scheduler runs all stages. The recorded commands of every backend are
+printed together with the time the pipeline took.
+"""
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner import launcher
+from wrf_runner.scheduler import Run, Scheduler
+
+START = datetime.datetime(2016, 1, 1)
+
+BACKENDS = [
+    ('mpirun', launcher.MpirunLauncher()),
+    ('mpirun bound', launcher.MpirunLauncher(binding='core', buffered_io=True)),
+    ('srun', launcher.SrunLauncher(binding='core')),
+]
+
+
+@click.command()
+@click.option('--hours', default=12)
+@click.option('--cores', default=16)
+@click.option('--omp-threads', default=2)
+def main(hours, cores, omp_threads):
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as root:
+        data = os.path.join(root, 'data')
+        template = os.path.join(root, 'template')
+        stubs.create_grib_files(data, START, hours)
+        stubs.create_template(template, START, hours)
+
+        for name, backend in BACKENDS:
+            directory = os.path.join(root, name.replace(' ', '_'))
+            os.makedirs(os.path.join(directory, 'WPS'))
+            os.makedirs(os.path.join(directory, 'WRF'))
+
+            record = os.path.join(directory, 'commands.jsonl')
+            launcher.configure(launcher.DryRunLauncher(backend, record_path=record))
+
+            run = Run(name, arrow.get(START), data, template, directory, simulation_hours=hours,
+                      wrf_cores=cores, decompose=True, omp_threads=[1, omp_threads])
+
+            start = time.perf_counter()
+            result, = Scheduler(cores).run([run])
+            elapsed = time.perf_counter() - start
+
+            print('{}: {} in {:.2f} s'.format(name, result.status, elapsed))
+            with open(record) as f:
+                for line in f:
+                    command = json.loads(line)
+                    environment = ' '.join('{}={}'.format(*item)
+                                           for item in sorted(command['env'].items()))
+                    print('  {:<8} {} {}'.format(command['program'], environment,
+                                                 ' '.join(command['args'])))
+
+        launcher.configure(None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of linking a large GRIB set into a WPS directory that already holds a previous link set.
+
+Compares the previous path based implementation (glob, remove one by one, character by character
+extensions) with wrf_runner.linkgrib.link_grib.
+"""
+import glob
+import os
+import tempfile
+import time
+
+import click
+
+from wrf_runner import linkgrib
+
+
+def old_extensions(last_extension=None):
+    if not last_extension:
+        current = 'AAA'
+        yield current
+    else:
+        current = last_extension
+
+    while current != 'ZZZ':
+        numbers = [ord(c) for c in current]
+        numbers[2] += 1
+        if numbers[2] > ord('Z'):
+            numbers[2] = ord('A')
+            numbers[1] += 1
+            if numbers[1] > ord('Z'):
+                numbers[1] = ord('A')
+                numbers[0] += 1
+        current = ''.join(map(chr, numbers))
+        yield current
+
+
+def old_link_grib(files, directory):
+    for link in glob.glob(os.path.join(directory, 'GRIBFILE.???')):
+        os.remove(link)
+
+    for extension, new_file in zip(old_extensions(), sorted(files)):
+        os.symlink(str(new_file), os.path.join(directory, 'GRIBFILE.' + extension))
+
+
+def create_files(directory, count):
+    os.makedirs(directory)
+    files = []
+    for i in range(count):
+        path = os.path.join(directory, 'nam_218_20160101_0000_{:05d}.grb2'.format(i))
+        open(path, 'w').close()
+        files.append(path)
+    return files
+
+
+@click.command()
+@click.option('--files', default=5000, help='Number of GRIB files')
+@click.option('--repeat', default=3, help='How many times the link set is replaced')
+def main(files, repeat):
+    with tempfile.TemporaryDirectory() as root:
+        grib_files = create_files(os.path.join(root, 'data'), files)
+
+        timings = {}
+        for name, function in [('old', old_link_grib), ('new', linkgrib.link_grib)]:
+            directory = os.path.join(root, name)
+            os.makedirs(directory)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                function(grib_files, directory=directory)
+            timings[name] = (time.perf_counter() - start) / repeat
+
+            links = sorted(glob.glob(os.path.join(directory, 'GRIBFILE.*')))
+            assert len(links) == files and os.readlink(links[-1]) == grib_files[-1]
+
+        print('{} files, average of {} link set replacements'.format(files, repeat))
+        print('Remove and relink: {:.3f} s'.format(timings['old']))
+        print('link_grib:         {:.3f} s'.format(timings['new']))
+
+        start = time.perf_counter()
+        for index in range(linkgrib.MAX_GRIB_FILES):
+            linkgrib.grib_extension(index)
+        arithmetic = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in old_extensions():
+            pass
+        iterative = time.perf_counter() - start
+
+        print('All 17576 extensions: iterative {:.4f} s, arithmetic {:.4f} s'.format(
+            iterative, arithmetic))
+
+
+if __name__ == '__main__':
+    main()
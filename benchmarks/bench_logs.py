@@ -0,0 +1,62 @@
+"""
+Benchmark of the log success check on large synthetic rsl.error.0000 files.
+
+Compares reading the whole file with readlines() against wrf_runner.logs.tail_lines.
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+from wrf_runner import logs
+
+LINE = 'Timing for main: time 2016-01-01_00:00:30 on domain   1:    0.51234 elapsed seconds\n'
+
+
+def create_log(path, size_mb):
+    block = LINE * (1024 * 1024 // len(LINE))
+    with open(path, 'w') as f:
+        for _ in range(size_mb):
+            f.write(block)
+        f.write('wrf: SUCCESS COMPLETE WRF\n')
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def readlines_check(path):
+    with open(path) as f:
+        return 'SUCCESS COMPLETE' in f.readlines()[-1]
+
+
+@click.command()
+@click.option('--sizes', default='50,200,500', help='Comma separated log sizes in MB')
+def main(sizes):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rsl.error.0000')
+
+        print('{:>8} {:>14} {:>14} {:>14} {:>14}'.format(
+            'size MB', 'readlines s', 'readlines MB', 'tail s', 'tail KB'))
+
+        for size in map(int, sizes.split(',')):
+            create_log(path, size)
+
+            ok_1, time_1, peak_1 = measure(readlines_check, path)
+            ok_2, time_2, peak_2 = measure(logs.check_success, path, 'wrf')
+            assert ok_1 and ok_2
+
+            print('{:>8} {:>14.4f} {:>14.1f} {:>14.6f} {:>14.1f}'.format(
+                size, time_1, peak_1 / 2 ** 20, time_2, peak_2 / 2 ** 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Runs one cycle of the stub pipeline with the metrics enabled and prints the run report.
+
+Also measures the overhead of metrics.run_program against subprocess.run on a trivial program.
+"""
+import datetime
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner import metrics
+from wrf_runner.scheduler import Run, Scheduler
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def collect_load(stage, values):
+    return {'load_average': os.getloadavg()[0]}
+
+
+@click.command()
+@click.option('--hours', default=12)
+@click.option('--sleep', default=0.05, help='Seconds the stubs spend on every time step')
+@click.option('--repeat', default=200, help='Runs of the trivial program for the overhead')
+def main(hours, sleep, repeat):
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    with tempfile.TemporaryDirectory() as root:
+        stubs.install_mpirun(os.path.join(root, 'bin'))
+        stubs.create_wps(os.path.join(root, 'WPS'), START, hours)
+        stubs.create_wrf(os.path.join(root, 'WRF'))
+        stubs.create_grib_files(os.path.join(root, 'data'), START, hours)
+        stubs.create_template(os.path.join(root, 'template'), START, hours)
+
+        report = os.path.join(root, 'run_report.jsonl')
+        prometheus = os.path.join(root, 'metrics.prom')
+        metrics.configure(report, prometheus)
+        metrics.register_collector(collect_load)
+
+        run = Run('cycle', arrow.get(START), os.path.join(root, 'data'),
+                  os.path.join(root, 'template'), os.path.join(root, 'run'),
+                  simulation_hours=hours, wps_install=os.path.join(root, 'WPS'),
+                  wrf_install=os.path.join(root, 'WRF'))
+        print(Scheduler(2).run([run])[0].status)
+
+        for values in metrics.read_report(report):
+            print(json.dumps(values, sort_keys=True))
+        with open(prometheus) as f:
+            print(f.read())
+
+        metrics.disable()
+        metrics.unregister_collector(collect_load)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            subprocess.run(['true'])
+        plain = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            metrics.run_program('true', ['true'], root)
+        measured = (time.perf_counter() - start) / repeat
+
+        print('subprocess.run: {:.2f} ms, metrics.run_program: {:.2f} ms'.format(
+            plain * 1000, measured * 1000))
+
+
+if __name__ == '__main__':
+    main()
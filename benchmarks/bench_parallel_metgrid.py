@@ -0,0 +1,53 @@
+"""
+Benchmark of serial metgrid against wrf_runner.parallel.run_metgrid_parallel using the stub
+metgrid.exe.
+"""
+import datetime
+import glob
+import os
+import tempfile
+import time
+
+import click
+
+import stubs
+from wrf_runner import wps
+from wrf_runner.parallel import run_metgrid_parallel
+
+START = datetime.datetime(2016, 1, 1)
+
+
+@click.command()
+@click.option('--hours', default=54)
+@click.option('--slices', default=4)
+@click.option('--sleep', default=0.1, help='Seconds the stub spends on every time step')
+def main(hours, slices, sleep):
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        stubs.create_wps('WPS', START, hours)
+
+        start = time.perf_counter()
+        wps.run_metgrid()
+        serial = time.perf_counter() - start
+        serial_files = sorted(glob.glob('WPS/met_em.*'))
+
+        for file in serial_files:
+            os.remove(file)
+
+        start = time.perf_counter()
+        run_metgrid_parallel(slices)
+        parallel = time.perf_counter() - start
+        parallel_files = sorted(glob.glob('WPS/met_em.*'))
+
+        assert serial_files == parallel_files and len(serial_files) == hours + 1
+
+        print('Time steps:        {}'.format(hours + 1))
+        print('Serial metgrid:    {:.2f} s'.format(serial))
+        print('Parallel metgrid:  {:.2f} s ({} slices)'.format(parallel, slices))
+        print('Speed-up:          {:.2f}x'.format(serial / parallel))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark of serial ungrib against wrf_runner.parallel.run_ungrib_parallel using the stub
+ungrib.exe.
+"""
+import datetime
+import glob
+import os
+import tempfile
+import time
+
+import click
+
+import stubs
+from wrf_runner import wps
+from wrf_runner.linkgrib import link_grib
+from wrf_runner.parallel import run_ungrib_parallel
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def clean(directory):
+    for file in glob.glob(os.path.join(directory, 'FILE:*')):
+        os.remove(file)
+
+
+@click.command()
+@click.option('--hours', default=54)
+@click.option('--workers', default=4)
+@click.option('--sleep', default=0.1, help='Seconds the stub spends on every time step')
+def main(hours, workers, sleep):
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        stubs.create_wps('WPS', START, hours)
+        files = stubs.create_grib_files(os.path.join(directory, 'data'), START, hours)
+
+        start = time.perf_counter()
+        link_grib(list(files.values()))
+        wps.run_ungrib()
+        serial = time.perf_counter() - start
+        serial_count = len(glob.glob('WPS/FILE:*'))
+
+        clean('WPS')
+
+        start = time.perf_counter()
+        run_ungrib_parallel(files, workers=workers)
+        parallel = time.perf_counter() - start
+        parallel_count = len(glob.glob('WPS/FILE:*'))
+
+        assert serial_count == parallel_count == hours + 1
+
+        print('Time steps:       {}'.format(hours + 1))
+        print('Serial ungrib:    {:.2f} s'.format(serial))
+        print('Parallel ungrib:  {:.2f} s ({} workers)'.format(parallel, workers))
+        print('Speed-up:         {:.2f}x'.format(serial / parallel))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark of the wrfout post-processing on synthetic NetCDF files.
+
+Every file has a few 3D variables that the post-processing does not need and the 2D surface
+variables it does. The old way loads every file completely, one after another. The PostProcessor
+reads only the surface variables in a pool of processes. Finally the files are written one by one
+while the PostProcessor watches the directory and processes them as they appear.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import tempfile
+import time
+
+import click
+import netCDF4
+import numpy as np
+
+from wrf_runner import postprocess, watcher
+
+START = datetime.datetime(2016, 1, 1)
+FIELDS = ['wind_speed_10m', 'temperature_2m_c', 'precipitation', 'T2']
+
+
+def create_wrfout(directory, index, steps, levels, size, chunked=True):
+    """
+    Write one wrfout file with `steps` hourly time steps, returns its path.
+    """
+    first = START + datetime.timedelta(hours=index * steps)
+    path = os.path.join(directory, 'wrfout_d01_{}'.format(first.strftime('%Y-%m-%d_%H:%M:%S')))
+    temporary = os.path.join(directory, 'partial.tmp')
+    random = np.random.default_rng(index)
+
+    file_format = 'NETCDF4' if chunked else 'NETCDF3_64BIT_OFFSET'
+    with netCDF4.Dataset(temporary, 'w', format=file_format) as dataset:
+        dataset.createDimension('Time', None)
+        dataset.createDimension('DateStrLen', 19)
+        dataset.createDimension('bottom_top', levels)
+        dataset.createDimension('south_north', size)
+        dataset.createDimension('west_east', size)
+
+        times = dataset.createVariable('Times', 'S1', ('Time', 'DateStrLen'))
+        for step in range(steps):
+            text = (first + datetime.timedelta(hours=step)).strftime('%Y-%m-%d_%H:%M:%S')
+            times[step] = np.array(list(text), dtype='S1')
+
+        for name in ['T', 'QVAPOR', 'P']:
+            variable = dataset.createVariable(name, 'f4',
+                                              ('Time', 'bottom_top', 'south_north', 'west_east'))
+            variable[:] = random.random((steps, levels, size, size), dtype=np.float32)
+
+        for name in ['U10', 'V10', 'T2']:
+            variable = dataset.createVariable(name, 'f4', ('Time', 'south_north', 'west_east'))
+            variable[:] = random.random((steps, size, size), dtype=np.float32) * 10
+
+        hours = np.arange(index * steps, (index + 1) * steps, dtype=np.float32)[:, None, None]
+        for name, rate in [('RAINC', 0.1), ('RAINNC', 0.3)]:
+            variable = dataset.createVariable(name, 'f4', ('Time', 'south_north', 'west_east'))
+            variable[:] = np.broadcast_to(hours * rate, (steps, size, size))
+
+    os.rename(temporary, path)
+    return path
+
+
+def evict(paths):
+    """
+    Drop the files from the page cache, so both runs read from the disk.
+    """
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def load_everything(paths, output_directory):
+    """
+    The old way: every file is read completely and processed in this process.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    previous_total = None
+    for path in sorted(paths):
+        with netCDF4.Dataset(path) as dataset:
+            dataset.set_auto_mask(False)
+            data = {name: variable[:] for name, variable in dataset.variables.items()}
+
+        total = data['RAINC'] + data['RAINNC']
+        previous = total[:1] if previous_total is None else previous_total
+        results = {
+            'wind_speed_10m': np.hypot(data['U10'], data['V10']),
+            'temperature_2m_c': data['T2'] - 273.15,
+            'precipitation': np.diff(np.concatenate([previous, total]), axis=0),
+            'T2': data['T2'],
+        }
+        previous_total = total[-1:]
+        np.savez(os.path.join(output_directory, os.path.basename(path) + '.npz'), **results)
+
+
+async def stream(directory, output_directory, files, steps, levels, size, workers, interval):
+    loop = asyncio.get_event_loop()
+
+    def write_files():
+        written = {}
+        for index in range(files):
+            path = create_wrfout(directory, index, steps, levels, size)
+            written[path] = time.monotonic()
+            time.sleep(interval)
+        return written
+
+    writer = loop.run_in_executor(None, write_files)
+    processor = postprocess.PostProcessor(FIELDS, output_directory, workers=workers)
+
+    finished = {}
+    async for result in processor.watch(directory, stop=writer, settle=0.05):
+        finished[result.path] = time.monotonic()
+
+    written = await writer
+    return [finished[path] - written[path] for path in written]
+
+
+@click.command()
+@click.option('--files', default=8)
+@click.option('--steps', default=6, help='Time steps in every file')
+@click.option('--levels', default=30)
+@click.option('--size', default=150, help='Grid points in both horizontal directions')
+@click.option('--workers', default=4)
+@click.option('--interval', default=0.3, help='Seconds between the files in the streaming run')
+def main(files, steps, levels, size, workers, interval):
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as root:
+        directory = os.path.join(root, 'WRF')
+        os.makedirs(directory)
+        paths = [create_wrfout(directory, index, steps, levels, size) for index in range(files)]
+        total = sum(os.path.getsize(path) for path in paths)
+        print('{} files, {:.0f} MB'.format(files, total / 2 ** 20))
+
+        evict(paths)
+        start = time.perf_counter()
+        load_everything(paths, os.path.join(root, 'full'))
+        full_time = time.perf_counter() - start
+
+        evict(paths)
+        start = time.perf_counter()
+        processor = postprocess.PostProcessor(FIELDS, os.path.join(root, 'pool'), workers=workers)
+        results = processor.process(paths)
+        pool_time = time.perf_counter() - start
+
+        for result in results:
+            expected = np.load(os.path.join(root, 'full', os.path.basename(result.path) + '.npz'))
+            computed = postprocess.load_processed(result.output)
+            for field in FIELDS:
+                assert np.allclose(expected[field], computed[field], atol=1e-4), field
+
+        print('Full loads, sequential:       {:.2f} s'.format(full_time))
+        print('Selected variables, {} workers: {:.2f} s'.format(workers, pool_time))
+
+        stream_directory = os.path.join(root, 'stream')
+        os.makedirs(stream_directory)
+        delays = asyncio.get_event_loop().run_until_complete(
+            stream(stream_directory, os.path.join(root, 'streamed'), files, steps, levels, size,
+                   workers, interval))
+        method = 'inotify' if watcher.inotify_available() else 'polling'
+        print('Streaming ({}): {} files, average delay from the write to the result {:.2f} s'
+              .format(method, len(delays), sum(delays) / len(delays)))
+
+
+if __name__ == '__main__':
+    main()
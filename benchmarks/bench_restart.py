@@ -0,0 +1,77 @@
+"""
+Benchmark of the restart-aware wrf.exe execution with a stub that fails on demand.
+
+A failure at --fail-at hours into the simulation is handled once by starting wrf.exe again from
+the beginning and once by wrf.run_wrf_with_restarts, which continues from the latest restart files.
+"""
+import datetime
+import glob
+import logging
+import os
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner import utils, wrf
+from wrf_runner.exceptions import WrfRunnerException
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def prepare(directory, hours, restart_interval):
+    stubs.create_template(os.path.join(directory, 'template'), START, hours)
+    stubs.create_wrf(os.path.join(directory, 'WRF'))
+    os.chdir(directory)
+
+    patch = wrf.create_namelist_patch(arrow.get(START), length_hours=hours,
+                                      restart_interval=restart_interval)
+    utils.apply_namelist_patch('template/namelist.input', 'WRF/namelist.input', patch)
+
+
+def run_from_scratch(cores):
+    try:
+        wrf.run_wrf(cores)
+    except WrfRunnerException:
+        wrf.run_wrf(cores)
+
+
+@click.command()
+@click.option('--hours', default=54)
+@click.option('--fail-at', default=50, help='Hour of the simulation when wrf.exe fails')
+@click.option('--restart-interval', default=360, help='Minutes between the restart files')
+@click.option('--sleep', default=0.05,
+              help='Seconds the stub spends on every hour of the simulation')
+def main(hours, fail_at, restart_interval, sleep):
+    logging.basicConfig(level=logging.INFO)
+    os.environ['STUB_SLEEP'] = str(sleep)
+    fail_time = START + datetime.timedelta(hours=fail_at)
+    os.environ['STUB_FAIL_AT'] = fail_time.strftime('%Y-%m-%d_%H:%M:%S')
+
+    with tempfile.TemporaryDirectory() as root:
+        stubs.install_mpirun(os.path.join(root, 'bin'))
+
+        timings = {}
+        functions = [('scratch', run_from_scratch), ('restarts', wrf.run_wrf_with_restarts)]
+        for name, function in functions:
+            prepare(os.path.join(root, name), hours, restart_interval)
+
+            start = time.perf_counter()
+            function(1)
+            timings[name] = time.perf_counter() - start
+
+            outputs = glob.glob('WRF/wrfout_d01_*')
+            restarts = glob.glob('WRF/wrfrst_d01_*')
+            print('{}: {} history files, {} restart files'.format(name, len(outputs),
+                                                                  len(restarts)))
+
+        os.chdir(root)
+
+        print('Rerun from the start:  {:.2f} s'.format(timings['scratch']))
+        print('Resubmit from restart: {:.2f} s'.format(timings['restarts']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of the multi-cycle scheduler with stub executables.
+
+Runs the cycles one after another with the whole budget and then pipelined by the Scheduler.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner.scheduler import Run, Scheduler
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def create_runs(root, cycles, hours, wrf_cores, prefix):
+    runs = []
+    for i in range(cycles):
+        initialization = START + datetime.timedelta(hours=6 * i)
+        data = os.path.join(root, 'data', 'cycle{}'.format(i))
+        if not os.path.exists(data):
+            stubs.create_grib_files(data, initialization, hours)
+            stubs.create_template(os.path.join(root, 'template{}'.format(i)), initialization,
+                                  hours)
+
+        runs.append(Run('{}{}'.format(prefix, i), arrow.get(initialization), data,
+                        os.path.join(root, 'template{}'.format(i)),
+                        os.path.join(root, prefix + str(i)), simulation_hours=hours,
+                        wrf_cores=wrf_cores, wps_install=os.path.join(root, 'WPS'),
+                        wrf_install=os.path.join(root, 'WRF')))
+    return runs
+
+
+@click.command()
+@click.option('--cycles', default=4)
+@click.option('--hours', default=12)
+@click.option('--cores', default=8, help='Core budget of the node')
+@click.option('--wrf-cores', default=6, help='Cores used by wrf.exe')
+@click.option('--sleep', default=0.05, help='Seconds the stubs spend on every time step')
+def main(cycles, hours, cores, wrf_cores, sleep):
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    with tempfile.TemporaryDirectory() as root:
+        stubs.install_mpirun(os.path.join(root, 'bin'))
+        stubs.create_wps(os.path.join(root, 'WPS'), START, hours)
+        stubs.create_wrf(os.path.join(root, 'WRF'))
+
+        start = time.perf_counter()
+        sequential = []
+        for run in create_runs(root, cycles, hours, wrf_cores, 'sequential'):
+            sequential.extend(Scheduler(cores).run([run]))
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pipelined = Scheduler(cores).run(create_runs(root, cycles, hours, wrf_cores, 'pipelined'))
+        pipelined_time = time.perf_counter() - start
+
+        for result in sequential + pipelined:
+            times = ' '.join('{}={:.2f}'.format(stage, seconds)
+                             for stage, seconds in result.stage_times.items())
+            print('{:<14} {:<8} {}'.format(result.name, result.status, times))
+
+        print('Sequential: {:.2f} s'.format(sequential_time))
+        print('Pipelined:  {:.2f} s'.format(pipelined_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the lazy file selection of datasets.sources against the eager NAM class.
+
+A synthetic NAM analysis archive of several years (every cycle with the leads 0-6) is created once
+flat and once partitioned by year. Both implementations select the files for a short window.
+"""
+import datetime
+import os
+import tempfile
+import time
+
+import click
+
+from wrf_runner.datasets.nam import NAM
+from wrf_runner.datasets.sources import NAMAnalysis
+
+START = datetime.datetime(2014, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def create_archive(root, years, partitioned) -> int:
+    count = 0
+    cycle = START
+    while cycle < START.replace(year=START.year + years):
+        directory = os.path.join(root, cycle.strftime('%Y')) if partitioned else root
+        os.makedirs(directory, exist_ok=True)
+        for lead in range(7):
+            name = 'nam_218_{}_{:03d}.grb2'.format(cycle.strftime('%Y%m%d_%H%M'), lead)
+            open(os.path.join(directory, name), 'wb').close()
+            count += 1
+        cycle += datetime.timedelta(hours=6)
+    return count
+
+
+def eager(folder, start, end) -> list:
+    nam = NAM(folder)
+    return sorted(file for cycle, files in nam.dates.items() if start <= cycle.datetime <= end
+                  for file in files)
+
+
+@click.command()
+@click.option('--years', default=3)
+@click.option('--hours', default=24, help='Length of the selected window')
+def main(years, hours):
+    start = START.replace(year=START.year + years - 1, month=6)
+    end = start + datetime.timedelta(hours=hours)
+
+    with tempfile.TemporaryDirectory() as root:
+        flat = os.path.join(root, 'flat')
+        partitioned = os.path.join(root, 'partitioned')
+        count = create_archive(flat, years, False)
+        create_archive(partitioned, years, True)
+        print('{} files in the archive'.format(count))
+
+        begin = time.perf_counter()
+        files = eager(flat, start, end)
+        print('NAM, flat folder:                  {:5d} files in {:8.2f} ms'.format(
+            len(files), (time.perf_counter() - begin) * 1000))
+
+        for name, dataset in [('flat folder', NAMAnalysis(flat)),
+                              ('partitioned', NAMAnalysis(partitioned, directory_template='%Y'))]:
+            for interval in (6, 1):
+                begin = time.perf_counter()
+                files = dataset.select_paths(start, end, interval=interval)
+                print('NAMAnalysis, {:<12} {}h: {:5d} files in {:8.2f} ms'.format(
+                    name + ',', interval, len(files), (time.perf_counter() - begin) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of staging GRIB files to local scratch.
+
+A local directory stands in for the remote archive. The files of a NAM_forecast window are staged
+with different numbers of threads, the last run shows the skipping of already staged files. The
+archive publishes a .sha256 file next to every GRIB file, the copies are verified against it.
+Finally one archived file is corrupted and its staging must fail.
+"""
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+
+import arrow
+import click
+
+from wrf_runner import staging
+from wrf_runner.datasets.nam import NAM_forecast
+from wrf_runner.exceptions import WrfRunnerException
+
+START = datetime.datetime(2016, 1, 1)
+
+
+def create_archive(directory, hours, size_mb):
+    os.makedirs(directory)
+    block = os.urandom(2 ** 20)
+    for hour in range(hours + 1):
+        name = 'nam_218_{}_{:03d}.grb2'.format(START.strftime('%Y%m%d_%H%M'), hour)
+        path = os.path.join(directory, name)
+        digest = hashlib.sha256()
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+                digest.update(block)
+        with open(path + staging.CHECKSUM_SUFFIX, 'w') as f:
+            f.write('{}  {}\n'.format(digest.hexdigest(), os.path.basename(path)))
+
+
+@click.command()
+@click.option('--hours', default=48, help='Forecast hours in the archive')
+@click.option('--size', default=16, help='Size of every file in MB')
+@click.option('--workers', default='1,4,8', help='Comma separated numbers of threads')
+@click.option('--checksum/--no-checksum', default=True)
+def main(hours, size, workers, checksum):
+    with tempfile.TemporaryDirectory() as root:
+        archive = os.path.join(root, 'archive')
+        create_archive(archive, hours, size)
+
+        dataset = NAM_forecast(archive)
+        start = arrow.get(START)
+        files = staging.select_window(dataset, start, start.shift(hours=hours))
+
+        scratch = os.path.join(root, 'scratch')
+        print('{:>8} {:>8} {:>8} {:>10} {:>10}'.format('threads', 'copied', 'skipped', 'seconds',
+                                                       'MB/s'))
+
+        for count in map(int, workers.split(',')):
+            shutil.rmtree(scratch, ignore_errors=True)
+            result = staging.GribStager(scratch, count, checksum).stage(files)
+            print('{:>8} {:>8} {:>8} {:>10.2f} {:>10.1f}'.format(
+                count, result.copied, result.skipped, result.seconds, result.throughput))
+
+        result = staging.GribStager(scratch, count, checksum).stage(files)
+        print('{:>8} {:>8} {:>8} {:>10.2f} {:>10}'.format(count, result.copied, result.skipped,
+                                                          result.seconds, '-'))
+
+        if checksum:
+            with open(files[0], 'r+b') as f:
+                f.write(b'corrupt')
+            try:
+                staging.GribStager(scratch, count, checksum).stage(files)
+            except WrfRunnerException as e:
+                print('Corrupted source detected: {}'.format(e))
+            else:
+                raise AssertionError('The corrupted source was staged')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark of generating many WRF namelists for different initialization times.
+
+Compares f90nml.read + f90nml.patch on every namelist against wrf_runner.templates, which parses
+the templates once and renders only the patched groups.
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+import arrow
+import click
+import f90nml
+
+from wrf_runner import templates, wrf
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples',
+                        'spin_up_run', 'template')
+START = datetime.datetime(2016, 1, 1)
+
+
+def initialization_times(count):
+    return [arrow.get(START + datetime.timedelta(hours=6 * i)) for i in range(count)]
+
+
+def reparse_every_time(times, output):
+    for i, initialization_time in enumerate(times):
+        # Without the cache create_namelist_patch parses both templates on every call
+        templates.clear_cache()
+        patch = wrf.create_namelist_patch(initialization_time)
+        f90nml.patch('template/namelist.input', patch,
+                     os.path.join(output, 'namelist.input.{}'.format(i)))
+
+
+def cached_templates(times, output):
+    template = templates.get_template('template/namelist.input')
+    template.write_many((os.path.join(output, 'namelist.input.{}'.format(i)),
+                         wrf.create_namelist_patch(time))
+                        for i, time in enumerate(times))
+
+
+@click.command()
+@click.option('--count', default=10000, help='Number of generated namelists')
+def main(count):
+    times = initialization_times(count)
+
+    with tempfile.TemporaryDirectory() as root:
+        shutil.copytree(TEMPLATE, os.path.join(root, 'template'))
+        os.chdir(root)
+
+        timings = {}
+        for name, function in [('reparse', reparse_every_time), ('templates', cached_templates)]:
+            output = os.path.join(root, name)
+            os.makedirs(output)
+            templates.clear_cache()
+
+            start = time.perf_counter()
+            function(times, output)
+            timings[name] = time.perf_counter() - start
+
+        last = 'namelist.input.{}'.format(count - 1)
+        same = (f90nml.read(os.path.join(root, 'reparse', last)) ==
+                f90nml.read(os.path.join(root, 'templates', last)))
+        print('Outputs equal: {}'.format(same))
+
+        print('f90nml.read + f90nml.patch: {:.2f} s ({:.0f} namelists/s)'.format(
+            timings['reparse'], count / timings['reparse']))
+        print('Cached templates:           {:.2f} s ({:.0f} namelists/s)'.format(
+            timings['templates'], count / timings['templates']))
+
+
+if __name__ == '__main__':
+    main()
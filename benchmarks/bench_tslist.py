@@ -0,0 +1,151 @@
+"""
+Benchmark of the tslist reader on synthetic station files.
+
+Every station has a .TS file and the .UU, .VV and .TH profile files. The old way reads the files
+one after another and parses them line by line. The TimeSeriesReader parses whole files at once,
+first in this process and then in a pool of processes. Finally the files are written in steps and
+the reader is updated after every step, reading only the new lines, and then the files are
+rewritten like by a restarted WRF.
+"""
+import logging
+import os
+import tempfile
+import time
+
+import click
+import numpy as np
+
+from wrf_runner import tslist
+
+PROFILES = ['UU', 'VV', 'TH']
+
+
+def header(index):
+    latitude, longitude = 45 + index / 100, 10 + index / 100
+    i, j = index % 100 + 1, index // 100 + 1
+    return ('{:<26}{:2d}{:3d} s{:04d} ({:8.3f},{:8.3f}) ({:4d},{:4d}) ({:8.3f},{:8.3f}) '
+            '{:6.1f} meters\n'.format('Station {}'.format(index), 1, index, index, latitude,
+                                      longitude, i, j, latitude, longitude, 100.0 + index))
+
+
+def ts_lines(index, first, count, random):
+    values = random.random((count, len(tslist.TS_COLUMNS) - 5)) * 100
+    i, j = index % 100 + 1, index // 100 + 1
+    return ''.join('{:2d}{:15.7f}{:4d}{:4d}{:4d}'.format(1, (first + row) / 60, index, i, j) +
+                   ''.join('{:14.6f}'.format(value) for value in values[row]) + '\n'
+                   for row in range(count))
+
+
+def profile_lines(first, count, levels, random):
+    values = random.random((count, levels)) * 10
+    return ''.join('{:11.6f}'.format((first + row) / 60) +
+                   ''.join('{:11.5f}'.format(value) for value in values[row]) + '\n'
+                   for row in range(count))
+
+
+def write_stations(directory, stations, first, count, levels, seed=0):
+    """
+    Append `count` time steps to the files of all stations, writing the header for the first step.
+    """
+    random = np.random.default_rng(seed)
+    for index in range(1, stations + 1):
+        prefix = os.path.join(directory, 's{:04d}.d01.'.format(index))
+        with open(prefix + 'TS', 'a') as f:
+            f.write((header(index) if first == 0 else '') + ts_lines(index, first, count, random))
+        for extension in PROFILES:
+            with open(prefix + extension, 'a') as f:
+                f.write((header(index) if first == 0 else '') +
+                        profile_lines(first, count, levels, random))
+
+
+def parse_line_by_line(directory) -> dict:
+    """
+    The old way: every line is split and converted in Python.
+    """
+    result = {}
+    for prefix, files in sorted(tslist.station_files(directory).items()):
+        for extension, path in files.items():
+            with open(path) as f:
+                f.readline()
+                result[prefix, extension] = [[float(value) for value in line.split()]
+                                             for line in f]
+    return result
+
+
+@click.command()
+@click.option('--stations', default=100)
+@click.option('--steps', default=1440, help='Time steps in every file')
+@click.option('--levels', default=40, help='Model levels of the profiles')
+@click.option('--workers', default=4)
+@click.option('--updates', default=10, help='Number of writes in the incremental run')
+def main(stations, steps, levels, workers, updates):
+    logging.basicConfig(level=logging.WARNING)
+
+    # Three digit station indices run into the domain column
+    station = tslist.parse_header(header(100))
+    assert (station.name, station.domain, station.index) == ('Station 100', 1, 100), station
+    line = ('{:<26}{:2d}{:3d} hallt ( -72.330, 170.250) (  81,  52) ( -72.331, 170.243)'
+            '   12.3 meters\n')
+    station = tslist.parse_header(line.format('Cape Hallett', 1, 123))
+    assert (station.name, station.index, station.prefix) == ('Cape Hallett', 123, 'hallt'), station
+
+    with tempfile.TemporaryDirectory() as root:
+        directory = os.path.join(root, 'WRF')
+        os.makedirs(directory)
+        write_stations(directory, stations, 0, steps, levels)
+        total = sum(os.path.getsize(os.path.join(directory, name))
+                    for name in os.listdir(directory))
+        print('{} stations, {} files, {:.0f} MB'.format(stations, stations * (1 + len(PROFILES)),
+                                                        total / 2 ** 20))
+
+        start = time.perf_counter()
+        expected = parse_line_by_line(directory)
+        print('Line by line:             {:6.2f} s'.format(time.perf_counter() - start))
+
+        for count in (0, workers):
+            start = time.perf_counter()
+            series = tslist.read_time_series(directory, workers=count)
+            print('Vectorized, {} workers:    {:6.2f} s'.format(count,
+                                                                time.perf_counter() - start))
+
+        for index, station in enumerate(series.stations):
+            rows = np.array(expected[station.prefix, 'TS'])
+            assert np.allclose(series['t'][index], rows[:, 5])
+            profile = np.array(expected[station.prefix, 'UU'])
+            assert np.allclose(series['uu'][index], profile[:, 1:])
+            assert station.index == int(station.prefix[1:])
+        assert series['th'].shape == (stations, steps, levels)
+
+        path = os.path.join(root, 'tslist.npz')
+        series.save(path)
+        start = time.perf_counter()
+        loaded = tslist.TimeSeries.load(path)
+        print('Columnar store: {:.0f} MB, loaded in {:.3f} s'.format(
+            os.path.getsize(path) / 2 ** 20, time.perf_counter() - start))
+        assert np.array_equal(loaded['th'], series['th']) and loaded.stations == series.stations
+
+        incremental = os.path.join(root, 'incremental')
+        os.makedirs(incremental)
+        chunk = steps // updates
+        seconds = []
+        with tslist.TimeSeriesReader(incremental, workers=workers) as reader:
+            for update in range(updates):
+                write_stations(incremental, stations, update * chunk, chunk, levels, seed=update)
+                start = time.perf_counter()
+                reader.update()
+                series = reader.time_series()
+                seconds.append(time.perf_counter() - start)
+                assert len(series.hours) == (update + 1) * chunk
+            print('Incremental: {} updates of {} steps, {:.3f} s per update on average'.format(
+                updates, chunk, sum(seconds) / len(seconds)))
+
+            # A restarted WRF rewrites the files from the beginning
+            for name in os.listdir(incremental):
+                os.remove(os.path.join(incremental, name))
+            write_stations(incremental, stations, 0, chunk, levels, seed=updates)
+            reader.update()
+            assert len(reader.time_series().hours) == chunk
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of streaming wrfout files while the stub wrf.exe still runs.
+
+Reports when the first file reached the consumer compared to the end of wrf.exe and the average
+delay between the last write of a file and its delivery, with inotify and with polling.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import tempfile
+import time
+
+import arrow
+import click
+
+import stubs
+from wrf_runner import utils, watcher, wrf
+
+START = datetime.datetime(2016, 1, 1)
+
+
+async def stream(use_inotify, settle, poll_interval):
+    started = time.time()
+    run = asyncio.ensure_future(wrf.run_wrf_async(1))
+    delays = []
+    first = None
+
+    outputs = watcher.watch_outputs('WRF/', watcher.WRFOUT_PATTERNS, stop=run, settle=settle,
+                                    poll_interval=poll_interval, use_inotify=use_inotify)
+    async for path in outputs:
+        now = time.time()
+        first = first or now - started
+        delays.append(now - os.path.getmtime(path))
+
+    await run
+    return first, time.time() - started, delays
+
+
+@click.command()
+@click.option('--hours', default=24)
+@click.option('--sleep', default=0.2,
+              help='Seconds the stub spends on every hour of the simulation')
+@click.option('--settle', default=0.1)
+@click.option('--poll-interval', default=0.5)
+def main(hours, sleep, settle, poll_interval):
+    logging.basicConfig(level=logging.WARNING)
+    os.environ['STUB_SLEEP'] = str(sleep)
+
+    with tempfile.TemporaryDirectory() as root:
+        stubs.install_mpirun(os.path.join(root, 'bin'))
+        stubs.create_template(os.path.join(root, 'template'), START, hours)
+
+        modes = [('polling', False)]
+        if watcher.inotify_available():
+            modes.insert(0, ('inotify', True))
+
+        for name, use_inotify in modes:
+            directory = os.path.join(root, name)
+            stubs.create_wrf(os.path.join(directory, 'WRF'))
+            os.symlink(os.path.join(root, 'template'), os.path.join(directory, 'template'))
+            os.chdir(directory)
+
+            patch = wrf.create_namelist_patch(arrow.get(START), length_hours=hours)
+            utils.apply_namelist_patch('template/namelist.input', 'WRF/namelist.input', patch)
+
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            first, total, delays = loop.run_until_complete(stream(use_inotify, settle,
+                                                                  poll_interval))
+            loop.close()
+
+            print('{}: {} files, first after {:.2f} s, wrf.exe ended after {:.2f} s, '
+                  'average delay {:.2f} s'.format(name, len(delays), first, total,
+                                                  sum(delays) / len(delays)))
+
+        os.chdir(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark of wrf_runner.workspace.provision against shutil.copytree on a synthetic installation
+tree.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from wrf_runner import workspace
+
+
+def create_installation(root, directories, files_per_directory, file_size):
+    block = os.urandom(file_size)
+
+    for i in range(directories):
+        directory = os.path.join(root, 'src{:03d}'.format(i))
+        os.makedirs(directory)
+        for j in range(files_per_directory):
+            with open(os.path.join(directory, 'module{:04d}.o'.format(j)), 'wb') as f:
+                f.write(block)
+
+    run = os.path.join(root, 'run')
+    os.makedirs(run)
+    for name in ('RRTM_DATA', 'CAM_ABS_DATA', 'ozone.formatted', 'LANDUSE.TBL', 'namelist.input'):
+        with open(os.path.join(run, name), 'wb') as f:
+            f.write(block)
+    os.symlink('../src000/module0000.o', os.path.join(run, 'wrf.exe'))
+
+
+def tree_size(root):
+    return sum(os.path.getsize(os.path.join(path, name))
+               for path, _, files in os.walk(root) for name in files)
+
+
+@click.command()
+@click.option('--directories', default=20)
+@click.option('--files', default=100, help='Files per directory')
+@click.option('--file-size', default=100 * 1024, help='Size of every file in bytes')
+def main(directories, files, file_size):
+    with tempfile.TemporaryDirectory() as root:
+        installation = os.path.join(root, 'WRFV3')
+        create_installation(installation, directories, files, file_size)
+
+        start = time.perf_counter()
+        shutil.copytree(installation, os.path.join(root, 'copy'), symlinks=True)
+        copy_time = time.perf_counter() - start
+        copy_bytes = tree_size(os.path.join(root, 'copy'))
+
+        start = time.perf_counter()
+        stats = workspace.provision(installation, os.path.join(root, 'WRF'))
+        provision_time = time.perf_counter() - start
+
+        print('Installation: {} files, {:.1f} MB'.format(directories * files + 6,
+                                                         copy_bytes / 2 ** 20))
+        print('{:<10} {:>10} {:>16}'.format('method', 'time s', 'MB written'))
+        print('{:<10} {:>10.3f} {:>16.2f}'.format('copytree', copy_time, copy_bytes / 2 ** 20))
+        print('{:<10} {:>10.3f} {:>16.2f}'.format('provision', provision_time,
+                                                  stats['bytes_written'] / 2 ** 20))
+        print('Linked: {linked}, copied: {copied}, reflinked: {reflinked}'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the WPS and WRF executables used by the benchmarks.
+
+The program is selected by the name it is called with (geogrid.exe, ungrib.exe, ...). It reads the
+time window from the namelist in the current directory, writes dummy output files, spends
+STUB_SLEEP seconds per output time and finishes the log with the usual success message.
+
+wrf.exe writes restart files every restart_interval minutes and fails at the times listed in
+STUB_FAIL_AT (comma separated, format 2016-01-01_06:00:00). Every listed failure happens only once,
+a marker file in the current directory records that it already happened.
+"""
+import datetime
+import os
+import re
+import sys
+import time
+
+SLEEP = float(os.environ.get('STUB_SLEEP', '0.05'))
+FAIL_AT = [time for time in os.environ.get('STUB_FAIL_AT', '').split(',') if time]
+WPS_FORMAT = '%Y-%m-%d_%H:%M:%S'
+WPS_SUCCESS = 'Successful completion of program {}.exe\n'
+WRF_SUCCESS = '{}: SUCCESS COMPLETE {}\n'
+
+
+def first_value(text, name):
+    match = re.search(r'^\s*{}\s*=\s*([^,\n]+)'.format(name), text, re.MULTILINE | re.IGNORECASE)
+    return match.group(1).strip().strip('\'"')
+
+
+def wps_window():
+    with open('namelist.wps') as f:
+        text = f.read()
+
+    start = datetime.datetime.strptime(first_value(text, 'start_date'), WPS_FORMAT)
+    end = datetime.datetime.strptime(first_value(text, 'end_date'), WPS_FORMAT)
+    interval = datetime.timedelta(seconds=int(first_value(text, 'interval_seconds')))
+    return text, start, end, interval
+
+
+def wrf_window():
+    with open('namelist.input') as f:
+        text = f.read()
+
+    def read_time(prefix):
+        return datetime.datetime(*[int(first_value(text, prefix + part))
+                                   for part in ('year', 'month', 'day', 'hour')])
+
+    return text, read_time('start_'), read_time('end_')
+
+
+def steps(start, end, interval):
+    while start <= end:
+        yield start
+        start += interval
+
+
+def touch(name):
+    with open(name, 'w') as f:
+        f.write('stub\n')
+
+
+def geogrid():
+    text, _, _, _ = wps_window()
+    for domain in range(1, int(first_value(text, 'max_dom')) + 1):
+        time.sleep(SLEEP)
+        touch('geo_em.d{:02d}.nc'.format(domain))
+
+
+def ungrib():
+    _, start, end, interval = wps_window()
+    for step in steps(start, end, interval):
+        time.sleep(SLEEP)
+        touch('FILE:' + step.strftime('%Y-%m-%d_%H'))
+
+
+def metgrid():
+    _, start, end, interval = wps_window()
+    for step in steps(start, end, interval):
+        time.sleep(SLEEP)
+        touch('met_em.d01.{}.nc'.format(step.strftime(WPS_FORMAT)))
+
+
+def real():
+    time.sleep(SLEEP)
+    touch('wrfinput_d01')
+    touch('wrfbdy_d01')
+
+
+def restart_interval(text):
+    try:
+        return datetime.timedelta(minutes=int(first_value(text, 'restart_interval')))
+    except AttributeError:
+        return None
+
+
+def wrf():
+    text, start, end = wrf_window()
+    interval = restart_interval(text)
+
+    with open('rsl.error.0000', 'a') as log:
+        for step in steps(start, end, datetime.timedelta(hours=1)):
+            time.sleep(SLEEP)
+            name = step.strftime(WPS_FORMAT)
+            marker = 'stub_failed_' + name
+            if name in FAIL_AT and step > start and not os.path.exists(marker):
+                touch(marker)
+                log.write('stub: simulated failure at {}\n'.format(name))
+                sys.exit(1)
+
+            touch('wrfout_d01_' + name)
+            if interval and step > start and (step - start) % interval == datetime.timedelta(0):
+                touch('wrfrst_d01_' + name)
+            log.write('Timing for main: time {} on domain   1:    {:.5f} elapsed seconds\n'.format(
+                step.strftime(WPS_FORMAT), SLEEP))
+            log.flush()
+
+
+def main():
+    program = os.path.basename(sys.argv[0]).split('.')[0]
+
+    if program in ('real', 'wrf'):
+        logfile = 'rsl.error.0000'
+        if os.path.exists(logfile):
+            os.remove(logfile)
+    else:
+        logfile = program + '.log'
+
+    globals()[program]()
+
+    with open(logfile, 'a') as f:
+        if program in ('real', 'wrf'):
+            f.write(WRF_SUCCESS.format(program, program.upper()))
+        else:
+            f.write(WPS_SUCCESS.format(program))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Helpers that create fake WPS and WRF directories with stub executables for the benchmarks.
+"""
+import datetime
+import os
+import stat
+
+STUB_PROGRAM = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_program.py')
+
+NAMELIST_WPS = """&share
+ wrf_core = 'ARW',
+ max_dom = {max_dom},
+ start_date = {start_dates},
+ end_date = {end_dates},
+ interval_seconds = {interval_seconds},
+ io_form_geogrid = 2,
+/
+
+&geogrid
+ parent_id = {parent_ids},
+ parent_grid_ratio = {ratios},
+ i_parent_start = {starts},
+ j_parent_start = {starts},
+ e_we = {sizes},
+ e_sn = {sizes},
+ geog_data_res = {resolutions},
+ dx = 12000,
+ dy = 12000,
+ map_proj = 'lambert',
+ ref_lat = 49.0,
+ ref_lon = -113.0,
+ truelat1 = 49.0,
+ truelat2 = 49.0,
+ stand_lon = -113.0,
+ geog_data_path = 'geog',
+/
+
+&ungrib
+ out_format = 'WPS',
+ prefix = 'FILE',
+/
+
+&metgrid
+ fg_name = 'FILE',
+ io_form_metgrid = 2,
+/
+"""
+
+
+NAMELIST_INPUT = """&time_control
+ run_hours = 0,
+ interval_seconds = 3600,
+ history_interval = 60,
+/
+
+&domains
+ time_step = 60,
+ e_vert = 35, 35, 35,
+/
+
+&physics
+/
+"""
+
+MPIRUN = """#!/bin/sh
+# Stand-in for mpirun: drop the options and run the program once
+while [ "${1#-}" != "$1" ]; do
+    case "$1" in
+        -n|-np|-x|--bind-to|--map-by) shift 2 ;;
+        *) shift ;;
+    esac
+done
+exec "$@"
+"""
+
+
+def _join(values):
+    return ', '.join(str(value) for value in values)
+
+
+def namelist_wps(start, hours, interval_seconds=3600, max_dom=1):
+    """
+    Text of a namelist.wps for the given window. start is a datetime.
+    """
+    start_text = "'{}'".format(start.strftime('%Y-%m-%d_%H:%M:%S'))
+    end = start + datetime.timedelta(hours=hours)
+    end_text = "'{}'".format(end.strftime('%Y-%m-%d_%H:%M:%S'))
+
+    return NAMELIST_WPS.format(
+        max_dom=max_dom,
+        start_dates=_join([start_text] * max_dom),
+        end_dates=_join([end_text] + [start_text] * (max_dom - 1)),
+        interval_seconds=interval_seconds,
+        parent_ids=_join([1] + list(range(1, max_dom))),
+        ratios=_join([1] + [3] * (max_dom - 1)),
+        starts=_join([1] + [30] * (max_dom - 1)),
+        sizes=_join([100] + [91] * (max_dom - 1)),
+        resolutions=_join(["'default'"] * max_dom))
+
+
+def install_stub(directory, program):
+    """
+    Create directory/program.exe that runs the stub program.
+    """
+    path = os.path.join(directory, program + '.exe')
+    if os.path.lexists(path):
+        os.remove(path)
+    os.symlink(STUB_PROGRAM, path)
+
+    mode = os.stat(STUB_PROGRAM).st_mode
+    os.chmod(STUB_PROGRAM, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def create_wps(directory, start, hours, interval_seconds=3600, max_dom=1):
+    os.makedirs(directory, exist_ok=True)
+    for program in ('geogrid', 'ungrib', 'metgrid'):
+        install_stub(directory, program)
+
+    with open(os.path.join(directory, 'namelist.wps'), 'w') as f:
+        f.write(namelist_wps(start, hours, interval_seconds, max_dom))
+
+    with open(os.path.join(directory, 'Vtable'), 'w') as f:
+        f.write('stub Vtable\n')
+
+
+def create_wrf(directory):
+    os.makedirs(directory, exist_ok=True)
+    for program in ('real', 'wrf'):
+        install_stub(directory, program)
+
+
+def create_grib_files(directory, start, hours):
+    """
+    Create empty NAM forecast files, returns a dictionary datetime -> path.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    files = {}
+    for hour in range(hours + 1):
+        name = 'nam_218_{}_{:03d}.grb2'.format(start.strftime('%Y%m%d_%H%M'), hour)
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'GRIB')
+        files[start + datetime.timedelta(hours=hour)] = path
+
+    return files
+
+
+def install_mpirun(directory):
+    """
+    Put a fake mpirun into the directory and the directory at the beginning of PATH.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'mpirun')
+    with open(path, 'w') as f:
+        f.write(MPIRUN)
+    os.chmod(path, 0o755)
+    os.environ['PATH'] = os.path.abspath(directory) + os.pathsep + os.environ['PATH']
+
+
+def create_template(directory, start, hours, interval_seconds=3600, max_dom=1):
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, 'namelist.wps'), 'w') as f:
+        f.write(namelist_wps(start, hours, interval_seconds, max_dom))
+    with open(os.path.join(directory, 'namelist.input'), 'w') as f:
+        f.write(NAMELIST_INPUT)
+    with open(os.path.join(directory, 'Vtable'), 'w') as f:
+        f.write('stub Vtable\n')
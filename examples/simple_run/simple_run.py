@@ -4,14 +4,12 @@ import logging
 import arrow
 import pathlib
 import shutil
-import subprocess
-import glob
 import os
-import sys
 
-from wrf_runner import wps, wrf, utils
+from wrf_runner import wps, wrf, utils, workspace, checkpoint
 from wrf_runner.linkgrib import link_grib
-from wrf_runner.datasets.nam import NAM
+from wrf_runner.geogrid_cache import GeogridCache, run_geogrid_cached
+from wrf_runner.datasets.sources import NAMForecast
 
 log = logging.getLogger('job')
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s --- %(message)s')
@@ -22,7 +20,8 @@ WPS_PATH = WRF_INSTALL / 'WPS'
 
 
 @click.command()
-@click.argument("initialization_folder", type=click.Path(exists=True, dir_okay=True, file_okay=False))
+@click.argument("initialization_folder",
+                type=click.Path(exists=True, dir_okay=True, file_okay=False))
 @click.option('--run-wps/--no-run-wps', default=True)
 @click.option('--geogrid/--no-geogrid', default=True)
 @click.option('--ungrib/--no-ungrib', default=True)
@@ -30,10 +29,13 @@ WPS_PATH = WRF_INSTALL / 'WPS'
 @click.option('--copy-wrf/--no-copy-wrf', default=True)
 @click.option('--real/--no-real', default=True)
 @click.option('--run-wrf/--no-run-wrf', default=True)
+@click.option('--resume/--no-resume', default=False,
+              help='Skip stages recorded as complete in run_state.json')
+@click.option('--geogrid-cache', type=click.Path(file_okay=False), default=None)
 @click.option('--simulation-time', default=24)
 @click.option('--initialization-time', required=True)
-def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, real, run_wrf, simulation_time,
-         initialization_time):
+def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, real, run_wrf, resume,
+         geogrid_cache, simulation_time, initialization_time):
     log.info('Starting. Initialization folder "%s"', initialization_folder)
 
     initialization_folder = pathlib.Path(initialization_folder)
@@ -42,17 +44,18 @@ def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, rea
 
     log.info('Initialization time of the forecast: %s', initialization_time)
 
-    # Copy the WPS and WRF software into the working directory
-    if copy_wrf:
-        shutil.rmtree('WPS', ignore_errors=True)
+    manifest = checkpoint.Manifest('run_state.json') if resume else None
+
+    # Copy the WPS and WRF software into the working directory, a resumed run keeps the old
+    # directories
+    if copy_wrf and not (resume and os.path.isdir('WPS') and os.path.isdir('WRF')):
         log.info('Getting WPS from "%s"', WPS_PATH)
-        shutil.copytree(str(WPS_PATH), 'WPS')
-        log.info('WPS Copied')
+        workspace.provision(WPS_PATH, 'WPS')
+        log.info('WPS provisioned')
 
-        shutil.rmtree('./WRF', ignore_errors=True)
         log.info('Getting WRF from "%s"', WRF_PATH)
-        shutil.copytree(str(WRF_PATH), 'WRF')
-        log.info('WRF Copied')
+        workspace.provision(WRF_PATH, 'WRF')
+        log.info('WRF provisioned')
 
     geogrid = run_wps and geogrid
     ungrib = run_wps and ungrib
@@ -66,22 +69,28 @@ def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, rea
 
     # GEOGRID
     if geogrid:
-        wps.run_geogrid()
+        if geogrid_cache:
+            checkpoint.run_stage(manifest, 'geogrid', run_geogrid_cached,
+                                 GeogridCache(geogrid_cache))
+        else:
+            checkpoint.run_stage(manifest, 'geogrid', wps.run_geogrid)
 
     # UNGRIB
     if ungrib:
         log.info('Linking in the meteo data')
 
-        def filter_function(fn):
-            file_time = NAM.filename_to_datetime(fn)
-            return not (file_time < initialization_time or file_time > initialization_time.shift(hours=simulation_time))
-
-        link_grib(initialization_folder.glob('*.grb2'), filter_function)
-        wps.run_ungrib()
+        forecast = NAMForecast(initialization_folder, cycle=initialization_time)
+        grib_files = forecast.select_paths(initialization_time,
+                                           initialization_time.shift(hours=simulation_time),
+                                           strict=False)
+        link_grib(grib_files)
+        # Depend on the selected files, not on the links left by a previous run
+        checkpoint.run_stage(manifest, 'ungrib', wps.run_ungrib,
+                             inputs=['WPS/namelist.wps', 'WPS/Vtable'] + grib_files)
 
     # METGRID
     if metgrid:
-        wps.run_metgrid()
+        checkpoint.run_stage(manifest, 'metgrid', wps.run_metgrid)
 
     if real or run_wrf:
         wrf_patch = wrf.create_namelist_patch(initialization_time, length_hours=simulation_time)
@@ -90,10 +99,10 @@ def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, rea
 
     if real:
         wrf.link_metgrid_outputs('WPS/', 'WRF/')
-        wrf.run_real()
+        checkpoint.run_stage(manifest, 'real', wrf.run_real)
 
     if run_wrf:
-        wrf.run_wrf(12)
+        checkpoint.run_stage(manifest, 'wrf', wrf.run_wrf, 12)
 
     log.info('Done')
 
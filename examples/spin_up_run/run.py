@@ -1,17 +1,18 @@
 #!./venv/bin/python
 import click
 import logging
-import arrow
 import pathlib
 import shutil
-import subprocess
-import glob
 import os
-import sys
 
-from wrf_runner import wps, wrf, utils
+from wrf_runner import (wps, wrf, utils, workspace, checkpoint, staging, metrics, decomposition,
+                        launcher)
 from wrf_runner.linkgrib import link_grib
-from wrf_runner.datasets.nam import NAM_forecast, NAM
+from wrf_runner.geogrid_cache import GeogridCache, run_geogrid_cached
+from wrf_runner.ungrib_cache import UngribCache, run_ungrib_cached
+from wrf_runner.datasets.nam import NAM_forecast
+from wrf_runner.datasets.sources import NAMAnalysis, NAMForecast, group_by_time
+from wrf_runner.datasets.grib import check_files
 
 log = logging.getLogger('job')
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s --- %(message)s')
@@ -20,9 +21,82 @@ WRF_INSTALL = pathlib.Path('/home/tbarton/wrf/3.9.1.1')
 WRF_PATH = WRF_INSTALL / 'WRFV3'
 WPS_PATH = WRF_INSTALL / 'WPS'
 
+# The ungrib stage depends on the selected GRIB files, not on the links left by a previous run
+UNGRIB_INPUTS = ['WPS/namelist.wps', 'WPS/Vtable']
+
+
+def provision_installations(resume):
+    # Copy the WPS and WRF software into the working directory, a resumed run keeps the old
+    # directories
+    if resume and os.path.isdir('WPS') and os.path.isdir('WRF'):
+        return
+
+    log.info('Getting WPS from "%s"', WPS_PATH)
+    workspace.provision(WPS_PATH, 'WPS')
+    log.info('WPS provisioned')
+
+    log.info('Getting WRF from "%s"', WRF_PATH)
+    workspace.provision(WRF_PATH, 'WRF')
+    log.info('WRF provisioned')
+
+
+def geogrid_stage(manifest, geogrid_cache):
+    if geogrid_cache:
+        checkpoint.run_stage(manifest, 'geogrid', run_geogrid_cached, GeogridCache(geogrid_cache))
+    else:
+        checkpoint.run_stage(manifest, 'geogrid', wps.run_geogrid)
+
+
+def select_grib_files(initialization_folder, initialization_time, spinup_start, simulation_time):
+    # The spin-up comes from the NAM analyses, the rest from the forecast
+    analysis = NAMAnalysis('/fileserver1/datasets/NAM/analysis', directory_template='%Y')
+    forecast = NAMForecast(initialization_folder, cycle=initialization_time)
+
+    files = list(analysis.select(spinup_start, initialization_time.shift(hours=-1), interval=1,
+                                 strict=False))
+    files += forecast.select(initialization_time, spinup_start.shift(hours=simulation_time),
+                             strict=False)
+    return files
+
+
+def ungrib_stage(manifest, files, ungrib_cache, stage_dir, stage_workers, validate_grib):
+    log.info('Linking in the meteo data')
+    grib_files = [file.path for file in files]
+    inputs = UNGRIB_INPUTS + grib_files
+
+    if validate_grib:
+        check_files(grib_files)
+
+    if ungrib_cache:
+        checkpoint.run_stage(manifest, 'ungrib', run_ungrib_cached, UngribCache(ungrib_cache),
+                             group_by_time(files), inputs=inputs)
+        return
+
+    if stage_dir:
+        staging.stage_and_link(grib_files, stage_dir, workers=stage_workers)
+    else:
+        link_grib(grib_files)
+
+    checkpoint.run_stage(manifest, 'ungrib', wps.run_ungrib, inputs=inputs)
+
+
+def wrf_stage(manifest, domains, cores, decompose, restart_interval, max_resubmissions):
+    if decompose:
+        layout = decomposition.plan(domains, cores)
+        decomposition.write_layout('WRF/namelist.input', layout)
+        log.info('wrf.exe decomposition: %i x %i tasks', layout.nproc_x, layout.nproc_y)
+        cores = layout.tasks
+
+    if restart_interval:
+        checkpoint.run_stage(manifest, 'wrf', wrf.run_wrf_with_restarts, cores,
+                             max_resubmissions=max_resubmissions)
+    else:
+        checkpoint.run_stage(manifest, 'wrf', wrf.run_wrf, cores)
+
 
 @click.command()
-@click.argument("initialization_folder", type=click.Path(exists=True, dir_okay=True, file_okay=False))
+@click.argument("initialization_folder",
+                type=click.Path(exists=True, dir_okay=True, file_okay=False))
 @click.option('--run-wps/--no-run-wps', default=True)
 @click.option('--geogrid/--no-geogrid', default=True)
 @click.option('--ungrib/--no-ungrib', default=True)
@@ -30,30 +104,57 @@ WPS_PATH = WRF_INSTALL / 'WPS'
 @click.option('--copy-wrf/--no-copy-wrf', default=True)
 @click.option('--real/--no-real', default=True)
 @click.option('--run-wrf/--no-run-wrf', default=True)
+@click.option('--resume/--no-resume', default=False,
+              help='Skip stages recorded as complete in run_state.json')
+@click.option('--geogrid-cache', type=click.Path(file_okay=False), default=None)
+@click.option('--ungrib-cache', type=click.Path(file_okay=False), default=None)
+@click.option('--stage-dir', type=click.Path(file_okay=False), default=None,
+              help='Copy the GRIB files to this local directory before linking them')
+@click.option('--stage-workers', default=4)
+@click.option('--validate-grib/--no-validate-grib', default=True,
+              help='Check the structure of the GRIB files before ungrib')
 @click.option('--simulation-time', default=54)
-def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, real, run_wrf, simulation_time):
+@click.option('--restart-interval', type=int, default=None,
+              help='Minutes between WRF restart files, a failed wrf.exe is resubmitted from the '
+                   'latest one')
+@click.option('--max-resubmissions', default=3)
+@click.option('--report', type=click.Path(dir_okay=False), default='run_report.jsonl',
+              help='JSON lines file with the metrics of the stages')
+@click.option('--prometheus', type=click.Path(dir_okay=False), default=None,
+              help='Prometheus text format file with the metrics of the stages')
+@click.option('--cores', default=12, help='Cores for wrf.exe')
+@click.option('--real-cores', default=1, help='Cores for real.exe')
+@click.option('--decompose/--no-decompose', default=False,
+              help='Choose the MPI tasks and nproc_x/nproc_y from the domain sizes')
+@click.option('--launcher', 'launcher_name',
+              type=click.Choice(['mpirun', 'srun', 'local', 'dry-run']), default='mpirun')
+@click.option('--binding', type=click.Choice(['none', 'core', 'socket']), default=None,
+              help='Bind the MPI tasks to the CPUs')
+@click.option('--buffered-io/--no-buffered-io', default=False, help='Buffered Fortran I/O')
+def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, real, run_wrf, resume,
+         geogrid_cache, ungrib_cache, stage_dir, stage_workers, validate_grib, simulation_time,
+         restart_interval, max_resubmissions, report, prometheus, cores, real_cores, decompose,
+         launcher_name, binding, buffered_io):
     log.info('Starting. Initialization folder "%s"', initialization_folder)
 
     initialization_folder = pathlib.Path(initialization_folder)
-    nam_forecast = NAM_forecast(initialization_folder)   
+    nam_forecast = NAM_forecast(initialization_folder)
 
     initialization_time = nam_forecast.dataset_start
 
     log.info('Initialization time of the forecast: %s', initialization_time)
-    
+
     spinup_start = initialization_time.shift(hours=-6)
 
-    # Copy the WPS and WRF software into the working directory
-    if copy_wrf:
-        shutil.rmtree('WPS', ignore_errors=True)
-        log.info('Getting WPS from "%s"', WPS_PATH)
-        shutil.copytree(str(WPS_PATH), 'WPS')
-        log.info('WPS Copied')
+    manifest = checkpoint.Manifest('run_state.json') if resume else None
+    metrics.configure(report, prometheus)
+
+    options = {'record_path': 'commands.jsonl'} if launcher_name == 'dry-run' else {}
+    launcher.configure(launcher.from_name(launcher_name, binding=binding, buffered_io=buffered_io,
+                                          **options))
 
-        shutil.rmtree('./WRF', ignore_errors=True)
-        log.info('Getting WRF from "%s"', WRF_PATH)
-        shutil.copytree(str(WRF_PATH), 'WRF')
-        log.info('WRF Copied')
+    if copy_wrf:
+        provision_installations(resume)
 
     geogrid = run_wps and geogrid
     ungrib = run_wps and ungrib
@@ -65,38 +166,34 @@ def main(initialization_folder, run_wps, geogrid, ungrib, metgrid, copy_wrf, rea
         utils.apply_namelist_patch('template/namelist.wps', 'WPS/namelist.wps', wps_patch)
         shutil.copy('template/Vtable', 'WPS/')
 
-    # GEOGRID
     if geogrid:
-        wps.run_geogrid()
+        geogrid_stage(manifest, geogrid_cache)
 
-    # UNGRIB
     if ungrib:
-        log.info('Linking in the meteo data')
-
-        # Get the spinup data file from NAM analysis
-        nam = NAM('/fileserver1/datasets/NAM/analysis/2016/')
-        spinup_files =  nam.dates[spinup_start]
-        link_grib(spinup_files)
-
-        link_grib(initialization_folder.glob('*.grb2'), delete_links=False)
-        
-        wps.run_ungrib()
+        files = select_grib_files(initialization_folder, initialization_time, spinup_start,
+                                  simulation_time)
+        ungrib_stage(manifest, files, ungrib_cache, stage_dir, stage_workers, validate_grib)
 
-    # METGRID
     if metgrid:
-        wps.run_metgrid()
+        checkpoint.run_stage(manifest, 'metgrid', wps.run_metgrid)
 
     if real or run_wrf:
-        wrf_patch = wrf.create_namelist_patch(spinup_start, length_hours=simulation_time)
+        wrf_patch = wrf.create_namelist_patch(spinup_start, length_hours=simulation_time,
+                                              restart_interval=restart_interval)
+        domains = decomposition.domains_from_namelist(wrf_patch['domains'])
+        if decompose and real:
+            real_layout = decomposition.plan(domains, real_cores)
+            decomposition.apply_layout(wrf_patch, real_layout)
+            real_cores = real_layout.tasks
         utils.apply_namelist_patch('template/namelist.input', 'WRF/namelist.input', wrf_patch)
         shutil.copy('template/tslist', 'WRF/')
 
     if real:
         wrf.link_metgrid_outputs('WPS/', 'WRF/')
-        wrf.run_real()
+        checkpoint.run_stage(manifest, 'real', wrf.run_real, real_cores)
 
     if run_wrf:
-        wrf.run_wrf(12)
+        wrf_stage(manifest, domains, cores, decompose, restart_interval, max_resubmissions)
 
     log.info('Done')
 
@@ -17,6 +17,11 @@ requirements = [
     'arrow',
 ]
 
+extra_requirements = {
+    'numpy': ['numpy'],
+    'postprocess': ['numpy', 'netCDF4'],
+}
+
 setup_requirements = [
     'pytest-runner',
     # TODO(tommz9): put setup requirements (distutils extensions, etc.) here
@@ -40,6 +45,7 @@ setup(
     package_dir={'': 'src'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="MIT license",
     zip_safe=False,
     keywords='wrf_runner',
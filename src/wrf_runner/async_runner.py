@@ -0,0 +1,190 @@
+import asyncio
+import collections
+import datetime
+import logging
+import os
+import re
+import time
+
+from . import logs
+from .exceptions import WrfRunnerException
+
+log = logging.getLogger('async_runner')
+
+ProgressEvent = collections.namedtuple('ProgressEvent', [
+    'program',  # name of the program that produced the event
+    'model_time',  # datetime, the current time of the simulation
+    'domain',  # domain number
+    'step_seconds',  # wall clock seconds spent on the last time step
+    'elapsed',  # wall clock seconds since the program was started until the line was read
+    'wall_seconds_per_simulated_hour',  # None until at least two time steps were seen
+])
+
+# Example: "Timing for main: time 2016-01-01_00:03:00 on domain   1:    0.51234 elapsed seconds"
+TIMING_PATTERN = re.compile(
+    r'Timing for main: time (\S+) on domain\s+(\d+):\s+([\d.]+) elapsed seconds')
+MODEL_TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+
+# Patterns that mean the run is lost and can be stopped immediately. WRF reports fatal errors as
+# "-------------- FATAL CALLED ---------------" or "FATAL CALLED FROM FILE: ..." and the checks of
+# the namelist as "---- ERROR: ...", other lines that merely contain "ERROR:" are not fatal.
+FATAL_PATTERNS = [
+    re.compile(r'points exceeded cfl', re.IGNORECASE),
+    re.compile(r'^\s*-*\s*FATAL CALLED'),
+    re.compile(r'^\s*-+\s*ERROR:'),
+]
+
+
+class LogTail:
+    """
+    Reads a growing log file incrementally and returns the complete lines written since the last
+    call.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.position = 0
+        self.remainder = b''
+
+    def read_lines(self) -> list:
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.position)
+                data = f.read()
+                self.position = f.tell()
+        except FileNotFoundError:
+            return []
+
+        data = self.remainder + data
+        complete, _, self.remainder = data.rpartition(b'\n')
+
+        if not complete:
+            return []
+
+        return [line.decode('utf-8', errors='replace') for line in complete.split(b'\n')]
+
+
+class ProgressTracker:
+    """
+    Turns timing lines of a log into ProgressEvents.
+
+    The log is read in batches, so the rate is computed from the elapsed seconds reported by WRF
+    in the timing lines of all domains, not from the time the lines were read. The time spent
+    writing the outputs is not included.
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.start = time.monotonic()
+        self.first_model_time = None
+        self.step_seconds = 0.0
+
+    def parse(self, line):
+        match = TIMING_PATTERN.search(line)
+        if not match:
+            return None
+
+        model_time = datetime.datetime.strptime(match.group(1), MODEL_TIME_FORMAT)
+        domain = int(match.group(2))
+        step_seconds = float(match.group(3))
+        elapsed = time.monotonic() - self.start
+
+        rate = None
+        if domain == 1 and self.first_model_time is None:
+            self.first_model_time = model_time
+        elif self.first_model_time is not None:
+            self.step_seconds += step_seconds
+            simulated_hours = (model_time - self.first_model_time).total_seconds() / 3600
+            if domain == 1 and simulated_hours > 0:
+                rate = self.step_seconds / simulated_hours
+
+        return ProgressEvent(self.program, model_time, domain, step_seconds, elapsed, rate)
+
+
+async def _notify(callback, event):
+    if callback is None:
+        return
+
+    result = callback(event)
+    if asyncio.iscoroutine(result):
+        await result
+
+
+async def _follow(process, wait, tail, tracker, program, progress, fatal_patterns,
+                  poll_interval) -> None:
+    """
+    Read the log until the program ends, raise WrfRunnerException on a fatal message.
+    """
+    while True:
+        done, _ = await asyncio.wait([wait], timeout=poll_interval)
+
+        for line in tail.read_lines():
+            for pattern in fatal_patterns:
+                if pattern.search(line):
+                    log.error('%s: fatal message in the log: %s', program, line.strip())
+                    # WRF usually exits right after the message
+                    if process.returncode is None:
+                        try:
+                            process.terminate()
+                        except ProcessLookupError:
+                            pass
+                    await wait
+                    raise WrfRunnerException('{} aborted: {}'.format(program, line.strip()))
+
+            event = tracker.parse(line)
+            if event:
+                await _notify(progress, event)
+
+        if done:
+            return
+
+
+async def run_program_async(args, cwd, logfile, program, progress=None, fatal_patterns=None,
+                            poll_interval=1.0, env=None) -> None:
+    """
+    Run a program without blocking the event loop, follow its log file and check for success.
+
+    :param args: command line of the program
+    :param cwd: working directory of the program
+    :param logfile: log file relative to cwd that is followed while the program runs
+    :param program: name of the program as used in logs.SUCCESS_MARKERS
+    :param progress: function or coroutine function called with every ProgressEvent
+    :param fatal_patterns: the program is terminated if a line in the log matches any of these
+                           patterns, defaults to FATAL_PATTERNS
+    :param poll_interval: seconds between reads of the log file
+    :param env: environment of the program, None to inherit it
+    """
+    if fatal_patterns is None:
+        fatal_patterns = FATAL_PATTERNS
+
+    logfile = os.path.join(str(cwd), logfile)
+
+    # Do not confuse an old log with the output of this run
+    if os.path.exists(logfile):
+        log.debug('Removing old log file "%s"', logfile)
+        os.remove(logfile)
+
+    log.info('Starting %s', program)
+    process = await asyncio.create_subprocess_exec(*args, cwd=str(cwd), env=env)
+
+    tail = LogTail(logfile)
+    tracker = ProgressTracker(program)
+    wait = asyncio.ensure_future(process.wait())
+
+    try:
+        await _follow(process, wait, tail, tracker, program, progress, fatal_patterns,
+                      poll_interval)
+    finally:
+        # Cancelled, a failing progress callback or a fatal message: do not leave the program
+        # running
+        if process.returncode is None:
+            log.warning('Killing %s', program)
+            process.kill()
+            await process.wait()
+
+    returncode = wait.result()
+    log.info('%s finished with return code %i', program, returncode)
+
+    if returncode or not logs.check_success(logfile, program):
+        log.error('%s error. Please see the log', program)
+        raise WrfRunnerException('Execution of {} failed'.format(program))
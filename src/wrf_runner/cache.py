@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import time
+
+log = logging.getLogger('cache')
+
+
+def file_hash(path, block_size=2 ** 20) -> str:
+    """
+    SHA-256 of the content of a file.
+    """
+    digest = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileCache:
+    """
+    Directory with files stored under keys. Every key is a subdirectory with one or more files.
+
+    Entries older than max_age seconds are evicted first, then the least recently used entries
+    are evicted while the cache is bigger than max_size bytes.
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None):
+        self.directory = str(directory)
+        self.max_size = max_size
+        self.max_age = max_age
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry_path(self, key) -> str:
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.isdir(self.entry_path(key))
+
+    def entries(self) -> list:
+        """
+        List of the cache entries as dictionaries with key, size, last_used and files.
+        """
+        result = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+
+            files = sorted(os.listdir(entry.path))
+            size = sum(os.path.getsize(os.path.join(entry.path, file)) for file in files)
+            result.append({
+                'key': entry.name,
+                'size': size,
+                'last_used': entry.stat().st_mtime,
+                'files': files
+            })
+
+        return result
+
+    def size(self) -> int:
+        return sum(entry['size'] for entry in self.entries())
+
+    def store(self, key, files) -> None:
+        """
+        Copy the files into the cache. The files are made read-only so they can be safely linked.
+        """
+        temporary = os.path.join(self.directory, '.tmp.' + key)
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+
+        for file in files:
+            destination = os.path.join(temporary, os.path.basename(str(file)))
+            shutil.copy2(str(file), destination)
+            os.chmod(destination, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        shutil.rmtree(self.entry_path(key), ignore_errors=True)
+        os.rename(temporary, self.entry_path(key))
+        log.debug('Stored %i files in the cache under %s', len(files), key)
+
+    def restore(self, key, destination, link=True) -> bool:
+        """
+        Link or copy the cached files into the destination directory.
+
+        :return: False if the key is not in the cache
+        """
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return False
+
+        for file in os.listdir(path):
+            target = os.path.join(str(destination), file)
+            if os.path.lexists(target):
+                os.remove(target)
+
+            if link:
+                os.symlink(os.path.abspath(os.path.join(path, file)), target)
+            else:
+                shutil.copy(os.path.join(path, file), target)
+                os.chmod(target, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        # The modification time of the entry is the time of the last use
+        os.utime(path)
+        return True
+
+    def prune(self, max_size=None, max_age=None) -> list:
+        """
+        Delete entries older than max_age seconds and then the least recently used entries until
+        the cache is smaller than max_size bytes. The limits default to the ones of the cache.
+
+        :return: list of the deleted keys
+        """
+        max_size = self.max_size if max_size is None else max_size
+        max_age = self.max_age if max_age is None else max_age
+
+        entries = sorted(self.entries(), key=lambda entry: entry['last_used'])
+        total = sum(entry['size'] for entry in entries)
+        now = time.time()
+
+        deleted = []
+        while entries:
+            entry = entries[0]
+            too_old = max_age is not None and now - entry['last_used'] > max_age
+            too_big = max_size is not None and total > max_size
+            if not (too_old or too_big):
+                break
+
+            entries.pop(0)
+            shutil.rmtree(self.entry_path(entry['key']))
+            total -= entry['size']
+            deleted.append(entry['key'])
+            log.info('Evicted %s from the cache', entry['key'])
+
+        return deleted
@@ -0,0 +1,137 @@
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+
+from .cache import file_hash
+
+log = logging.getLogger('checkpoint')
+
+# Inputs and outputs of the stages relative to the run directory, as glob patterns
+STAGE_FILES = {
+    'geogrid': (['WPS/namelist.wps', 'WPS/geogrid/GEOGRID.TBL'],
+                ['WPS/geo_em.d*']),
+    'ungrib': (['WPS/namelist.wps', 'WPS/Vtable', 'WPS/GRIBFILE.*'],
+               ['WPS/FILE:*']),
+    'metgrid': (['WPS/namelist.wps', 'WPS/metgrid/METGRID.TBL', 'WPS/geo_em.d*', 'WPS/FILE:*'],
+                ['WPS/met_em.*']),
+    'real': (['WRF/namelist.input', 'WRF/met_em.*'],
+             ['WRF/wrfinput_d*', 'WRF/wrfbdy_d01']),
+    'wrf': (['WRF/namelist.input', 'WRF/wrfinput_d*', 'WRF/wrfbdy_d01'],
+            ['WRF/wrfout_d*']),
+}
+
+# Smaller files are identified by their content, bigger ones by path, size and modification time
+HASH_SIZE_LIMIT = 16 * 2 ** 20
+
+
+def expand(patterns) -> list:
+    return sorted(set(path for pattern in patterns for path in glob.glob(pattern)))
+
+
+def file_signature(path) -> list:
+    """
+    Size and modification time of the file, links are followed.
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def inputs_hash(patterns) -> str:
+    digest = hashlib.sha256()
+
+    for path in expand(patterns):
+        stat = os.stat(path)
+        if stat.st_size <= HASH_SIZE_LIMIT:
+            identity = file_hash(path)
+        else:
+            identity = '{}:{}:{}'.format(os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        digest.update('{}={}\n'.format(path, identity).encode())
+
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Record of the finished stages of a run stored in a JSON file.
+
+    A stage is complete if it was recorded with the same hash of inputs and all its recorded
+    outputs still exist with the same size and modification time.
+    """
+
+    def __init__(self, path='run_state.json'):
+        self.path = str(path)
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.stages = json.load(f)
+        else:
+            self.stages = {}
+
+    def save(self) -> None:
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.stages, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def is_complete(self, stage, input_hash) -> bool:
+        entry = self.stages.get(stage)
+        if not entry or entry['inputs_hash'] != input_hash or not entry['outputs']:
+            return False
+
+        for path, signature in entry['outputs'].items():
+            if not os.path.exists(path) or file_signature(path) != signature:
+                log.info('Output "%s" of %s changed', path, stage)
+                return False
+
+        return True
+
+    def record(self, stage, input_hash, outputs, started, finished) -> None:
+        self.stages[stage] = {
+            'inputs_hash': input_hash,
+            'outputs': {path: file_signature(path) for path in outputs},
+            'started': started.isoformat(),
+            'finished': finished.isoformat()
+        }
+        self.save()
+
+    def invalidate(self, stage) -> None:
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+
+def run_stage(manifest, stage, function, *args, inputs=None, outputs=None, **kwargs) -> bool:
+    """
+    Run the stage unless the manifest says it is complete, then record it in the manifest.
+
+    :param manifest: Manifest or None to always run the stage
+    :param stage: name of the stage, the default inputs and outputs are taken from STAGE_FILES
+    :param function: function that executes the stage, called with args and kwargs
+    :param inputs: glob patterns of the input files
+    :param outputs: glob patterns of the output files
+    :return: True if the stage was executed
+    """
+    if manifest is None:
+        function(*args, **kwargs)
+        return True
+
+    default_inputs, default_outputs = STAGE_FILES.get(stage, ([], []))
+    inputs = default_inputs if inputs is None else inputs
+    outputs = default_outputs if outputs is None else outputs
+
+    input_hash = inputs_hash(inputs)
+    if manifest.is_complete(stage, input_hash):
+        log.info('Skipping %s, inputs and outputs are unchanged', stage)
+        return False
+
+    # A crash in the middle of the stage must not leave the old record valid
+    manifest.invalidate(stage)
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    function(*args, **kwargs)
+    finished = datetime.datetime.now(datetime.timezone.utc)
+
+    manifest.record(stage, input_hash, expand(outputs), started, finished)
+    return True
@@ -0,0 +1,142 @@
+import collections
+import datetime
+import fnmatch
+import logging
+import os
+import sqlite3
+
+from .filenames import parse_nam_filenames
+
+log = logging.getLogger('catalog')
+
+CatalogEntry = collections.namedtuple('CatalogEntry',
+                                      ['path', 'valid_time', 'cycle', 'forecast_hour'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT,
+    valid_time INTEGER,
+    cycle INTEGER,
+    forecast_hour INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_folder_valid_time ON files (folder, valid_time);
+"""
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def to_timestamp(time) -> int:
+    time = getattr(time, 'datetime', time)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=datetime.timezone.utc)
+    return int((time - EPOCH).total_seconds())
+
+
+def from_timestamp(timestamp) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+
+
+class Catalog:
+    """
+    Persistent index of the dataset folders stored in an SQLite database.
+
+    A folder is scanned again only when its modification time changes and then only the added
+    and removed files are written to the index.
+    """
+
+    def __init__(self, index_path, parser=parse_nam_filenames):
+        """
+        :param index_path: path to the SQLite database, created if it does not exist
+        :param parser: function that takes a list of file names and returns a list of
+                       (cycle, forecast hour) tuples or None for unknown names
+        """
+        self.index_path = str(index_path)
+        self.parser = parser
+
+        self.connection = sqlite3.connect(self.index_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def update(self, folder, pattern='nam_218_*.grb2') -> bool:
+        """
+        Bring the index of the folder up to date.
+
+        :return: True if the folder had to be scanned
+        """
+        folder = os.path.abspath(str(folder))
+        mtime_ns = os.stat(folder).st_mtime_ns
+
+        row = self.connection.execute('SELECT mtime_ns FROM folders WHERE path = ?',
+                                      (folder,)).fetchone()
+        if row and row[0] == mtime_ns:
+            return False
+
+        with os.scandir(folder) as entries:
+            present = {entry.path for entry in entries if fnmatch.fnmatch(entry.name, pattern)}
+
+        rows = self.connection.execute('SELECT path FROM files WHERE folder = ?', (folder,))
+        indexed = {path for path, in rows}
+
+        new_paths = sorted(present - indexed)
+
+        added = []
+        parsed_names = self.parser([os.path.basename(path) for path in new_paths])
+        for path, parsed in zip(new_paths, parsed_names):
+            if parsed is None:
+                log.warning('Can not parse the name of "%s"', path)
+                continue
+
+            cycle, forecast_hour = parsed
+            valid_time = cycle + datetime.timedelta(hours=forecast_hour)
+            added.append((path, folder, to_timestamp(valid_time), to_timestamp(cycle),
+                          forecast_hour))
+
+        removed = [(path,) for path in indexed - present]
+
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                        added)
+            self.connection.executemany('DELETE FROM files WHERE path = ?', removed)
+            self.connection.execute('INSERT OR REPLACE INTO folders VALUES (?, ?)',
+                                    (folder, mtime_ns))
+
+        log.info('Index of "%s" updated: %i added, %i removed', folder, len(added), len(removed))
+        return True
+
+    def query(self, folder=None, start=None, end=None) -> list:
+        """
+        Files with the valid time in the window [start, end] ordered by the valid time.
+
+        :param folder: restrict the query to one folder
+        :param start: datetime or arrow, no lower limit if None
+        :param end: datetime or arrow, no upper limit if None
+        :return: list of CatalogEntry
+        """
+        conditions = []
+        parameters = []
+
+        if folder is not None:
+            conditions.append('folder = ?')
+            parameters.append(os.path.abspath(str(folder)))
+        if start is not None:
+            conditions.append('valid_time >= ?')
+            parameters.append(to_timestamp(start))
+        if end is not None:
+            conditions.append('valid_time <= ?')
+            parameters.append(to_timestamp(end))
+
+        sql = 'SELECT path, valid_time, cycle, forecast_hour FROM files'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY valid_time, path'
+
+        rows = self.connection.execute(sql, parameters)
+        return [CatalogEntry(path, from_timestamp(valid_time), from_timestamp(cycle), hour)
+                for path, valid_time, cycle, hour in rows]
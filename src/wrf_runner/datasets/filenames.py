@@ -0,0 +1,96 @@
+import datetime
+import re
+
+# The format of the filename: "nam_218_20160117_0600_005.grb2"
+# last three digits are the forecast hour
+NAM_PATTERN = re.compile(r'nam_218_(\d{4})(\d\d)(\d\d)_(\d\d)(\d\d)_(\d{3})\.grb2$')
+
+
+def parse_nam_filename(filename):
+    """
+    Get the cycle and forecast hour from the name of a NAM file.
+
+    :return: tuple (cycle as UTC datetime, forecast hour) or None if the name does not match
+    """
+    return parse_nam_filenames([filename])[0]
+
+
+def parse_nam_filenames(filenames) -> list:
+    """
+    Parse the names of many NAM files at once.
+
+    Files from the same cycle share one datetime object, so the cost per file is mostly
+    one regular expression match.
+
+    :param filenames: iterable of file names or paths
+    :return: list of tuples (cycle as UTC datetime, forecast hour), None for names that do not
+        match
+    """
+    search = NAM_PATTERN.search
+    cycles = {}
+    result = []
+
+    for filename in filenames:
+        match = search(str(filename))
+        if match is None:
+            result.append(None)
+            continue
+
+        year, month, day, hour, minute, forecast_hour = match.groups()
+        key = year + month + day + hour + minute
+
+        cycle = cycles.get(key)
+        if cycle is None:
+            cycle = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                      tzinfo=datetime.timezone.utc)
+            cycles[key] = cycle
+
+        result.append((cycle, int(forecast_hour)))
+
+    return result
+
+
+def nam_valid_times(filenames) -> list:
+    """
+    Valid times (cycle + forecast hour) of NAM files as UTC datetimes, None for names that do not
+    match.
+    """
+    hours = {}
+    result = []
+
+    for parsed in parse_nam_filenames(filenames):
+        if parsed is None:
+            result.append(None)
+            continue
+
+        cycle, forecast_hour = parsed
+        shift = hours.get(forecast_hour)
+        if shift is None:
+            shift = hours[forecast_hour] = datetime.timedelta(hours=forecast_hour)
+
+        result.append(cycle + shift)
+
+    return result
+
+
+def parse_nam_filenames_datetime64(filenames):
+    """
+    Parse the names of NAM files into NumPy arrays. Requires numpy.
+
+    :return: tuple (cycles as datetime64[m] array, forecast hours as int array, valid times as
+        datetime64[m] array)
+    :raises ValueError: if any of the names does not match
+    """
+    import numpy as np
+
+    names = [str(filename) for filename in filenames]
+    matches = [NAM_PATTERN.search(name) for name in names]
+
+    if not all(matches):
+        raise ValueError('Not a NAM file: {}'.format(names[matches.index(None)]))
+
+    cycles = np.array(['{}-{}-{}T{}:{}'.format(*match.groups()[:5]) for match in matches],
+                      dtype='datetime64[m]')
+    forecast_hours = np.array([int(match.group(6)) for match in matches], dtype=np.int64)
+
+    return cycles, forecast_hours, cycles + forecast_hours.astype('timedelta64[h]')
@@ -0,0 +1,241 @@
+import collections
+import concurrent.futures
+import logging
+import mmap
+import os
+
+from ..exceptions import WrfRunnerException
+
+log = logging.getLogger('grib')
+
+# Field identification from the product definition section of GRIB2
+GribField = collections.namedtuple('GribField',
+                                   ['discipline', 'category', 'number', 'level_type', 'level'])
+
+GribReport = collections.namedtuple('GribReport', ['path', 'messages', 'fields', 'errors'])
+
+INDICATOR_LENGTH = 16
+END_MARKER = b'7777'
+# Indicator of GRIB1 and the end marker
+MIN_MESSAGE_LENGTH = 8 + 4
+MISSING_SCALE = 0xFF
+MISSING_VALUE = 0xFFFFFFFF
+
+# Product definition templates with the horizontal level at octets 23-28 (4.0 - 4.15)
+LEVEL_TEMPLATES = set(range(16))
+
+
+def _uint(data, offset, size) -> int:
+    return int.from_bytes(data[offset:offset + size], 'big')
+
+
+def _product_field(data, offset, discipline):
+    """
+    Read the field identification from a product definition section (section 4) at offset.
+    """
+    template = _uint(data, offset + 7, 2)
+    category = data[offset + 9]
+    number = data[offset + 10]
+
+    if template not in LEVEL_TEMPLATES:
+        return GribField(discipline, category, number, None, None)
+
+    level_type = data[offset + 22]
+    scale = data[offset + 23]
+    value = _uint(data, offset + 24, 4)
+
+    if scale == MISSING_SCALE or value == MISSING_VALUE:
+        level = None
+    else:
+        # The scale factor is a signed byte stored as sign and magnitude
+        if scale & 0x80:
+            scale = -(scale & 0x7F)
+        level = value / 10 ** scale if scale else value
+
+    return GribField(discipline, category, number, level_type, level)
+
+
+def _scan_message(data, offset, end, fields) -> None:
+    """
+    Walk the sections of a GRIB2 message and collect the fields of its product definitions.
+    """
+    discipline = data[offset + 6]
+    position = offset + INDICATOR_LENGTH
+    message_end = end - len(END_MARKER)
+
+    while position < message_end:
+        if position + 5 > message_end:
+            raise WrfRunnerException('section header at {} is cut'.format(position))
+
+        length = _uint(data, position, 4)
+        number = data[position + 4]
+        if length < 5 or position + length > message_end:
+            raise WrfRunnerException('section {} at {} has an invalid length {}'.format(
+                number, position, length))
+
+        if number == 4:
+            fields.append(_product_field(data, position, discipline))
+
+        position += length
+
+
+def _grib1_length(data, offset) -> int:
+    # GRIB1 stores the total length in 3 octets after 'GRIB'
+    return _uint(data, offset + 4, 3)
+
+
+def _grib2_length(data, offset) -> int:
+    # GRIB2 stores the total length in the last 8 octets of the 16 octet indicator
+    return _uint(data, offset + 8, 8)
+
+
+def _message_end(data, offset, size, number) -> tuple:
+    """
+    Check the indicator, the length and the end marker of the message at offset.
+
+    :param number: number of the message in the file, for the error messages
+    :return: tuple (edition, offset of the end of the message)
+    """
+    if data[offset:offset + 4] != b'GRIB':
+        raise WrfRunnerException('no GRIB indicator at offset {}'.format(offset))
+
+    edition = data[offset + 7] if offset + 8 <= size else None
+    if edition == 2 and offset + INDICATOR_LENGTH <= size:
+        length = _grib2_length(data, offset)
+    elif edition == 1:
+        length = _grib1_length(data, offset)
+    else:
+        raise WrfRunnerException('truncated indicator at offset {}'.format(offset))
+
+    end = offset + length
+    if length < MIN_MESSAGE_LENGTH:
+        raise WrfRunnerException('message {} at offset {} has an invalid length {}'.format(
+            number, offset, length))
+
+    if end > size:
+        raise WrfRunnerException('message {} at offset {} is truncated, {} of {} bytes'.format(
+            number, offset, size - offset, length))
+
+    if data[end - 4:end] != END_MARKER:
+        raise WrfRunnerException('message {} at offset {} has no end marker'.format(
+            number, offset))
+
+    return edition, end
+
+
+def _scan_messages(data, size, read_fields, fields, errors) -> int:
+    """
+    Walk the messages of a memory mapped file until the end or the first error.
+
+    :return: number of valid messages
+    """
+    offset = 0
+    messages = 0
+    while offset < size:
+        try:
+            edition, end = _message_end(data, offset, size, messages + 1)
+        except WrfRunnerException as error:
+            errors.append(str(error))
+            break
+
+        if edition == 2 and read_fields:
+            try:
+                _scan_message(data, offset, end, fields)
+            except WrfRunnerException as error:
+                errors.append('message {}: {}'.format(messages + 1, error))
+                break
+
+        messages += 1
+        offset = end
+    return messages
+
+
+def scan_grib(path, read_fields=True) -> GribReport:
+    """
+    Check the structure of a GRIB file without decoding the data.
+
+    Only the headers are read from the memory mapped file: the 16 byte indicator with the length
+    of every message, the end marker 7777 and, for GRIB2, the section lengths and the field
+    identification in the product definition sections.
+
+    :param path: path to the GRIB file
+    :param read_fields: walk the sections of GRIB2 messages and collect the fields
+    :return: GribReport with the number of messages, the fields and a list of errors
+    """
+    path = str(path)
+    fields = []
+    messages = 0
+    errors = []
+
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return GribReport(path, 0, [], ['empty file'])
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                messages = _scan_messages(data, size, read_fields, fields, errors)
+    except OSError as error:
+        errors.append(str(error))
+
+    return GribReport(path, messages, fields, errors)
+
+
+def missing_fields(report, expected) -> list:
+    """
+    Expected fields not found in the report.
+
+    :param expected: iterable of tuples that are compared with the beginning of GribField,
+        e.g. (0, 0, 0, 103, 2) is the temperature 2 m above ground, (0, 2, 2) is any U wind
+    """
+    found = set()
+    for field in report.fields:
+        for length in range(1, len(field) + 1):
+            found.add(tuple(field[:length]))
+
+    return [tuple(item) for item in expected if tuple(item) not in found]
+
+
+def validate_files(files, expected=None, min_messages=1, workers=8) -> list:
+    """
+    Scan many GRIB files in parallel.
+
+    :param files: paths of the GRIB files
+    :param expected: fields that every file must contain, see missing_fields
+    :param min_messages: a file with fewer messages is reported as incomplete
+    :param workers: number of files scanned at the same time
+    :return: list of GribReports of the files with problems
+    """
+    def check(path):
+        report = scan_grib(path, read_fields=bool(expected))
+        errors = list(report.errors)
+
+        if not errors and report.messages < min_messages:
+            errors.append('{} messages, at least {} expected'.format(
+                report.messages, min_messages))
+
+        if expected and not report.errors:
+            errors.extend('field {} is missing'.format(field)
+                          for field in missing_fields(report, expected))
+
+        return report._replace(errors=errors)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        reports = list(pool.map(check, [str(file) for file in files]))
+
+    problems = [report for report in reports if report.errors]
+    for report in problems:
+        log.error('"%s": %s', report.path, '; '.join(report.errors))
+
+    log.info('%i GRIB files checked, %i with problems', len(reports), len(problems))
+    return problems
+
+
+def check_files(files, expected=None, min_messages=1, workers=8) -> None:
+    """
+    Like validate_files, but raise WrfRunnerException if any file has a problem.
+    """
+    problems = validate_files(files, expected, min_messages, workers)
+    if problems:
+        raise WrfRunnerException('{} GRIB files are damaged or incomplete: {}'.format(
+            len(problems), ', '.join(os.path.basename(report.path) for report in problems)))
@@ -3,17 +3,41 @@ import os
 
 import click
 import arrow
-import re
 
 from ..exceptions import WrfRunnerException
+from .catalog import Catalog
+from .filenames import parse_nam_filename, parse_nam_filenames, nam_valid_times
+from .grib import validate_files
+
+
+def to_arrow(times) -> list:
+    """
+    Convert a list of datetimes to arrow objects. Every distinct time is converted only once,
+    None is kept.
+    """
+    converted = {None: None}
+    result = []
+    for time in times:
+        if time not in converted:
+            converted[time] = arrow.get(time)
+        result.append(converted[time])
+    return result
+
+
+def parse_or_raise(filename):
+    parsed = parse_nam_filename(os.path.basename(str(filename)))
+    if parsed is None:
+        raise WrfRunnerException('Not a NAM file: {}'.format(filename))
+    return parsed
 
 
 class NAM:
     time_step = 6
     dx = 12
 
-    def __init__(self, folder):
+    def __init__(self, folder, catalog=None):
         self.folder = folder
+        self.catalog = catalog
 
         self.data_files = None
         self.dates = None
@@ -26,14 +50,25 @@ class NAM:
     @staticmethod
     def filename_to_datetime(filename):
         # The format of the filename: "nam_218_20160101_1200_000.grb2"
-        return arrow.get(str(filename), 'YYYYMMDD_HHmm')
+        cycle, _ = parse_or_raise(filename)
+        return arrow.get(cycle)
 
     def scan_folder(self):
-        self.data_files = glob.glob(self.folder + '/nam_218_*.grb2')
+        if self.catalog:
+            self.catalog.update(self.folder)
+            entries = self.catalog.query(self.folder)
+            self.data_files = [entry.path for entry in entries]
+            files_with_dates = [(arrow.get(entry.cycle), entry.path) for entry in entries]
+        else:
+            self.data_files = glob.glob(self.folder + '/nam_218_*.grb2')
+            cycles = [parsed[0] if parsed else None
+                      for parsed in parse_nam_filenames(self.data_files)]
+            files_with_dates = zip(to_arrow(cycles), self.data_files)
 
         self.dates = {}
-        for file in self.data_files:
-            datetime = NAM.filename_to_datetime(file)
+        for datetime, file in files_with_dates:
+            if datetime is None:
+                continue
             try:
                 self.dates[datetime].append(file)
             except KeyError:
@@ -56,8 +91,9 @@ class NAM_forecast:
     time_step = 1
     dx = 12
 
-    def __init__(self, folder):
+    def __init__(self, folder, catalog=None):
         self.folder = str(folder)
+        self.catalog = catalog
 
         self.data_files = None
         self.dates = None
@@ -67,9 +103,16 @@ class NAM_forecast:
         self.scan_folder()
 
     def scan_folder(self):
-        self.data_files = glob.glob(self.folder + '/nam_218_*.grb2')
-
-        self.dates = {NAM_forecast.filename_to_datetime(file): file for file in self.data_files}
+        if self.catalog:
+            self.catalog.update(self.folder)
+            entries = self.catalog.query(self.folder)
+            self.data_files = [entry.path for entry in entries]
+            self.dates = {arrow.get(entry.valid_time): entry.path for entry in entries}
+        else:
+            self.data_files = glob.glob(self.folder + '/nam_218_*.grb2')
+            valid_times = to_arrow(nam_valid_times(self.data_files))
+            self.dates = {time: file for time, file in zip(valid_times, self.data_files)
+                          if time is not None}
 
         self.dataset_start = min(self.dates.keys())
         self.dataset_end = max(self.dates.keys())
@@ -78,25 +121,25 @@ class NAM_forecast:
     def filename_to_datetime(filename):
         # The format of the filename: "nam_218_20160117_0600_005.grb2"
         # last three digits are the time shift
-
-        filename = os.path.basename(filename)
-        datetime = arrow.get(str(filename), 'YYYYMMDD_HHmm')
-
-        parser = r'nam_218_.*_.*_(\d\d\d)\.grb2'
-        result = re.match(parser, filename)
-        hours = int(result.group(1))
-
-        return datetime.shift(hours=hours)
+        cycle, hours = parse_or_raise(filename)
+        return arrow.get(cycle).shift(hours=hours)
 
 
 @click.command()
 @click.argument('path_to_dataset')
 @click.option('--forecast/--no-forecast', default=False)
-def main(path_to_dataset, forecast):
+@click.option('--index', type=click.Path(dir_okay=False), default=None,
+              help='Path to the catalog index')
+@click.option('--validate/--no-validate', default=False,
+              help='Check the structure of the GRIB files')
+@click.option('--workers', default=8, help='Number of files validated at the same time')
+def main(path_to_dataset, forecast, index, validate, workers):
+    catalog = Catalog(index) if index else None
+
     if forecast:
-        nam = NAM_forecast(path_to_dataset)
+        nam = NAM_forecast(path_to_dataset, catalog)
     else:
-        nam = NAM(path_to_dataset)
+        nam = NAM(path_to_dataset, catalog)
 
     print('Dataset opened')
 
@@ -105,6 +148,12 @@ def main(path_to_dataset, forecast):
     print('Dataset start:    {}'.format(nam.dataset_start))
     print('Dataset end:      {}'.format(nam.dataset_end))
 
+    if validate:
+        problems = validate_files(nam.data_files, workers=workers)
+        print('Damaged files:    {}'.format(len(problems)))
+        for report in problems:
+            print('  {}: {}'.format(report.path, '; '.join(report.errors)))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,230 @@
+import collections
+import datetime
+import logging
+import os
+
+from ..exceptions import WrfRunnerException
+
+log = logging.getLogger('sources')
+
+DatasetFile = collections.namedtuple('DatasetFile',
+                                     ['path', 'valid_time', 'cycle', 'lead_hours'])
+
+
+def to_datetime(time) -> datetime.datetime:
+    """
+    Convert arrow or datetime to a UTC datetime, naive datetimes are taken as UTC.
+    """
+    time = getattr(time, 'datetime', time)
+    if time.tzinfo is None:
+        return time.replace(tzinfo=datetime.timezone.utc)
+    return time.astimezone(datetime.timezone.utc)
+
+
+class Dataset:
+    """
+    Archive of GRIB files whose paths follow from the cycle and the lead time.
+
+    The files are found by building their paths and checking that they exist, so only the
+    directories of the cycles within the requested window are touched and nothing is listed.
+
+    Subclasses set the naming of the files and the timing of the cycles:
+
+    - cycle_interval: hours between two cycles, cycles start at 00 UTC
+    - lead_step: hours between two lead times of one cycle, subclasses with an irregular schedule
+      override leads
+    - max_lead: the longest lead time in the archive, 0 for analyses and reanalyses
+    - default_interval: hours between the selected valid times if select is not given an interval
+    - directory_template: strftime format of the cycle, the directory of the files relative to
+      the folder
+    - filename_templates: str.format templates with `cycle` (datetime) and `lead` (int), one file
+      per template is needed for every valid time
+
+    :param folder: root of the archive
+    :param directory_template: overrides the directory template, '' for a flat folder
+    :param max_lead: overrides the longest lead time used
+    :param cycle: use only this cycle, e.g. the initialization of a forecast
+    """
+    cycle_interval = 6
+    lead_step = 1
+    max_lead = 0
+    default_interval = 6
+    directory_template = ''
+    filename_templates = []
+
+    def __init__(self, folder, directory_template=None, max_lead=None, cycle=None):
+        self.folder = str(folder)
+        if directory_template is not None:
+            self.directory_template = directory_template
+        if max_lead is not None:
+            self.max_lead = max_lead
+        self.cycle = to_datetime(cycle) if cycle is not None else None
+
+    def __repr__(self):
+        return '{}("{}")'.format(type(self).__name__, self.folder)
+
+    def paths(self, cycle, lead) -> list:
+        directory = os.path.join(self.folder, cycle.strftime(self.directory_template))
+        return [os.path.join(directory, template.format(cycle=cycle, lead=lead))
+                for template in self.filename_templates]
+
+    def leads(self) -> list:
+        """
+        Lead times of a cycle in hours up to max_lead, shortest first.
+        """
+        return list(range(0, self.max_lead + 1, self.lead_step))
+
+    def is_cycle(self, time) -> bool:
+        seconds = (time - time.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+        return seconds % (self.cycle_interval * 3600) == 0
+
+    def candidates(self, valid_time):
+        """
+        Yield (cycle, lead hours) that can provide the valid time, analyses first and then
+        the shorter lead times.
+        """
+        valid_time = to_datetime(valid_time)
+
+        if self.cycle is not None:
+            lead = (valid_time - self.cycle).total_seconds() / 3600
+            if lead in self.leads():
+                yield self.cycle, int(lead)
+            return
+
+        for lead in self.leads():
+            cycle = valid_time - datetime.timedelta(hours=lead)
+            if self.is_cycle(cycle):
+                yield cycle, lead
+
+    def files_at(self, valid_time):
+        """
+        The files of the preferred cycle that has all files for the valid time.
+
+        :return: list of DatasetFile or None if no cycle has the files
+        """
+        valid_time = to_datetime(valid_time)
+        for cycle, lead in self.candidates(valid_time):
+            paths = self.paths(cycle, lead)
+            if all(os.path.isfile(path) for path in paths):
+                return [DatasetFile(path, valid_time, cycle, lead) for path in paths]
+        return None
+
+    def select(self, start, end, interval=None, strict=True):
+        """
+        Lazily yield the files covering the window [start, end] every `interval` hours.
+
+        :param start: arrow or datetime, the first valid time
+        :param end: arrow or datetime, the last valid time
+        :param interval: hours between the valid times, default_interval if None
+        :param strict: raise WrfRunnerException for a valid time without files, otherwise skip it
+        :return: generator of DatasetFile
+        """
+        step = datetime.timedelta(hours=interval or self.default_interval)
+        time = to_datetime(start)
+        end = to_datetime(end)
+
+        while time <= end:
+            files = self.files_at(time)
+            if files is None:
+                if strict:
+                    raise WrfRunnerException('{} has no files valid at {}'.format(
+                        self, time.isoformat()))
+                log.info('%r has no files valid at %s', self, time.isoformat())
+            else:
+                yield from files
+            time += step
+
+    def select_paths(self, start, end, interval=None, strict=True) -> list:
+        """
+        Like select, but return the list of the paths.
+        """
+        return [file.path for file in self.select(start, end, interval, strict)]
+
+
+class NAMAnalysis(Dataset):
+    """
+    NAM 218 analyses, every 6 hours with the short lead times up to 6 hours in between.
+    """
+    cycle_interval = 6
+    lead_step = 1
+    max_lead = 6
+    default_interval = 6
+    filename_templates = ['nam_218_{cycle:%Y%m%d_%H%M}_{lead:03d}.grb2']
+
+
+class NAMForecast(Dataset):
+    """
+    NAM 218 forecasts up to 84 hours, hourly until 36 hours and 3 hourly after.
+    """
+    cycle_interval = 6
+    lead_step = 1
+    max_lead = 84
+    # The last hourly lead time, lead times after it are 3 hours apart
+    hourly_until = 36
+    default_interval = 1
+    filename_templates = ['nam_218_{cycle:%Y%m%d_%H%M}_{lead:03d}.grb2']
+
+    def leads(self) -> list:
+        hourly = list(range(0, min(self.hourly_until, self.max_lead) + 1))
+        return hourly + list(range(self.hourly_until + 3, self.max_lead + 1, 3))
+
+
+class GFS(Dataset):
+    """
+    GFS 0.5 degree forecasts in the layout of the NCEI archive: YYYYMM/YYYYMMDD/gfs_4_*.grb2.
+    """
+    cycle_interval = 6
+    lead_step = 3
+    max_lead = 384
+    default_interval = 3
+    directory_template = '%Y%m/%Y%m%d'
+    filename_templates = ['gfs_4_{cycle:%Y%m%d_%H%M}_{lead:03d}.grb2']
+
+
+class Reanalysis(Dataset):
+    """
+    ERA style reanalysis with separate pressure level and surface files for every hour.
+
+    :param filename_templates: overrides the file names, e.g. for a single file per hour
+    :param kwargs: see Dataset
+    """
+    cycle_interval = 1
+    lead_step = 1
+    max_lead = 0
+    default_interval = 6
+    directory_template = '%Y/%m'
+    filename_templates = ['era5_pl_{cycle:%Y%m%d_%H}.grb', 'era5_sfc_{cycle:%Y%m%d_%H}.grb']
+
+    def __init__(self, folder, directory_template=None, filename_templates=None, **kwargs):
+        super().__init__(folder, directory_template, **kwargs)
+        if filename_templates is not None:
+            self.filename_templates = list(filename_templates)
+
+
+def group_by_time(files) -> dict:
+    """
+    Dictionary valid time -> list of paths from DatasetFiles, e.g. for
+    ungrib_cache.run_ungrib_cached.
+    """
+    grouped = collections.OrderedDict()
+    for file in files:
+        grouped.setdefault(file.valid_time, []).append(file.path)
+    return grouped
+
+
+SOURCES = {
+    'nam-analysis': NAMAnalysis,
+    'nam-forecast': NAMForecast,
+    'gfs': GFS,
+    'reanalysis': Reanalysis,
+}
+
+
+def open_dataset(name, folder, **kwargs) -> Dataset:
+    """
+    Create a dataset by the name of its source, see SOURCES.
+    """
+    if name not in SOURCES:
+        raise WrfRunnerException('Unknown dataset source "{}", use one of {}'.format(
+            name, ', '.join(SOURCES)))
+    return SOURCES[name](folder, **kwargs)
@@ -0,0 +1,290 @@
+import collections
+import glob
+import math
+import os
+import re
+import statistics
+
+import click
+import f90nml
+
+from .exceptions import WrfRunnerException
+
+Layout = collections.namedtuple('Layout', ['tasks', 'nproc_x', 'nproc_y', 'threads'])
+
+Domain = collections.namedtuple('Domain', ['e_we', 'e_sn', 'steps'])
+
+TimingRecord = collections.namedtuple('TimingRecord', ['layout', 'seconds_per_step', 'directory'])
+
+# Smallest patch in grid points in each direction, WRF needs at least the halo width plus a few
+# points
+MIN_PATCH = 10
+# Cost of the halo exchange of one boundary point relative to the computation of one point
+HALO_WEIGHT = 4.0
+# Speed up of one OpenMP thread relative to one MPI task
+THREAD_EFFICIENCY = 0.8
+
+# Example: "Ntasks in X            4 , ntasks in Y            6"
+NTASKS_PATTERN = re.compile(r'Ntasks in X\s+(\d+)\s*,\s*ntasks in Y\s+(\d+)', re.IGNORECASE)
+TIMING_PATTERN = re.compile(r'Timing for main: time \S+ on domain\s+1:\s+([\d.]+) elapsed seconds')
+# Printed by an OpenMP build, by default there is one tile per thread
+TILES_PATTERN = re.compile(r'WRF NUMBER OF TILES\s*=\s*(\d+)')
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def domains_from_namelist(domains_section) -> list:
+    """
+    Domain sizes and the number of time steps per step of domain 1 from the domains section of
+    namelist.input or from the patch created by wrf.create_namelist_patch.
+    """
+    e_we = _as_list(domains_section['e_we'])
+    e_sn = _as_list(domains_section['e_sn'])
+    count = domains_section.get('max_dom', len(e_we))
+    parent_id = _as_list(domains_section.get('parent_id', [1] * count))
+    ratio = _as_list(domains_section.get('parent_time_step_ratio', [1] * count))
+
+    steps = []
+    for i in range(count):
+        steps.append(1 if i == 0 else steps[parent_id[i] - 1] * ratio[i])
+
+    return [Domain(e_we[i], e_sn[i], steps[i]) for i in range(count)]
+
+
+def patch_size(domain, nproc_x, nproc_y) -> tuple:
+    """
+    Size of the largest patch in mass points.
+    """
+    return -(-(domain.e_we - 1) // nproc_x), -(-(domain.e_sn - 1) // nproc_y)
+
+
+def factor_pairs(tasks) -> list:
+    return [(x, tasks // x) for x in range(1, tasks + 1) if tasks % x == 0]
+
+
+def is_valid(domains, nproc_x, nproc_y, min_patch=MIN_PATCH) -> bool:
+    return all(min(patch_size(domain, nproc_x, nproc_y)) >= min_patch for domain in domains)
+
+
+def cost_terms(domains, layout) -> tuple:
+    """
+    Computation of the largest patch, its halo exchange and the latency of the collective
+    operations per step of domain 1, summed over the domains weighted by their number of steps.
+    """
+    compute = halo = latency = 0.0
+    for domain in domains:
+        x, y = patch_size(domain, layout.nproc_x, layout.nproc_y)
+        compute += domain.steps * x * y / (1 + (layout.threads - 1) * THREAD_EFFICIENCY)
+        if layout.tasks > 1:
+            halo += domain.steps * (x + y)
+            latency += domain.steps * math.log2(layout.tasks)
+    return compute, halo, latency
+
+
+def estimate_cost(domains, layout) -> float:
+    """
+    Relative cost of one step of domain 1.
+    """
+    compute, halo, latency = cost_terms(domains, layout)
+    return compute + HALO_WEIGHT * (halo + latency)
+
+
+def candidate_layouts(domains, cores, threads=(1,), min_patch=MIN_PATCH) -> list:
+    """
+    All layouts that fit into the cores and keep every patch of every domain at least
+    min_patch points wide.
+    """
+    layouts = []
+    for thread_count in threads:
+        for tasks in range(1, cores // thread_count + 1):
+            for nproc_x, nproc_y in factor_pairs(tasks):
+                if is_valid(domains, nproc_x, nproc_y, min_patch):
+                    layouts.append(Layout(tasks, nproc_x, nproc_y, thread_count))
+    return layouts
+
+
+def plan(domains, cores, threads=(1,), min_patch=MIN_PATCH) -> Layout:
+    """
+    The layout with the lowest estimated cost. Of the layouts with the same cost the one with
+    fewer cores is used.
+
+    :param domains: list of Domains, see domains_from_namelist
+    :param cores: number of cores available
+    :param threads: OpenMP thread counts to consider, only (1,) for a dmpar build of WRF
+    :param min_patch: the smallest allowed patch size in grid points
+    """
+    layouts = candidate_layouts(domains, cores, threads, min_patch)
+    if not layouts:
+        raise WrfRunnerException('No decomposition keeps the patches above {} points'
+                                 .format(min_patch))
+
+    return min(layouts,
+               key=lambda layout: (estimate_cost(domains, layout), layout.tasks * layout.threads))
+
+
+def apply_layout(patch, layout) -> dict:
+    """
+    Write the decomposition into the domains section of a namelist.input patch.
+    """
+    patch.setdefault('domains', {})
+    patch['domains']['nproc_x'] = layout.nproc_x
+    patch['domains']['nproc_y'] = layout.nproc_y
+    return patch
+
+
+def write_layout(namelist, layout) -> None:
+    """
+    Write the decomposition into an existing namelist.input, e.g. WRF/namelist.input between
+    real.exe and wrf.exe that run with different numbers of tasks.
+    """
+    namelist = str(namelist)
+    temporary = namelist + '.tmp'
+    f90nml.patch(namelist, apply_layout({}, layout), temporary)
+    os.replace(temporary, namelist)
+
+
+def read_timing(directory):
+    """
+    Parse the decomposition and the mean time of a step of domain 1 from the rsl files of a past
+    run.
+
+    :return: TimingRecord or None if the logs have no timing lines
+    """
+    rsl_files = sorted(glob.glob(os.path.join(str(directory), 'rsl.error.*')))
+    if not rsl_files:
+        return None
+
+    nproc_x = nproc_y = None
+    threads = 1
+    seconds = []
+    with open(rsl_files[0], errors='replace') as f:
+        for line in f:
+            match = TIMING_PATTERN.search(line)
+            if match:
+                seconds.append(float(match.group(1)))
+                continue
+            match = NTASKS_PATTERN.search(line)
+            if match:
+                nproc_x, nproc_y = int(match.group(1)), int(match.group(2))
+                continue
+            match = TILES_PATTERN.search(line)
+            if match:
+                threads = int(match.group(1))
+
+    if not seconds:
+        return None
+
+    tasks = len(rsl_files)
+    if nproc_x is None or nproc_x * nproc_y != tasks:
+        nproc_x, nproc_y = tasks, 1
+
+    return TimingRecord(Layout(tasks, nproc_x, nproc_y, threads), statistics.mean(seconds),
+                        str(directory))
+
+
+def _solve(matrix, vector):
+    """
+    Solve a small linear system by Gaussian elimination, None if it is singular.
+    """
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(size):
+            if row != column:
+                factor = rows[row][column] / rows[column][column]
+                rows[row] = [a - factor * b for a, b in zip(rows[row], rows[column])]
+    return [rows[i][size] / rows[i][i] for i in range(size)]
+
+
+def fit_model(domains, records):
+    """
+    Fit seconds per step = a * computation + b * halo exchange + c * latency to the records
+    by least squares, see cost_terms.
+
+    :return: function that predicts the seconds per step of a layout or None if the records
+        do not determine a model with non-negative coefficients
+    """
+    features = [cost_terms(domains, record.layout) for record in records]
+    targets = [record.seconds_per_step for record in records]
+
+    size = 3
+    if len(set(features)) < size:
+        return None
+
+    matrix = [[sum(f[i] * f[j] for f in features) for j in range(size)] for i in range(size)]
+    vector = [sum(f[i] * t for f, t in zip(features, targets)) for i in range(size)]
+    coefficients = _solve(matrix, vector)
+    if coefficients is None or min(coefficients) < 0:
+        return None
+
+    return lambda layout: sum(c * f for c, f in zip(coefficients, cost_terms(domains, layout)))
+
+
+def rank_layouts(domains, layouts, records) -> list:
+    """
+    Order the layouts by the expected seconds per step of domain 1.
+
+    Measured layouts use the mean of their records. The others are predicted by the cost terms
+    fitted to the records (see fit_model) or, with too few records, by the cost model scaled by
+    the median ratio between measured and estimated cost.
+
+    :return: list of tuples (layout, seconds per step, measured)
+    """
+    measured = collections.defaultdict(list)
+    for record in records:
+        measured[record.layout].append(record.seconds_per_step)
+
+    predict = fit_model(domains, records)
+    if predict is None and records:
+        scale = statistics.median(record.seconds_per_step / estimate_cost(domains, record.layout)
+                                  for record in records)
+
+        def predict(layout):
+            return estimate_cost(domains, layout) * scale
+
+    ranking = []
+    for layout in set(layouts) | set(measured):
+        if layout in measured:
+            ranking.append((layout, statistics.mean(measured[layout]), True))
+        elif predict is not None:
+            ranking.append((layout, predict(layout), False))
+
+    return sorted(ranking, key=lambda item: (item[1], item[0].tasks * item[0].threads))
+
+
+@click.command()
+@click.argument('namelist', type=click.Path(exists=True, dir_okay=False))
+@click.option('--cores', default=12, help='Cores available for wrf.exe')
+@click.option('--threads', default='1', help='Comma separated OpenMP thread counts')
+@click.option('--min-patch', default=MIN_PATCH)
+@click.option('--history', multiple=True, type=click.Path(exists=True, file_okay=False),
+              help='Directories of past runs with rsl files, replays their timings')
+@click.option('--top', default=10)
+def main(namelist, cores, threads, min_patch, history, top):
+    domains = domains_from_namelist(f90nml.read(namelist)['domains'])
+    thread_counts = [int(value) for value in threads.split(',')]
+
+    layouts = candidate_layouts(domains, cores, thread_counts, min_patch)
+    best = plan(domains, cores, thread_counts, min_patch)
+    print('Planned: {} tasks, nproc_x = {}, nproc_y = {}, {} threads'.format(*best))
+
+    records = [record for record in map(read_timing, history) if record]
+    if not records:
+        return
+
+    print('{:>6} {:>8} {:>8} {:>8} {:>12} {:>9}'.format('tasks', 'nproc_x', 'nproc_y', 'threads',
+                                                        's/step', 'source'))
+    for layout, seconds, is_measured in rank_layouts(domains, layouts, records)[:top]:
+        print('{:>6} {:>8} {:>8} {:>8} {:>12.4f} {:>9}'.format(
+            layout.tasks, layout.nproc_x, layout.nproc_y, layout.threads, seconds,
+            'measured' if is_measured else 'model'))
+
+
+if __name__ == '__main__':
+    main()
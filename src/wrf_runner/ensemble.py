@@ -0,0 +1,299 @@
+import asyncio
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import time
+
+from . import scheduler, templates, wps, wrf, workspace
+from .cache import file_hash
+from .exceptions import WrfRunnerException
+
+log = logging.getLogger('ensemble')
+
+STAGES = ['prepare', 'real', 'wrf']
+WPS_STAGES = ['prepare', 'geogrid', 'ungrib', 'metgrid']
+
+# Sections of namelist.wps that change the met_em files
+WPS_SECTIONS = ['share', 'geogrid', 'ungrib', 'metgrid']
+
+MemberResult = collections.namedtuple('MemberResult',
+                                      ['name', 'status', 'wall_time', 'stage_times', 'error'])
+
+
+class Member:
+    """
+    One variant of the simulation.
+
+    :param name: name of the member, also the name of its directory
+    :param overrides: patch applied on namelist.input after the time and domain patch,
+        e.g. {'physics': {'mp_physics': [8, 8, 8]}}
+    :param initialization_time: arrow object, overrides the initialization time of the ensemble
+    """
+
+    def __init__(self, name, overrides=None, initialization_time=None):
+        self.name = name
+        self.overrides = overrides or {}
+        self.initialization_time = initialization_time
+
+
+def merge_patches(*patches) -> dict:
+    """
+    Merge namelist patches group by group, later patches win.
+    """
+    result = {}
+    for patch in patches:
+        for group, values in patch.items():
+            result.setdefault(group, {}).update(values)
+    return result
+
+
+def sweep(parameters, prefix='member') -> list:
+    """
+    Create a member for every combination of the parameters.
+
+    :param parameters: dictionary group -> variable -> list of values, e.g.
+        {'physics': {'mp_physics': [[3, 3, 3], [8, 8, 8]], 'cu_physics': [[1, 1, 0], [3, 3, 0]]}}
+    :param prefix: the members are named prefix_000, prefix_001, ...
+    :return: list of Members
+    """
+    keys = [(group, variable) for group, variables in parameters.items() for variable in variables]
+    values = [parameters[group][variable] for group, variable in keys]
+
+    members = []
+    for i, combination in enumerate(itertools.product(*values)):
+        overrides = {}
+        for (group, variable), value in zip(keys, combination):
+            overrides.setdefault(group, {})[variable] = value
+        members.append(Member('{}_{:03d}'.format(prefix, i), overrides))
+
+    return members
+
+
+class Ensemble:
+    """
+    Runs real.exe and wrf.exe for many members that share the output of WPS.
+
+    Every member gets a directory working_directory/<name> with a WRF/ directory provisioned from
+    the installation, links to the met_em files and its own namelist.input.
+
+    The met_em files come either from an existing WPS directory or, if wps_install is given, from
+    WPS runs of the ensemble. Members with the same forcing (namelist.wps, Vtable and GRIB files)
+    share one WPS run in working_directory/wps_<key>.
+
+    :param initialization_time: arrow object, the start of the simulation
+    :param template_folder: folder with namelist.wps, namelist.input, Vtable and optionally tslist
+    :param wps_directory: WPS directory with the met_em files, None if wps_install is given
+    :param working_directory: the member directories are created in it
+    :param wrf_install: WRF installation that is provisioned into the member directories
+    :param simulation_hours: length of the simulation
+    :param wrf_cores: number of MPI tasks for wrf.exe of every member
+    :param dataset_folder: folder with the GRIB files for the WPS runs
+    :param wps_install: WPS installation used for the WPS runs of the ensemble
+    """
+
+    def __init__(self, initialization_time, template_folder, wps_directory, working_directory,
+                 wrf_install, simulation_hours=48, wrf_cores=1, dataset_folder=None,
+                 wps_install=None):
+        assert wps_directory or (wps_install and dataset_folder)
+
+        self.initialization_time = initialization_time
+        self.template_folder = os.path.abspath(str(template_folder))
+        self.wps_directory = os.path.abspath(str(wps_directory)) if wps_directory else None
+        self.working_directory = os.path.abspath(str(working_directory))
+        self.wrf_install = os.path.abspath(str(wrf_install))
+        self.simulation_hours = simulation_hours
+        self.wrf_cores = wrf_cores
+        self.dataset_folder = os.path.abspath(str(dataset_folder)) if dataset_folder else None
+        self.wps_install = os.path.abspath(str(wps_install)) if wps_install else None
+
+    def member_directory(self, member) -> str:
+        return os.path.join(self.working_directory, member.name)
+
+    def stage_cores(self, stage) -> int:
+        return self.wrf_cores if stage == 'wrf' else 1
+
+    def member_initialization_time(self, member):
+        return member.initialization_time or self.initialization_time
+
+    def forcing_key(self, member) -> str:
+        """
+        Hash of the inputs of WPS for the member: namelist.wps sections, Vtable and the GRIB files.
+
+        The GRIB files are identified by their path, size and modification time.
+        """
+        initialization_time = self.member_initialization_time(member)
+        namelist = os.path.join(self.template_folder, 'namelist.wps')
+        nml = templates.load_namelist(namelist)
+        patch = wps.create_namelist_patch(initialization_time, length_hours=self.simulation_hours,
+                                          template=namelist)
+
+        config = {}
+        for section in WPS_SECTIONS:
+            config[section] = dict(nml.get(section, {}))
+            config[section].update(patch.get(section, {}))
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        digest.update(file_hash(os.path.join(self.template_folder, 'Vtable')).encode())
+
+        files = scheduler.select_grib_files(self.dataset_folder, initialization_time,
+                                            self.simulation_hours)
+        for path in sorted(files):
+            stat = os.stat(path)
+            identity = '{}:{}:{}\n'.format(os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+            digest.update(identity.encode())
+
+        return digest.hexdigest()
+
+    def forcing_keys(self, members) -> dict:
+        """
+        Forcing keys of the members by their names. The key depends only on the initialization
+        time, so the dataset folder is scanned once per initialization time.
+        """
+        by_time = {}
+        keys = {}
+        for member in members:
+            initialization_time = self.member_initialization_time(member)
+            if initialization_time not in by_time:
+                by_time[initialization_time] = self.forcing_key(member)
+            keys[member.name] = by_time[initialization_time]
+        return keys
+
+    def wps_run(self, key, initialization_time):
+        """
+        The scheduler Run that executes WPS for the members with the forcing key.
+        """
+        name = 'wps_' + key[:12]
+        return scheduler.Run(name, initialization_time, self.dataset_folder, self.template_folder,
+                             os.path.join(self.working_directory, name),
+                             simulation_hours=self.simulation_hours, wps_install=self.wps_install)
+
+    def namelist_patch(self, member) -> dict:
+        initialization_time = self.member_initialization_time(member)
+        patch = wrf.create_namelist_patch(initialization_time, length_hours=self.simulation_hours)
+        return merge_patches(patch, member.overrides)
+
+    def prepare(self, member, wps_directory) -> None:
+        """
+        Create the directory of the member. Has to be called in the member directory.
+
+        :param wps_directory: WPS directory with the met_em files of the member
+        """
+        workspace.provision(self.wrf_install, 'WRF')
+
+        if not os.path.lexists('template'):
+            os.symlink(self.template_folder, 'template')
+
+        template = templates.get_template('template/namelist.input')
+        template.write('WRF/namelist.input', self.namelist_patch(member))
+        if os.path.exists('template/tslist'):
+            shutil.copy('template/tslist', 'WRF/')
+
+        wrf.link_metgrid_outputs(wps_directory, 'WRF/')
+
+
+def execute_member_stage(ensemble, member, wps_directory, stage) -> None:
+    """
+    Execute one stage of the member. Called in a worker process because it changes the directory.
+    """
+    directory = ensemble.member_directory(member)
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+
+    if stage == 'prepare':
+        ensemble.prepare(member, wps_directory)
+    elif stage == 'real':
+        wrf.run_real()
+    else:
+        wrf.run_wrf(ensemble.wrf_cores)
+
+
+class EnsembleRunner(scheduler.StageExecutor):
+    """
+    Executes the members of an ensemble concurrently within a core budget.
+    Members earlier in the list get the cores first. If the ensemble runs WPS, it is executed once
+    for every distinct forcing and the members wait for their WPS run.
+
+    run returns a list of MemberResults.
+    """
+
+    def __init__(self, ensemble, cores):
+        super().__init__(cores)
+        self.ensemble = ensemble
+        self.wps_tasks = {}
+        self.forcing_keys = {}
+
+    async def _run_wps(self, index, run) -> str:
+        error = await self.run_stages(index, run.name, WPS_STAGES, lambda stage: 1,
+                                      scheduler.execute_stage, run)
+        if error:
+            raise WrfRunnerException(error)
+
+        log.info('%s: met_em files ready', run.name)
+        return os.path.join(run.working_directory, 'WPS')
+
+    def _wps_directory(self, index, member):
+        """
+        Future with the WPS directory of the member, the WPS run is started by its first member.
+        """
+        if not self.ensemble.wps_install:
+            future = asyncio.get_event_loop().create_future()
+            future.set_result(self.ensemble.wps_directory)
+            return future
+
+        key = self.forcing_keys[member.name]
+        if key not in self.wps_tasks:
+            run = self.ensemble.wps_run(key, self.ensemble.member_initialization_time(member))
+            log.info('%s: WPS run %s', member.name, run.name)
+            self.wps_tasks[key] = asyncio.ensure_future(self._run_wps(index, run))
+
+        return self.wps_tasks[key]
+
+    async def _run_pipeline(self, index, member) -> MemberResult:
+        start = time.monotonic()
+        stage_times = collections.OrderedDict()
+
+        try:
+            wps_directory = await self._wps_directory(index, member)
+            stage_times['wps'] = time.monotonic() - start
+        except Exception as error:
+            log.error('%s: WPS failed: %s', member.name, error)
+            return MemberResult(member.name, 'failed', time.monotonic() - start, stage_times,
+                                'wps: {}'.format(error))
+
+        error = await self.run_stages(index, member.name, STAGES, self.ensemble.stage_cores,
+                                      execute_member_stage, self.ensemble, member, wps_directory,
+                                      stage_times=stage_times)
+        if error:
+            return MemberResult(member.name, 'failed', time.monotonic() - start, stage_times,
+                                error)
+
+        log.info('%s: finished', member.name)
+        return MemberResult(member.name, 'success', time.monotonic() - start, stage_times, None)
+
+    async def run_async(self, members) -> list:
+        self.wps_tasks = {}
+        self.forcing_keys = {}
+        if self.ensemble.wps_install:
+            # Scanning the dataset folder must not block the event loop
+            self.forcing_keys = await asyncio.get_event_loop().run_in_executor(
+                None, self.ensemble.forcing_keys, members)
+        return await super().run_async(members)
+
+
+def format_summary(results) -> str:
+    """
+    Table with the status and the wall time of every member.
+    """
+    lines = ['{:<20} {:<8} {:>10}  {}'.format('member', 'status', 'wall s', 'error')]
+    for result in results:
+        lines.append('{:<20} {:<8} {:>10.2f}  {}'.format(result.name, result.status,
+                                                         result.wall_time, result.error or ''))
+
+    succeeded = sum(1 for result in results if result.status == 'success')
+    lines.append('{} of {} members succeeded'.format(succeeded, len(results)))
+    return '\n'.join(lines)
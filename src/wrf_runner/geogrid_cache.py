@@ -0,0 +1,113 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+
+import click
+import f90nml
+
+from . import wps
+from .cache import FileCache
+
+log = logging.getLogger('geogrid_cache')
+
+# Variables from the share section that change the output of geogrid
+SHARE_VARIABLES = ['wrf_core', 'max_dom', 'io_form_geogrid', 'nocolons']
+OUTPUT_PATTERN = 'geo_em.d*'
+
+
+def cache_key(wps_directory='WPS') -> str:
+    """
+    Compute the key of the geogrid outputs from namelist.wps and GEOGRID.TBL.
+
+    The static data are identified only by geog_data_path in the geogrid section,
+    their content is not hashed.
+    """
+    nml = f90nml.read(os.path.join(wps_directory, 'namelist.wps'))
+
+    config = {
+        'share': {name: nml['share'][name] for name in SHARE_VARIABLES if name in nml['share']},
+        'geogrid': dict(nml['geogrid'])
+    }
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+
+    table_folder = nml['geogrid'].get('opt_geogrid_tbl_path', 'geogrid/')
+    with open(os.path.join(wps_directory, table_folder, 'GEOGRID.TBL'), 'rb') as f:
+        digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+class GeogridCache(FileCache):
+    """
+    Directory with geogrid outputs stored under the key of their configuration.
+
+    The least recently used entries are evicted when the cache grows over max_size bytes.
+    """
+
+
+def run_geogrid_cached(cache, link=True) -> None:
+    """
+    Get the geogrid outputs from the cache or run geogrid and store its outputs in the cache.
+
+    :param cache: GeogridCache instance
+    :param link: link the cached files into WPS/ instead of copying them
+    """
+    key = cache_key('WPS')
+
+    if cache.restore(key, 'WPS', link):
+        log.info('Geogrid outputs found in the cache (%s)', key)
+        return
+
+    log.info('Geogrid outputs not in the cache (%s)', key)
+
+    # Links restored from another entry would make geogrid.exe write into that entry
+    for path in glob.glob(os.path.join('WPS', 'geo_em.*')):
+        if os.path.lexists(path):
+            os.remove(path)
+
+    wps.run_geogrid()
+
+    cache.store(key, glob.glob(os.path.join('WPS', OUTPUT_PATTERN)))
+    log.info('Geogrid outputs stored in the cache')
+    cache.restore(key, 'WPS', link)
+    cache.prune()
+
+
+@click.group()
+@click.argument('cache_directory', type=click.Path(exists=True, file_okay=False))
+@click.pass_context
+def main(context, cache_directory):
+    context.obj = GeogridCache(cache_directory)
+
+
+@main.command('list')
+@click.pass_obj
+def list_entries(cache):
+    entries = sorted(cache.entries(), key=lambda entry: entry['last_used'], reverse=True)
+
+    for entry in entries:
+        print('{}  {:>10.1f} MB  {}  {}'.format(
+            entry['key'][:16],
+            entry['size'] / 2 ** 20,
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used'])),
+            ' '.join(entry['files'])))
+
+    total = sum(e['size'] for e in entries)
+    print('Total: {} entries, {:.1f} MB'.format(len(entries), total / 2 ** 20))
+
+
+@main.command()
+@click.option('--max-size', type=float, required=True, help='Maximum size of the cache in MB')
+@click.pass_obj
+def prune(cache, max_size):
+    deleted = cache.prune(int(max_size * 2 ** 20))
+    print('Deleted {} entries'.format(len(deleted)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+import abc
+import collections
+import json
+import logging
+import os
+
+from . import logs, metrics
+from .async_runner import run_program_async
+from .exceptions import WrfRunnerException
+
+log = logging.getLogger('launcher')
+
+# What a launcher runs: the command line, its working directory and the variables added to the
+# environment
+Command = collections.namedtuple('Command', ['args', 'cwd', 'env'])
+
+# None keeps the default of the launcher, 'none' switches the binding off
+BINDINGS = [None, 'none', 'core', 'socket']
+
+# Logs with the success markers, relative to the working directory of the program
+PROGRAM_LOGS = {
+    'geogrid': 'geogrid.log',
+    'ungrib': 'ungrib.log',
+    'metgrid': 'metgrid.log',
+    'real': 'rsl.error.0000',
+    'wrf': 'rsl.error.0000',
+}
+
+# Buffered unformatted I/O of the Fortran runtimes, speeds up the writing of the WRF output
+BUFFERED_IO_ENV = {
+    'FORT_BUFFERED': 'TRUE',  # Intel Fortran
+    'GFORTRAN_UNBUFFERED_ALL': 'n',  # GNU Fortran
+}
+
+_launcher = None
+
+
+class Launcher(abc.ABC):
+    """
+    Builds and runs the command lines of the WPS and WRF programs.
+
+    Subclasses implement wrap, which adds the launcher (mpirun, srun, ...) in front of the program.
+    It gets the variables added to the environment, e.g. to export them to the other nodes.
+
+    :param binding: one of BINDINGS, how the tasks are bound to the CPUs
+    :param env: variables added to the environment of every program
+    :param buffered_io: add BUFFERED_IO_ENV to the environment
+    """
+
+    def __init__(self, binding=None, env=None, buffered_io=False):
+        if binding not in BINDINGS:
+            raise WrfRunnerException('Unknown binding "{}", use one of {}'.format(
+                binding, ', '.join(str(value) for value in BINDINGS)))
+
+        self.binding = binding
+        self.env = dict(BUFFERED_IO_ENV if buffered_io else {}, **(env or {}))
+
+    @abc.abstractmethod
+    def wrap(self, program_args, tasks, threads, env) -> list:
+        """
+        The command line running the program with the launcher.
+
+        :param program_args: command line of the program
+        :param tasks: number of MPI tasks
+        :param threads: number of OpenMP threads per task or None
+        :param env: variables added to the environment
+        """
+
+    def command(self, executable, cwd, tasks=1, threads=None) -> Command:
+        """
+        :param executable: name of the executable in cwd, e.g. wrf.exe
+        :param cwd: working directory of the program
+        :param tasks: number of MPI tasks
+        :param threads: number of OpenMP threads per task, None to keep OMP_NUM_THREADS
+        """
+        env = dict(self.env)
+        if threads is not None:
+            env['OMP_NUM_THREADS'] = str(threads)
+            if self.binding not in (None, 'none'):
+                env.setdefault('OMP_PROC_BIND', 'close')
+                env.setdefault('OMP_PLACES', 'cores')
+
+        return Command(self.wrap(['./{}'.format(executable)], tasks, threads, env), str(cwd), env)
+
+    def serial(self):
+        """
+        Launcher of the serial WPS programs, they run directly without binding.
+        """
+        return LocalLauncher(env=self.env)
+
+    def environment(self, command):
+        if not command.env:
+            return None
+        return dict(os.environ, **command.env)
+
+    def run(self, stage, command, logfile=None, quiet=False) -> int:
+        """
+        Run the command and record its metrics, see metrics.run_program.
+
+        :return: return code of the program
+        """
+        log.debug('%s: %s in "%s"', stage, ' '.join(command.args), command.cwd)
+        return metrics.run_program(stage, command.args, command.cwd, logfile=logfile,
+                                   env=self.environment(command), quiet=quiet)
+
+    async def run_async(self, program, command, logfile, **kwargs) -> None:
+        """
+        Run the command without blocking the event loop, see async_runner.run_program_async.
+        """
+        await run_program_async(command.args, command.cwd, logfile, program,
+                                env=self.environment(command), **kwargs)
+
+
+class LocalLauncher(Launcher):
+    """
+    Runs the program directly, for the serial WPS programs and serial builds of WRF.
+
+    With a binding other than none the program is bound to the CPUs given by `cpus` with taskset.
+    """
+
+    def __init__(self, binding=None, env=None, buffered_io=False, cpus=None):
+        super().__init__(binding, env, buffered_io)
+        self.cpus = cpus
+
+    def wrap(self, program_args, tasks, threads, env) -> list:
+        if tasks != 1:
+            raise WrfRunnerException(
+                'The local launcher runs only one task, {} requested'.format(tasks))
+
+        if self.binding in (None, 'none'):
+            return program_args
+
+        cpus = self.cpus
+        if cpus is None:
+            cpus = sorted(os.sched_getaffinity(0))[:threads or 1]
+        return ['taskset', '-c', ','.join(str(cpu) for cpu in cpus)] + program_args
+
+
+class MpirunLauncher(Launcher):
+    """
+    Open MPI style mpirun. The variables of the environment are exported to all nodes with -x.
+
+    :param mpirun: the mpirun executable
+    :param extra_args: arguments added after the binding options, e.g. a hostfile
+    """
+
+    def __init__(self, binding=None, env=None, buffered_io=False, mpirun='mpirun', extra_args=()):
+        super().__init__(binding, env, buffered_io)
+        self.mpirun = mpirun
+        self.extra_args = list(extra_args)
+
+    def wrap(self, program_args, tasks, threads, env) -> list:
+        args = [self.mpirun, '-n', str(tasks)]
+
+        if self.binding == 'none':
+            args += ['--bind-to', 'none']
+        elif self.binding is None:
+            pass
+        elif threads and threads > 1:
+            # Every task gets its threads on neighbouring cores
+            args += ['--map-by', 'slot:PE={}'.format(threads), '--bind-to', 'core']
+        else:
+            args += ['--map-by', self.binding, '--bind-to', self.binding]
+
+        for name in sorted(env):
+            args += ['-x', name]
+
+        return args + self.extra_args + program_args
+
+
+class SrunLauncher(Launcher):
+    """
+    Slurm srun inside an allocation, the environment is propagated by srun.
+
+    :param extra_args: arguments added after the binding options, e.g. --mpi=pmix
+    """
+
+    def __init__(self, binding=None, env=None, buffered_io=False, srun='srun', extra_args=()):
+        super().__init__(binding, env, buffered_io)
+        self.srun = srun
+        self.extra_args = list(extra_args)
+
+    def wrap(self, program_args, tasks, threads, env) -> list:
+        args = [self.srun, '--ntasks={}'.format(tasks), '--cpus-per-task={}'.format(threads or 1)]
+        if self.binding is not None:
+            cpu_bind = {'none': 'none', 'core': 'cores', 'socket': 'sockets'}[self.binding]
+            args.append('--cpu-bind={}'.format(cpu_bind))
+        return args + self.extra_args + program_args
+
+
+class DryRunLauncher(Launcher):
+    """
+    Records the commands instead of running them, for testing the pipeline without WPS and WRF.
+
+    Unless write_logs is False the success marker of the program is appended to its log
+    (see PROGRAM_LOGS), so the checks of the log files pass.
+
+    The common arguments binding, env and buffered_io are used only if wrapped is None, for the
+    MpirunLauncher that builds the command lines then. This way from_name creates the dry run
+    with the same arguments as the other launchers.
+
+    :param wrapped: launcher that builds the command lines, a MpirunLauncher if None
+    :param record_path: JSON lines file the commands are appended to
+    """
+
+    def __init__(self, wrapped=None, record_path=None, write_logs=True, binding=None, env=None,
+                 buffered_io=False):
+        wrapped = wrapped or MpirunLauncher(binding, env, buffered_io)
+        super().__init__(wrapped.binding, wrapped.env)
+        self.wrapped = wrapped
+        self.record_path = record_path
+        self.write_logs = write_logs
+        self.commands = []
+
+    def wrap(self, program_args, tasks, threads, env) -> list:
+        return self.wrapped.wrap(program_args, tasks, threads, env)
+
+    def serial(self):
+        serial = DryRunLauncher(self.wrapped.serial(), self.record_path, self.write_logs)
+        serial.commands = self.commands
+        return serial
+
+    def _record(self, program, command) -> None:
+        self.commands.append(command)
+        log.info('Dry run of %s: %s', program, ' '.join(command.args))
+
+        if self.record_path:
+            with open(str(self.record_path), 'a') as f:
+                f.write(json.dumps(dict(command._asdict(), program=program)) + '\n')
+
+        if self.write_logs and program in PROGRAM_LOGS:
+            with open(os.path.join(command.cwd, PROGRAM_LOGS[program]), 'a') as f:
+                f.write(logs.SUCCESS_MARKERS[program] + '\n')
+
+    def run(self, stage, command, logfile=None, quiet=False) -> int:
+        self._record(stage, command)
+        return 0
+
+    async def run_async(self, program, command, logfile, **kwargs) -> None:
+        self._record(program, command)
+
+
+def from_name(name, **kwargs) -> Launcher:
+    """
+    Create a launcher by its name: local, mpirun, srun or dry-run.
+    """
+    launchers = {
+        'local': LocalLauncher,
+        'mpirun': MpirunLauncher,
+        'srun': SrunLauncher,
+        'dry-run': DryRunLauncher,
+    }
+    if name not in launchers:
+        raise WrfRunnerException('Unknown launcher "{}", use one of {}'.format(
+            name, ', '.join(launchers)))
+    return launchers[name](**kwargs)
+
+
+def configure(launcher) -> Launcher:
+    """
+    Use the launcher for all programs started by this process and its workers.
+    """
+    global _launcher
+    _launcher = launcher
+    return launcher
+
+
+def get_launcher() -> Launcher:
+    """
+    The configured launcher, mpirun without binding options if none was configured.
+    """
+    global _launcher
+    if _launcher is None:
+        _launcher = MpirunLauncher()
+    return _launcher
@@ -2,70 +2,119 @@ import glob
 import os
 import logging
 
+from .exceptions import WrfRunnerException
+
 log = logging.getLogger('linkgrib')
 
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# Three letters give 26 ** 3 extensions, AAA to ZZZ
+MAX_GRIB_FILES = len(LETTERS) ** 3
+PREFIX = 'GRIBFILE.'
+
+
+def grib_extension(index) -> str:
+    """
+    Extension of the index-th GRIB file, 0 -> AAA, 1 -> AAB, 26 -> ABA.
+    """
+    if not 0 <= index < MAX_GRIB_FILES:
+        raise WrfRunnerException('GRIB file index {} is out of the range AAA-ZZZ'.format(index))
+
+    first, rest = divmod(index, 26 * 26)
+    second, third = divmod(rest, 26)
+    return LETTERS[first] + LETTERS[second] + LETTERS[third]
+
+
+def extension_index(extension) -> int:
+    """
+    Inverse of grib_extension.
+    """
+    first, second, third = (LETTERS.index(letter) for letter in extension)
+    return (first * 26 + second) * 26 + third
+
 
 def grib_alphabetical_extensions(last_extension=None):
     """
     Generate file extensions AAA, AAB, AAC, ...
     """
+    start = extension_index(last_extension) + 1 if last_extension else 0
+
+    for index in range(start, MAX_GRIB_FILES):
+        yield grib_extension(index)
 
-    if not last_extension:
-        current = 'AAA'
-        yield current
-    else:
-        current = last_extension
 
-    while current != 'ZZZ':
-        numbers = [ord(c) for c in current]
+def is_grib_link(name) -> bool:
+    extension = name[len(PREFIX):]
+    return name.startswith(PREFIX) and len(extension) == 3 and all(c in LETTERS for c in extension)
 
-        numbers[2] += 1
 
-        if numbers[2] > ord('Z'):
-            numbers[2] = ord('A')
-            numbers[1] += 1
-            if numbers[1] > ord('Z'):
-                numbers[1] = ord('A')
-                numbers[0] += 1
+def _select_files(files, filter_function) -> list:
+    if isinstance(files, str):
+        files = glob.glob(files)
 
-        current = ''.join(map(chr, numbers))
+    if filter_function:
+        files = filter(filter_function, files)
 
-        yield current
+    return sorted(str(file) for file in files)
 
 
-def link_grib(files, filter_function=None, delete_links=True) -> None:
+def _link_names(current_links, count, delete_links, directory) -> list:
+    """
+    Names of the links for count new files, they continue after the current links if the current
+    links are kept.
+    """
+    start = 0
+    if not delete_links and current_links:
+        start = extension_index(current_links[-1][len(PREFIX):]) + 1
+
+    if start + count > MAX_GRIB_FILES:
+        raise WrfRunnerException('Can not link {} GRIB files into "{}", {} extensions are left'
+                                 .format(count, directory, MAX_GRIB_FILES - start))
+
+    return [PREFIX + grib_extension(index) for index in range(start, start + count)]
+
+
+def _remove_temporary_links(directory, names) -> None:
+    # Leftovers of an interrupted call
+    for name in names:
+        if name.startswith('.' + PREFIX):
+            os.unlink(os.path.join(directory, name))
+
+
+def _replace_links(directory, current_links, new_links) -> None:
+    # Rename the temporary links over the old ones and remove the old links that are left
+    for name in new_links:
+        os.rename(os.path.join(directory, '.' + name), os.path.join(directory, name))
+
+    for name in set(current_links).difference(new_links):
+        os.unlink(os.path.join(directory, name))
+
+
+def link_grib(files, filter_function=None, delete_links=True, directory='WPS') -> None:
     """
     Link the data files into the working directory.
 
-    Python implementation of the script linkgrib
+    Python implementation of the script linkgrib. With delete_links the new links are created
+    under temporary names and renamed over the old ones, so every GRIBFILE is replaced atomically,
+    old links that are not replaced are removed afterwards.
 
     :param delete_links: the function will delete all GRIBFILEs if delete_links is True
     :param files: a list of files to link or a pattern used for globing
     :param filter_function: this function can be used to filter the linked files
+    :param directory: the directory where the links are created
     """
+    directory = str(directory)
+    new_files = _select_files(files, filter_function)
 
-    current_links = glob.glob('WPS/GRIBFILE.???')
-    last_extension = None
+    names = os.listdir(directory)
+    current_links = sorted(name for name in names if is_grib_link(name))
+    new_links = _link_names(current_links, len(new_files), delete_links, directory)
+    _remove_temporary_links(directory, names)
 
-    # Delete all links
-    if delete_links:
-        for link in current_links:
-            os.remove(link)
-    else:
-        if current_links:
-            last_link = sorted(current_links)[-1]
-            last_extension = os.path.splitext(last_link)[-1][1:]
-
-    # Get the new files
-    if isinstance(files, str):
-        new_files = glob.glob(files)
-    else:
-        new_files = files
+    for name, new_file in zip(new_links, new_files):
+        log.debug('Linking: %s', new_file)
+        os.symlink(new_file, os.path.join(directory, '.' + name if delete_links else name))
 
-    if filter_function:
-        new_files = filter(filter_function, new_files)
+    if delete_links:
+        _replace_links(directory, current_links, new_links)
 
-    # Link the new paths
-    for extension, new_file in zip(grib_alphabetical_extensions(last_extension), sorted(new_files)):
-        log.debug('Linking: %s', new_file)
-        os.symlink(str(new_file), 'WPS/GRIBFILE.' + extension)
+    log.debug('%i GRIB files linked into "%s"', len(new_files), directory)
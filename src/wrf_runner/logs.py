@@ -0,0 +1,74 @@
+import os
+import logging
+
+log = logging.getLogger('logs')
+
+# Text that the programs print at the end of a successful run
+SUCCESS_MARKERS = {
+    'geogrid': 'Successful completion of program',
+    'ungrib': 'Successful completion of program',
+    'metgrid': 'Successful completion of program',
+    'real': 'SUCCESS COMPLETE',
+    'wrf': 'SUCCESS COMPLETE',
+}
+
+BLOCK_SIZE = 64 * 1024
+
+
+def tail_lines(path, lines=1, block_size=BLOCK_SIZE) -> list:
+    """
+    Return the last lines of a file without reading the whole file.
+
+    The file is read backwards from the end in blocks of block_size bytes until enough
+    newlines are found. Trailing empty lines are ignored.
+
+    :param path: path to the file
+    :param lines: number of lines to return
+    :param block_size: size of the blocks read from the end of the file
+    :return: list of at most `lines` strings, the last line is the last element
+    """
+    assert lines > 0
+
+    with open(str(path), 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+
+        data = b''
+        # One extra newline is needed to be sure that the first returned line is complete
+        while position > 0 and data.rstrip(b'\r\n').count(b'\n') < lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+
+    result = data.rstrip(b'\r\n').splitlines()[-lines:]
+    return [line.decode('utf-8', errors='replace') for line in result]
+
+
+def get_last_line(path) -> str:
+    """
+    Return the last non empty line of a file or an empty string if the file is empty.
+    """
+    result = tail_lines(path, 1)
+    return result[-1] if result else ''
+
+
+def check_success(path, program, lines=1, marker=None) -> bool:
+    """
+    Check the end of the log file for the success marker of the program.
+
+    :param path: path to the log file
+    :param program: name of the program, used to look up the marker in SUCCESS_MARKERS
+    :param lines: how many lines from the end of the file are searched
+    :param marker: overrides the marker from SUCCESS_MARKERS
+    """
+    if marker is None:
+        marker = SUCCESS_MARKERS[program]
+
+    try:
+        last_lines = tail_lines(path, lines)
+    except FileNotFoundError:
+        log.error('Log file "%s" not found', path)
+        return False
+
+    return any(marker in line for line in last_lines)
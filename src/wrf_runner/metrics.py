@@ -0,0 +1,240 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import subprocess
+import time
+
+from . import logs
+from .async_runner import TIMING_PATTERN, MODEL_TIME_FORMAT
+from .checkpoint import STAGE_FILES
+
+log = logging.getLogger('metrics')
+
+# Blocks in the rusage counters are 512 bytes
+BLOCK_SIZE = 512
+# Lines searched for the first timing line after the header of the WRF log and for the last one
+# at its end
+HEAD_SEARCH_LINES = 10000
+TAIL_SEARCH_LINES = 200
+
+# Numeric values exported to the Prometheus file
+PROMETHEUS_METRICS = [
+    ('wall_seconds', 'Wall clock time of the stage'),
+    ('cpu_user_seconds', 'User CPU time of the program and its children'),
+    ('cpu_system_seconds', 'System CPU time of the program and its children'),
+    ('max_rss_bytes', 'Peak resident set size of the largest process'),
+    ('read_bytes', 'Bytes read from block devices'),
+    ('write_bytes', 'Bytes written to block devices'),
+    ('files_produced', 'Output files written by the stage'),
+    ('simulated_hours_per_wall_hour', 'Simulation speed of WRF'),
+    ('returncode', 'Return code of the program'),
+]
+
+_recorder = None
+_collectors = []
+
+
+class MetricsRecorder:
+    """
+    Appends the metrics of the stages to a JSON lines report and optionally keeps a Prometheus
+    text format file with the latest values of every stage.
+
+    The report is only appended to, so stages running in several processes can share it.
+    """
+
+    def __init__(self, report_path='run_report.jsonl', prometheus_path=None):
+        self.report_path = os.path.abspath(str(report_path))
+        self.prometheus_path = os.path.abspath(str(prometheus_path)) if prometheus_path else None
+
+    def record(self, metrics) -> None:
+        with open(self.report_path, 'a') as f:
+            f.write(json.dumps(metrics, sort_keys=True, default=str) + '\n')
+
+        if self.prometheus_path:
+            write_prometheus(self.report_path, self.prometheus_path)
+
+
+def configure(report_path='run_report.jsonl', prometheus_path=None) -> MetricsRecorder:
+    """
+    Record the metrics of all stages run by this process and its workers.
+    """
+    global _recorder
+    _recorder = MetricsRecorder(report_path, prometheus_path)
+    return _recorder
+
+
+def disable() -> None:
+    global _recorder
+    _recorder = None
+
+
+def register_collector(collector) -> None:
+    """
+    Add a function called as collector(stage, metrics) after every stage. It returns a dictionary
+    of values added to the metrics or None.
+    """
+    _collectors.append(collector)
+
+
+def unregister_collector(collector) -> None:
+    _collectors.remove(collector)
+
+
+def read_report(report_path) -> list:
+    with open(str(report_path)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(report_path, prometheus_path) -> None:
+    """
+    Write the latest metrics of every stage and directory from the report in the Prometheus
+    text format.
+    """
+    latest = {}
+    for metrics in read_report(report_path):
+        latest[(metrics['stage'], metrics['directory'])] = metrics
+
+    lines = []
+    for name, description in PROMETHEUS_METRICS:
+        lines.append('# HELP wrf_runner_{} {}'.format(name, description))
+        lines.append('# TYPE wrf_runner_{} gauge'.format(name))
+        for (stage, directory), metrics in sorted(latest.items()):
+            if metrics.get(name) is None:
+                continue
+            lines.append('wrf_runner_{}{{stage="{}",directory="{}"}} {}'.format(
+                name, _escape(stage), _escape(directory), metrics[name]))
+
+    temporary = '{}.{}.tmp'.format(prometheus_path, os.getpid())
+    with open(temporary, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temporary, prometheus_path)
+
+
+def count_outputs(stage, since, directory=None) -> int:
+    """
+    Number of output files of the stage (see checkpoint.STAGE_FILES) modified after `since`.
+
+    :param directory: the directory the program wrote to, e.g. a scratch directory of
+        parallel.run_metgrid_parallel. The file names of the patterns are searched in it, by
+        default the patterns are relative to the current directory
+    """
+    _, outputs = STAGE_FILES.get(stage, ([], []))
+    if directory is not None:
+        outputs = [os.path.join(str(directory), os.path.basename(pattern)) for pattern in outputs]
+    paths = set(path for pattern in outputs for path in glob.glob(pattern))
+    return sum(1 for path in paths if os.path.getmtime(path) >= since)
+
+
+def _model_time(line):
+    match = TIMING_PATTERN.search(line)
+    if match is None or int(match.group(2)) != 1:
+        return None
+    return datetime.datetime.strptime(match.group(1), MODEL_TIME_FORMAT)
+
+
+def simulated_hours(logfile):
+    """
+    Simulated hours between the first and the last timing line of domain 1 in the WRF log.
+
+    Only the beginning and the end of the log are read. Returns None if there are no timing lines.
+    """
+    first = None
+    try:
+        with open(str(logfile), errors='replace') as f:
+            for _, line in zip(range(HEAD_SEARCH_LINES), f):
+                first = _model_time(line)
+                if first:
+                    break
+
+        last_lines = logs.tail_lines(logfile, TAIL_SEARCH_LINES)
+    except FileNotFoundError:
+        return None
+
+    last = None
+    for line in reversed(last_lines):
+        last = _model_time(line)
+        if last:
+            break
+
+    if first is None or last is None:
+        return None
+
+    return (last - first).total_seconds() / 3600
+
+
+def run_program(stage, args, cwd, logfile=None, env=None, quiet=False) -> int:
+    """
+    Run the program, measure it and record its metrics if a recorder is configured.
+
+    CPU times, peak RSS and block IO come from wait4, so they include the children the program
+    waited for, e.g. the MPI tasks started by mpirun.
+
+    :param stage: name of the stage, used to find its outputs in checkpoint.STAGE_FILES
+    :param args: command line of the program
+    :param cwd: working directory of the program
+    :param logfile: WRF log with timing lines, enables simulated_hours_per_wall_hour
+    :param env: environment of the program, None to inherit it
+    :param quiet: discard the output of the program
+    :return: return code of the program
+    """
+    started = datetime.datetime.now(datetime.timezone.utc)
+    start_time = time.time()
+    start = time.monotonic()
+
+    output = subprocess.DEVNULL if quiet else None
+    process = subprocess.Popen(args, cwd=cwd, env=env, stdout=output, stderr=output)
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except BaseException:
+        # Interrupted, e.g. by KeyboardInterrupt, do not leave the program running
+        process.kill()
+        process.wait()
+        raise
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    # Popen must not wait for the process again
+    process.returncode = returncode
+
+    wall_seconds = time.monotonic() - start
+
+    metrics = {
+        'stage': stage,
+        'directory': os.getcwd(),
+        'started': started.isoformat(),
+        'finished': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'returncode': returncode,
+        'wall_seconds': round(wall_seconds, 3),
+        'cpu_user_seconds': round(usage.ru_utime, 3),
+        'cpu_system_seconds': round(usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_bytes': usage.ru_maxrss * 1024,
+        'read_bytes': usage.ru_inblock * BLOCK_SIZE,
+        'write_bytes': usage.ru_oublock * BLOCK_SIZE,
+        'files_produced': count_outputs(stage, start_time, cwd),
+        'simulated_hours_per_wall_hour': None,
+    }
+
+    if logfile:
+        hours = simulated_hours(logfile)
+        if hours and wall_seconds > 0:
+            metrics['simulated_hours_per_wall_hour'] = round(hours / (wall_seconds / 3600), 3)
+
+    for collector in _collectors:
+        try:
+            metrics.update(collector(stage, metrics) or {})
+        except Exception:
+            log.exception('Metrics collector %r failed', collector)
+
+    log.debug('Metrics of %s: %s', stage, metrics)
+    if _recorder is not None:
+        _recorder.record(metrics)
+
+    return returncode
@@ -0,0 +1,237 @@
+import concurrent.futures
+import datetime
+import glob
+import logging
+import os
+import shutil
+
+import f90nml
+
+from . import launcher, logs
+from .exceptions import WrfRunnerException
+from .linkgrib import link_grib
+
+log = logging.getLogger('parallel')
+
+# The format for time: '2016-01-01_00:00:00'
+TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+
+
+def to_datetime(time) -> datetime.datetime:
+    """
+    Convert datetime or arrow object to a naive datetime.
+    """
+    time = getattr(time, 'datetime', time)
+    return time.replace(tzinfo=None)
+
+
+def _first(value):
+    return value[0] if isinstance(value, list) else value
+
+
+def read_time_window(namelist_path):
+    """
+    Read the simulation window of the first domain from namelist.wps.
+
+    :return: tuple (start, end, interval) as datetime, datetime and timedelta
+    """
+    nml = f90nml.read(str(namelist_path))
+    start = datetime.datetime.strptime(_first(nml['share']['start_date']), TIME_FORMAT)
+    end = datetime.datetime.strptime(_first(nml['share']['end_date']), TIME_FORMAT)
+    interval = datetime.timedelta(seconds=nml['share']['interval_seconds'])
+
+    return start, end, interval
+
+
+def time_steps(start, end, interval) -> list:
+    steps = []
+    current = start
+    while current <= end:
+        steps.append(current)
+        current += interval
+    return steps
+
+
+def split_into_chunks(items, chunks) -> list:
+    """
+    Split the list into at most `chunks` continuous parts of nearly the same size.
+    """
+    chunks = max(1, min(chunks, len(items)))
+    size, remainder = divmod(len(items), chunks)
+
+    result = []
+    position = 0
+    for i in range(chunks):
+        end = position + size + (1 if i < remainder else 0)
+        result.append(items[position:end])
+        position = end
+
+    return result
+
+
+def create_time_patch(namelist_path, start, end) -> dict:
+    """
+    Create a patch for namelist.wps with the given window. Nests get only the start time
+    the same way as in wps.create_namelist_patch.
+    """
+    nml = f90nml.read(str(namelist_path))
+    domains = nml['share']['max_dom']
+
+    start_date = [start.strftime(TIME_FORMAT)] * domains
+    end_date = list(start_date)
+    end_date[0] = end.strftime(TIME_FORMAT)
+
+    return {'share': {'start_date': start_date, 'end_date': end_date}}
+
+
+def prepare_scratch_directory(wps_directory, scratch_directory, names) -> None:
+    """
+    Create an empty directory with links to the given files from the WPS directory.
+    """
+    shutil.rmtree(scratch_directory, ignore_errors=True)
+    os.makedirs(scratch_directory)
+
+    for name in names:
+        for source in glob.glob(os.path.join(wps_directory, name)):
+            os.symlink(os.path.abspath(source),
+                       os.path.join(scratch_directory, os.path.basename(source)))
+
+
+def run_program_in(directory, program) -> bool:
+    """
+    Run WPS program in the directory. Returns True if the program succeeded.
+    """
+    runner = launcher.get_launcher().serial()
+    command = runner.command('{}.exe'.format(program), directory)
+    returncode = runner.run(program, command, quiet=True)
+    logfile = os.path.join(directory, program + '.log')
+    return not returncode and logs.check_success(logfile, program)
+
+
+def run_in_pool(program, directories, workers) -> None:
+    log.info('Running %i instances of %s with %i workers', len(directories), program, workers)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run_program_in, directories, [program] * len(directories)))
+
+    failed = [directory for directory, result in zip(directories, results) if not result]
+    if failed:
+        log.error('%s failed in: %s', program, ', '.join(failed))
+        raise WrfRunnerException('Parallel execution of {} failed'.format(program))
+
+
+def merge_logs(directories, program, wps_directory) -> None:
+    with open(os.path.join(wps_directory, program + '.log'), 'w') as output:
+        for directory in directories:
+            with open(os.path.join(directory, program + '.log')) as f:
+                shutil.copyfileobj(f, output)
+
+
+def collect_outputs(directories, pattern, wps_directory) -> int:
+    count = 0
+    for directory in directories:
+        for file in glob.glob(os.path.join(directory, pattern)):
+            os.replace(file, os.path.join(wps_directory, os.path.basename(file)))
+            count += 1
+    return count
+
+
+def run_ungrib_parallel(files_by_time, workers=4, chunks=None, wps_directory='WPS') -> None:
+    """
+    Run ungrib in several processes, each one on a part of the simulation window.
+
+    The window and interval are taken from namelist.wps in the WPS directory. Every part is
+    processed in its own scratch directory and the intermediate files are moved back to the
+    WPS directory for metgrid. Note that ungrib can not interpolate missing times across the
+    boundaries of the parts.
+
+    :param files_by_time: dictionary time -> file or list of files, e.g. NAM_forecast.dates
+    :param workers: number of ungrib processes running at the same time
+    :param chunks: number of parts the window is split into, defaults to workers
+    :param wps_directory: directory with ungrib.exe, Vtable and namelist.wps
+    """
+    namelist = os.path.join(wps_directory, 'namelist.wps')
+    start, end, interval = read_time_window(namelist)
+
+    files_by_time = {to_datetime(time): files for time, files in files_by_time.items()}
+
+    steps = [step for step in time_steps(start, end, interval) if step in files_by_time]
+    if not steps:
+        raise WrfRunnerException('No input files found for the window {} - {}'.format(start, end))
+
+    prefix = f90nml.read(namelist)['ungrib'].get('prefix', 'FILE')
+    scratch_root = os.path.join(wps_directory, 'parallel_ungrib')
+
+    directories = []
+    for i, chunk in enumerate(split_into_chunks(steps, chunks or workers)):
+        directory = os.path.join(scratch_root, 'chunk_{:03d}'.format(i))
+        prepare_scratch_directory(wps_directory, directory, ['ungrib.exe', 'ungrib', 'Vtable'])
+
+        files = []
+        for step in chunk:
+            step_files = files_by_time[step]
+            files.extend([step_files] if isinstance(step_files, str) else step_files)
+
+        link_grib([os.path.abspath(str(file)) for file in files], directory=directory)
+        f90nml.patch(namelist, create_time_patch(namelist, chunk[0], chunk[-1]),
+                     os.path.join(directory, 'namelist.wps'))
+
+        directories.append(directory)
+
+    run_in_pool('ungrib', directories, workers)
+
+    merge_logs(directories, 'ungrib', wps_directory)
+    count = collect_outputs(directories, prefix + ':*', wps_directory)
+    log.info('%i intermediate files collected', count)
+
+    shutil.rmtree(scratch_root)
+
+
+def run_metgrid_parallel(slices=4, workers=None, wps_directory='WPS') -> None:
+    """
+    Run metgrid in several processes, each one on a part of the simulation window.
+
+    Every slice gets its own directory with links to metgrid.exe, the METGRID.TBL, geogrid and
+    ungrib outputs and a namelist.wps restricted to the slice. The met_em files are moved back
+    to the WPS directory so they can be linked by wrf.link_metgrid_outputs. Nests only need
+    the initial time, so they are processed only in the first slice.
+
+    :param slices: number of parts the window is split into
+    :param workers: number of metgrid processes running at the same time, defaults to slices
+    :param wps_directory: directory with metgrid.exe, namelist.wps and the inputs
+    """
+    namelist = os.path.join(wps_directory, 'namelist.wps')
+    start, end, interval = read_time_window(namelist)
+
+    nml = f90nml.read(namelist)
+    inputs = nml['metgrid'].get('fg_name', 'FILE')
+    constants = nml['metgrid'].get('constants_name', [])
+
+    inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+    constants = [constants] if isinstance(constants, str) else list(constants)
+
+    names = ['metgrid.exe', 'metgrid', 'geo_em.d*.nc']
+    names += [os.path.basename(name) + ':*' for name in inputs]
+    names += [os.path.basename(name) for name in constants]
+
+    scratch_root = os.path.join(wps_directory, 'parallel_metgrid')
+
+    directories = []
+    for i, chunk in enumerate(split_into_chunks(time_steps(start, end, interval), slices)):
+        directory = os.path.join(scratch_root, 'slice_{:03d}'.format(i))
+        prepare_scratch_directory(wps_directory, directory, names)
+
+        patch = create_time_patch(namelist, chunk[0], chunk[-1])
+        if i > 0:
+            patch['share']['max_dom'] = 1
+
+        f90nml.patch(namelist, patch, os.path.join(directory, 'namelist.wps'))
+        directories.append(directory)
+
+    run_in_pool('metgrid', directories, workers or len(directories))
+
+    merge_logs(directories, 'metgrid', wps_directory)
+    count = collect_outputs(directories, 'met_em.*', wps_directory)
+    log.info('%i met_em files collected', count)
+
+    shutil.rmtree(scratch_root)
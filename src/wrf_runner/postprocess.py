@@ -0,0 +1,360 @@
+"""
+Post-processing of wrfout files. Requires numpy and netCDF4, install the extra 'postprocess'.
+
+Only the requested variables and time steps are read from the files, the derived fields are
+computed with NumPy and the results are written as one .npz file per wrfout file.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import logging
+import os
+import re
+import time
+
+import netCDF4
+import numpy as np
+
+from . import watcher
+from .exceptions import WrfRunnerException
+
+log = logging.getLogger('postprocess')
+
+ProcessedFile = collections.namedtuple('ProcessedFile',
+                                       ['path', 'output', 'fields', 'times', 'seconds'])
+
+# A derived field: the wrfout variables it needs, the function computing it from a dictionary
+# name -> array and whether the function needs the previous time step (see accumulated_delta)
+DerivedField = collections.namedtuple('DerivedField', ['inputs', 'function', 'needs_previous'])
+
+TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+DOMAIN_PATTERN = re.compile(r'wrfout_(d\d\d)_')
+
+_derived = {}
+
+
+def register_derived(name, inputs, function, needs_previous=False) -> None:
+    """
+    Add a derived field.
+
+    :param name: name of the field in the output
+    :param inputs: names of the wrfout variables passed to the function
+    :param function: called with a dictionary variable name -> array with time as the first axis,
+        returns the array of the field
+    :param needs_previous: the arrays start with the last time step of the previous file (or a copy
+        of the first step for the first file) and the result must drop it
+    """
+    _derived[name] = DerivedField(list(inputs), function, needs_previous)
+
+
+def derived_fields() -> dict:
+    return dict(_derived)
+
+
+def wind_speed_10m(values):
+    return np.hypot(values['U10'], values['V10'])
+
+
+def temperature_2m_celsius(values):
+    return values['T2'] - 273.15
+
+
+def total_precipitation(values):
+    """
+    Accumulated precipitation since the start in mm, including the bucket counters if present.
+    """
+    total = values['RAINC'] + values['RAINNC']
+    bucket = values.get('bucket_mm')
+    if bucket and bucket > 0 and 'I_RAINC' in values:
+        total = total + (values['I_RAINC'] + values['I_RAINNC']) * bucket
+    return total
+
+
+def accumulated_delta(accumulated):
+    """
+    Differences between the consecutive time steps, the first step is the previous one.
+    """
+    return np.diff(accumulated, axis=0)
+
+
+def precipitation(values):
+    """
+    Precipitation since the previous output time in mm.
+    """
+    return accumulated_delta(total_precipitation(values))
+
+
+register_derived('wind_speed_10m', ['U10', 'V10'], wind_speed_10m)
+register_derived('temperature_2m_c', ['T2'], temperature_2m_celsius)
+register_derived('precipitation', ['RAINC', 'RAINNC'], precipitation, needs_previous=True)
+
+
+def _time_index(times, count):
+    """
+    Normalize the time selection: None for all steps, an int, a slice or a list of indices.
+    """
+    if times is None:
+        return slice(None)
+    if isinstance(times, int):
+        return [times if times >= 0 else count + times]
+    if isinstance(times, slice):
+        return times
+    return sorted(index if index >= 0 else count + index for index in times)
+
+
+def _selected_indices(times, count) -> list:
+    selection = _time_index(times, count)
+    if isinstance(selection, slice):
+        return list(range(count))[selection]
+    return selection
+
+
+def _consecutive_runs(indices) -> list:
+    """
+    Split sorted indices into runs of consecutive indices.
+    """
+    runs = []
+    for index in indices:
+        if runs and runs[-1][-1] + 1 == index:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+def read_times(dataset, times=None) -> list:
+    """
+    Valid times of the time steps from the Times variable as UTC datetimes.
+    """
+    variable = dataset.variables['Times']
+    selection = _time_index(times, variable.shape[0])
+    chars = variable[selection]
+    result = []
+    for row in np.atleast_2d(chars):
+        text = b''.join(row).decode() if row.dtype.kind == 'S' else ''.join(row)
+        valid_time = datetime.datetime.strptime(text, TIME_FORMAT)
+        result.append(valid_time.replace(tzinfo=datetime.timezone.utc))
+    return result
+
+
+def read_variables(path, variables, times=None) -> dict:
+    """
+    Read only the variables and time steps from the wrfout file.
+
+    netCDF4 reads just the hyperslab of the selected steps (for chunked NetCDF4/HDF5 files only the
+    chunks that contain them), the rest of the file is never loaded.
+
+    :param path: path to the wrfout file
+    :param variables: names of the variables
+    :param times: None for all steps, an index, a slice or a list of indices
+    :return: dictionary name -> array with the time as the first axis
+    """
+    with netCDF4.Dataset(str(path)) as dataset:
+        dataset.set_auto_mask(False)
+        return _read(dataset, variables, times)
+
+
+def _read(dataset, variables, times) -> dict:
+    result = {}
+    for name in variables:
+        if name not in dataset.variables:
+            raise WrfRunnerException('Variable {} is not in "{}"'.format(name, dataset.filepath()))
+        variable = dataset.variables[name]
+        result[name] = variable[(_time_index(times, variable.shape[0]),)]
+    return result
+
+
+def _inputs(fields) -> list:
+    names = []
+    for field in fields:
+        inputs = _derived[field].inputs if field in _derived else [field]
+        names.extend(name for name in inputs if name not in names)
+    return names
+
+
+def _bucket_variables(dataset, inputs) -> list:
+    if 'RAINC' in inputs and 'I_RAINC' in dataset.variables:
+        return ['I_RAINC', 'I_RAINNC']
+    return []
+
+
+def _needs_previous(fields) -> bool:
+    return any(_derived[field].needs_previous for field in fields if field in _derived)
+
+
+def _accumulated(derived, values, bases, runs, inputs, bucket):
+    """
+    Compute a field that needs the previous time step for every run of consecutive selected steps.
+
+    :param bases: dictionary first index of a run -> values of the step before it
+    """
+    parts = []
+    position = 0
+    for run in runs:
+        arguments = {name: np.concatenate([bases[run[0]][name],
+                                           values[name][position:position + len(run)]])
+                     for name in inputs}
+        arguments['bucket_mm'] = bucket
+        parts.append(derived.function(arguments))
+        position += len(run)
+    return np.concatenate(parts)
+
+
+def process_file(path, fields, output_directory, previous=None, times=None) -> ProcessedFile:
+    """
+    Compute the fields of one wrfout file and save them into output_directory/<name>.npz.
+
+    Fields like precipitation are the differences to the model step before every selected step,
+    which is the step before it in this file, the last step of the previous file or, for the first
+    step of the first file, the step itself.
+
+    :param path: path to the wrfout file
+    :param fields: names of wrfout variables or derived fields, see register_derived
+    :param output_directory: directory of the .npz files
+    :param previous: the wrfout file of the same domain before this one, its last time step is
+        needed for fields like precipitation
+    :param times: time steps to process, see read_variables
+    """
+    start = time.monotonic()
+    inputs = _inputs(fields)
+
+    bases = {}
+    with netCDF4.Dataset(str(path)) as dataset:
+        dataset.set_auto_mask(False)
+        inputs += _bucket_variables(dataset, inputs)
+        values = _read(dataset, inputs, times)
+        valid_times = read_times(dataset, times)
+        bucket = float(getattr(dataset, 'BUCKET_MM', 0) or 0)
+
+        runs = _consecutive_runs(_selected_indices(times, dataset.variables['Times'].shape[0]))
+        if _needs_previous(fields):
+            for run in runs:
+                if run[0] > 0:
+                    bases[run[0]] = _read(dataset, inputs, [run[0] - 1])
+
+    if _needs_previous(fields) and runs and runs[0][0] == 0:
+        if previous is not None and os.path.exists(str(previous)):
+            bases[0] = read_variables(previous, inputs, times=-1)
+        else:
+            # The first file, the first step has no precipitation
+            bases[0] = {name: array[:1] for name, array in values.items()}
+
+    results = {'times': np.array([value.strftime(TIME_FORMAT) for value in valid_times])}
+    for field in fields:
+        if field not in _derived:
+            results[field] = values[field]
+            continue
+
+        derived = _derived[field]
+        if derived.needs_previous:
+            result = _accumulated(derived, values, bases, runs, inputs, bucket)
+        else:
+            result = derived.function(dict(values, bucket_mm=bucket))
+        results[field] = np.asarray(result, dtype=np.float32)
+
+    os.makedirs(output_directory, exist_ok=True)
+    output = os.path.join(str(output_directory), os.path.basename(str(path)) + '.npz')
+    temporary = output + '.tmp.npz'
+    np.savez(temporary, **results)
+    os.replace(temporary, output)
+
+    seconds = time.monotonic() - start
+    log.debug('"%s" processed in %.2f s', path, seconds)
+    return ProcessedFile(str(path), output, list(fields), valid_times, seconds)
+
+
+def load_processed(output) -> dict:
+    """
+    Read a .npz file written by process_file.
+    """
+    with np.load(str(output)) as data:
+        return {name: data[name] for name in data.files}
+
+
+def domain_of(path):
+    match = DOMAIN_PATTERN.search(os.path.basename(str(path)))
+    return match.group(1) if match else None
+
+
+class PostProcessor:
+    """
+    Processes wrfout files in a pool of processes.
+
+    :param fields: names of wrfout variables or derived fields
+    :param output_directory: directory of the .npz files
+    :param workers: number of processes
+    :param times: time steps of every file to process, see read_variables
+    """
+
+    def __init__(self, fields, output_directory, workers=4, times=None):
+        self.fields = list(fields)
+        self.output_directory = str(output_directory)
+        self.workers = workers
+        self.times = times
+        # domain -> the last submitted file
+        self._previous = {}
+
+    def _submit(self, pool, path):
+        domain = domain_of(path)
+        previous = self._previous.get(domain)
+        self._previous[domain] = path
+        return pool.submit(process_file, path, self.fields, self.output_directory, previous,
+                           self.times)
+
+    def process(self, paths) -> list:
+        """
+        Process the files, they are ordered by name so every file follows its predecessor.
+
+        :return: list of ProcessedFile in the order of the paths
+        """
+        self._previous = {}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [self._submit(pool, path) for path in sorted(str(path) for path in paths)]
+            return [future.result() for future in futures]
+
+    async def process_stream(self, paths):
+        """
+        Process the files of an asynchronous iterable as they arrive, e.g. watcher.watch_outputs
+        or streaming.run_wrf_streaming, and yield the ProcessedFiles as they are finished.
+        """
+        self._previous = {}
+        loop = asyncio.get_event_loop()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            iterator = paths.__aiter__()
+            next_path = asyncio.ensure_future(iterator.__anext__())
+
+            try:
+                while next_path is not None or pending:
+                    waiting = set(pending)
+                    if next_path is not None:
+                        waiting.add(next_path)
+                    done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                    if next_path in done:
+                        try:
+                            path = next_path.result()
+                        except StopAsyncIteration:
+                            next_path = None
+                        else:
+                            future = self._submit(pool, path)
+                            pending.add(asyncio.wrap_future(future, loop=loop))
+                            next_path = asyncio.ensure_future(iterator.__anext__())
+
+                    for future in done & pending:
+                        pending.discard(future)
+                        yield future.result()
+            finally:
+                # The consumer stopped early, do not leave the source running
+                if next_path is not None and not next_path.done():
+                    next_path.cancel()
+
+    async def watch(self, directory='WRF/', stop=None, settle=1.0):
+        """
+        Process the wrfout files in the directory as they are completed, see watcher.watch_outputs.
+        """
+        outputs = watcher.watch_outputs(directory, watcher.WRFOUT_PATTERNS, stop=stop,
+                                        settle=settle)
+        async for result in self.process_stream(outputs):
+            yield result
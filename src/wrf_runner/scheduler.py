@@ -0,0 +1,321 @@
+import abc
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import time
+
+import f90nml
+
+from . import checkpoint, decomposition, wps, wrf, utils, workspace
+from .datasets.sources import NAMForecast
+from .exceptions import WrfRunnerException
+from .linkgrib import link_grib
+
+log = logging.getLogger('scheduler')
+
+STAGES = ['prepare', 'geogrid', 'ungrib', 'metgrid', 'real', 'wrf']
+
+RunResult = collections.namedtuple('RunResult', ['name', 'status', 'stage_times', 'error'])
+
+
+class Run:
+    """
+    Description of one simulation: where the inputs are and where it runs.
+
+    :param name: name used in the logs
+    :param initialization_time: arrow object, the start of the simulation
+    :param dataset_folder: folder with the GRIB files
+    :param template_folder: folder with namelist.wps, namelist.input, Vtable and optionally tslist
+    :param working_directory: the run is executed in this directory, WPS/ and WRF/ are created in
+        it
+    :param simulation_hours: length of the simulation
+    :param wrf_cores: number of MPI tasks for wrf.exe
+    :param wps_install: WPS installation that is provisioned into WPS/, None if WPS/ already exists
+    :param wrf_install: WRF installation that is provisioned into WRF/, None if WRF/ already exists
+    :param resume: skip the stages recorded as complete in run_state.json in the working directory
+    :param restart_interval: minutes between WRF restart files, if set a failed wrf.exe is
+        resubmitted from the latest restart files
+    :param max_resubmissions: how many times a failed wrf.exe is resubmitted
+    :param decompose: choose the number of tasks and nproc_x/nproc_y of real.exe and wrf.exe from
+        the domain sizes, see decomposition.plan. wrf_cores and real_cores are then the upper
+        limits
+    :param real_cores: number of MPI tasks for real.exe
+    :param omp_threads: OpenMP thread counts per task considered for wrf.exe, None for a dmpar
+        build
+    """
+
+    def __init__(self, name, initialization_time, dataset_folder, template_folder,
+                 working_directory, simulation_hours=48, wrf_cores=1, wps_install=None,
+                 wrf_install=None, resume=False, restart_interval=None, max_resubmissions=3,
+                 decompose=False, real_cores=1, omp_threads=None):
+        self.name = name
+        self.initialization_time = initialization_time
+        self.dataset_folder = os.path.abspath(str(dataset_folder))
+        self.template_folder = os.path.abspath(str(template_folder))
+        self.working_directory = os.path.abspath(str(working_directory))
+        self.simulation_hours = simulation_hours
+        self.wrf_cores = wrf_cores
+        self.wps_install = wps_install
+        self.wrf_install = wrf_install
+        self.resume = resume
+        self.restart_interval = restart_interval
+        self.max_resubmissions = max_resubmissions
+        self.decompose = decompose
+        self.real_cores = real_cores
+        self.omp_threads = omp_threads
+
+    def stage_cores(self, stage) -> int:
+        if stage == 'wrf':
+            return self.wrf_cores
+        if stage == 'real':
+            return self.real_cores
+        return 1
+
+    def layout(self, stage, domains) -> decomposition.Layout:
+        """
+        Decomposition of real.exe or wrf.exe within the cores of the stage.
+        """
+        threads = (1,) if stage == 'real' or not self.omp_threads else tuple(self.omp_threads)
+        return decomposition.plan(domains, self.stage_cores(stage), threads)
+
+
+def _prepare(run, manifest):
+    # Provisioning deletes the directories, keep them if the run is resumed
+    if run.wps_install and not (manifest and os.path.isdir('WPS')):
+        workspace.provision(run.wps_install, 'WPS')
+    if run.wrf_install and not (manifest and os.path.isdir('WRF')):
+        workspace.provision(run.wrf_install, 'WRF')
+
+    if not os.path.lexists('template'):
+        os.symlink(run.template_folder, 'template')
+
+    wps_patch = wps.create_namelist_patch(run.initialization_time,
+                                          length_hours=run.simulation_hours)
+    utils.apply_namelist_patch('template/namelist.wps', 'WPS/namelist.wps', wps_patch)
+    shutil.copy('template/Vtable', 'WPS/')
+
+
+def _geogrid(run, manifest):
+    checkpoint.run_stage(manifest, 'geogrid', wps.run_geogrid)
+
+
+def select_grib_files(dataset_folder, initialization_time, simulation_hours, interval=1) -> list:
+    """
+    NAM files from the folder that cover the simulation window, one per valid time.
+
+    Analyses and short lead times are preferred if the folder has several cycles. Valid times
+    without a file, e.g. between the 3 hourly files after 36 hours, are skipped.
+    """
+    dataset = NAMForecast(dataset_folder)
+    end = initialization_time.shift(hours=simulation_hours)
+    return dataset.select_paths(initialization_time, end, interval=interval, strict=False)
+
+
+def _ungrib(run, manifest):
+    link_grib(select_grib_files(run.dataset_folder, run.initialization_time, run.simulation_hours))
+    checkpoint.run_stage(manifest, 'ungrib', wps.run_ungrib)
+
+
+def _metgrid(run, manifest):
+    checkpoint.run_stage(manifest, 'metgrid', wps.run_metgrid)
+
+
+def _real(run, manifest):
+    wrf_patch = wrf.create_namelist_patch(run.initialization_time,
+                                          length_hours=run.simulation_hours,
+                                          restart_interval=run.restart_interval)
+    cores = run.real_cores
+    if run.decompose:
+        layout = run.layout('real', decomposition.domains_from_namelist(wrf_patch['domains']))
+        decomposition.apply_layout(wrf_patch, layout)
+        cores = layout.tasks
+    utils.apply_namelist_patch('template/namelist.input', 'WRF/namelist.input', wrf_patch)
+    if os.path.exists('template/tslist'):
+        shutil.copy('template/tslist', 'WRF/')
+
+    wrf.link_metgrid_outputs('WPS/', 'WRF/')
+    checkpoint.run_stage(manifest, 'real', wrf.run_real, cores)
+
+
+def _wrf(run, manifest):
+    cores, threads = run.wrf_cores, None
+    if run.decompose:
+        namelist = 'WRF/namelist.input'
+        domains = decomposition.domains_from_namelist(f90nml.read(namelist)['domains'])
+        layout = run.layout('wrf', domains)
+        decomposition.write_layout(namelist, layout)
+        cores = layout.tasks
+        threads = layout.threads if run.omp_threads else None
+        log.info('%s: wrf.exe with %i tasks (%i x %i), %i threads', run.name, layout.tasks,
+                 layout.nproc_x, layout.nproc_y, layout.threads)
+
+    if run.restart_interval:
+        checkpoint.run_stage(manifest, 'wrf', wrf.run_wrf_with_restarts, cores,
+                             max_resubmissions=run.max_resubmissions, threads=threads)
+    else:
+        checkpoint.run_stage(manifest, 'wrf', wrf.run_wrf, cores, threads)
+
+
+STAGE_FUNCTIONS = {
+    'prepare': _prepare,
+    'geogrid': _geogrid,
+    'ungrib': _ungrib,
+    'metgrid': _metgrid,
+    'real': _real,
+    'wrf': _wrf,
+}
+
+
+def execute_stage(run, stage) -> None:
+    """
+    Execute one stage of the run. Called in a worker process because it changes the working
+    directory.
+    """
+    os.makedirs(run.working_directory, exist_ok=True)
+    os.chdir(run.working_directory)
+
+    manifest = checkpoint.Manifest('run_state.json') if run.resume else None
+    STAGE_FUNCTIONS[stage](run, manifest)
+
+
+class CoreBudget:
+    """
+    Hands out cores from a fixed budget. Waiting requests are served in the order of their
+    priority, smaller requests with lower priority can use cores that the first request can not use
+    yet.
+    """
+
+    def __init__(self, cores):
+        self.total = cores
+        self.available = cores
+        self.waiting = []
+        self.counter = itertools.count()
+
+    async def acquire(self, cores, priority=0) -> None:
+        if cores > self.total:
+            raise WrfRunnerException('Requested {} cores, the budget is {}'
+                                     .format(cores, self.total))
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.counter), cores, future))
+        self._grant()
+        await future
+
+    def release(self, cores) -> None:
+        self.available += cores
+        self._grant()
+
+    def _grant(self) -> None:
+        remaining = []
+        while self.waiting:
+            request = heapq.heappop(self.waiting)
+            _, _, cores, future = request
+            if cores <= self.available:
+                self.available -= cores
+                future.set_result(None)
+            else:
+                remaining.append(request)
+
+        for request in remaining:
+            heapq.heappush(self.waiting, request)
+
+
+class StageExecutor(abc.ABC):
+    """
+    Executes the stages of several pipelines in a pool of processes that share a core budget.
+    Pipelines earlier in the list get the cores first.
+
+    Subclasses implement _run_pipeline, which runs the stages of one item with run_stages.
+
+    :param cores: the core budget and the number of worker processes
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.budget = None
+        self.pool = None
+
+    async def run_in_pool(self, index, name, stage, cores, function, *args) -> float:
+        """
+        Call the function in a worker process once the cores are available.
+
+        :return: wall time of the stage in seconds
+        """
+        await self.budget.acquire(cores, priority=index)
+        try:
+            log.info('%s: starting %s on %i cores', name, stage, cores)
+            start = time.monotonic()
+            await asyncio.get_event_loop().run_in_executor(self.pool, function, *args)
+            return time.monotonic() - start
+        finally:
+            self.budget.release(cores)
+
+    async def run_stages(self, index, name, stages, stage_cores, function, *args,
+                         stage_times=None):
+        """
+        Run the stages in order as function(*args, stage) until one fails.
+
+        :param stage_cores: function returning the number of cores of a stage
+        :param stage_times: dictionary the wall times of the stages are added to
+        :return: None on success, otherwise the error as 'stage: message'
+        """
+        for stage in stages:
+            try:
+                seconds = await self.run_in_pool(index, name, stage, stage_cores(stage), function,
+                                                 *(args + (stage,)))
+            except Exception as error:
+                log.error('%s: %s failed: %s', name, stage, error)
+                return '{}: {}'.format(stage, error)
+
+            if stage_times is not None:
+                stage_times[stage] = seconds
+
+        return None
+
+    @abc.abstractmethod
+    async def _run_pipeline(self, index, item):
+        pass
+
+    async def run_async(self, items) -> list:
+        self.budget = CoreBudget(self.cores)
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.cores)
+        try:
+            return await asyncio.gather(*[self._run_pipeline(i, item)
+                                          for i, item in enumerate(items)])
+        finally:
+            self.pool.shutdown()
+
+    def run(self, items) -> list:
+        """
+        Execute the pipelines of the items and return the list of their results.
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async(items))
+        finally:
+            loop.close()
+
+
+class Scheduler(StageExecutor):
+    """
+    Runs several simulations on one node. The stages of every run are executed in order, the runs
+    share a core budget so the WPS stages of one run overlap with wrf.exe of another one.
+    Runs earlier in the list get the cores first.
+
+    run returns a list of RunResults.
+    """
+
+    async def _run_pipeline(self, index, run) -> RunResult:
+        stage_times = collections.OrderedDict()
+        error = await self.run_stages(index, run.name, STAGES, run.stage_cores, execute_stage, run,
+                                      stage_times=stage_times)
+        if error:
+            return RunResult(run.name, 'failed', stage_times, error)
+
+        log.info('%s: finished', run.name)
+        return RunResult(run.name, 'success', stage_times, None)
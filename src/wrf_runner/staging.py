@@ -0,0 +1,201 @@
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import os
+import time
+
+from .exceptions import WrfRunnerException
+from .linkgrib import link_grib
+
+log = logging.getLogger('staging')
+
+BLOCK_SIZE = 4 * 2 ** 20
+CHECKSUM_SUFFIX = '.sha256'
+
+
+_StagingResult = collections.namedtuple('StagingResult',
+                                        ['files', 'copied', 'skipped', 'bytes', 'seconds'])
+
+
+class StagingResult(_StagingResult):
+    """
+    Summary of a staging run: local paths of the files, number of copied and skipped files,
+    bytes copied and the wall time.
+    """
+
+    @property
+    def throughput(self) -> float:
+        """
+        Copied megabytes per second.
+        """
+        return self.bytes / 2 ** 20 / self.seconds if self.seconds else 0.0
+
+
+def select_window(dataset, start, end) -> list:
+    """
+    Files of a dataset valid between start and end, inclusive.
+
+    :param dataset: a datasets.sources.Dataset, which selects the files lazily, or NAM or
+        NAM_forecast
+    """
+    if hasattr(dataset, 'select_paths'):
+        return dataset.select_paths(start, end)
+
+    selected = []
+    for valid_time, files in sorted(dataset.dates.items()):
+        if start <= valid_time <= end:
+            selected.extend([files] if isinstance(files, str) else files)
+    return selected
+
+
+def _read_checksum_file(path):
+    """
+    The fields of the checksum file next to the path, None if there is none.
+    """
+    try:
+        with open(path + CHECKSUM_SUFFIX) as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return None
+
+
+def source_checksum(path):
+    """
+    SHA-256 of the source file published next to it as <path>.sha256 in the sha256sum format,
+    None if the archive has no checksum for the file.
+    """
+    fields = _read_checksum_file(path)
+    return fields[0].lower() if fields else None
+
+
+class GribStager:
+    """
+    Copies GRIB files from a slow filesystem to local scratch with a pool of threads.
+
+    A file is staged as scratch/<name>. It is skipped if the staged copy has the size and the
+    modification time of the source (and a recorded checksum if checksums are used). Every copy
+    goes to a temporary name first, its size and optionally its SHA-256 are verified before
+    it is renamed into place.
+
+    :param scratch: local directory for the copies
+    :param workers: number of files copied at the same time
+    :param checksum: verify the copies with SHA-256 and keep the checksum next to them
+    """
+
+    def __init__(self, scratch, workers=4, checksum=True):
+        self.scratch = os.path.abspath(str(scratch))
+        self.workers = workers
+        self.checksum = checksum
+
+        os.makedirs(self.scratch, exist_ok=True)
+
+    def destination(self, source) -> str:
+        return os.path.join(self.scratch, os.path.basename(source))
+
+    def is_staged(self, source, source_stat) -> bool:
+        destination = self.destination(source)
+        try:
+            stat = os.stat(destination)
+        except FileNotFoundError:
+            return False
+
+        if stat.st_size != source_stat.st_size or stat.st_mtime_ns != source_stat.st_mtime_ns:
+            return False
+
+        if not self.checksum:
+            return True
+
+        # The record must describe this copy of the file, not an earlier one
+        record = _read_checksum_file(destination)
+        if record is None or record[1:] != [str(stat.st_size), str(stat.st_mtime_ns)]:
+            return False
+
+        expected = source_checksum(source)
+        return expected is None or record[0] == expected
+
+    def copy(self, source, source_stat) -> None:
+        destination = self.destination(source)
+        temporary = os.path.join(self.scratch, '.' + os.path.basename(source) + '.part')
+
+        digest = hashlib.sha256()
+        with open(source, 'rb') as src, open(temporary, 'wb') as dst:
+            for block in iter(lambda: src.read(BLOCK_SIZE), b''):
+                dst.write(block)
+                if self.checksum:
+                    digest.update(block)
+
+        size = os.path.getsize(temporary)
+        if size != source_stat.st_size:
+            os.remove(temporary)
+            raise WrfRunnerException('Staging of "{}" failed, copied {} of {} bytes'.format(
+                source, size, source_stat.st_size))
+
+        expected = source_checksum(source) if self.checksum else None
+        if expected is not None and digest.hexdigest() != expected:
+            os.remove(temporary)
+            raise WrfRunnerException('Staging of "{}" failed, the checksum does not match {}'
+                                     .format(source, source + CHECKSUM_SUFFIX))
+
+        os.utime(temporary, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(temporary, destination)
+
+        if self.checksum:
+            with open(destination + CHECKSUM_SUFFIX, 'w') as f:
+                f.write('{} {} {}\n'.format(digest.hexdigest(), size, source_stat.st_mtime_ns))
+
+    def _stage_one(self, source) -> int:
+        """
+        Stage one file, returns the number of copied bytes.
+        """
+        source_stat = os.stat(source)
+        if self.is_staged(source, source_stat):
+            log.debug('Already staged: %s', source)
+            return -1
+
+        log.debug('Staging: %s', source)
+        self.copy(source, source_stat)
+        return source_stat.st_size
+
+    def stage(self, files) -> StagingResult:
+        """
+        Copy the files to scratch.
+
+        :param files: paths of the files on the slow filesystem
+        :return: StagingResult with the local paths in the order of the files
+        """
+        files = [str(file) for file in files]
+        names = [os.path.basename(file) for file in files]
+        if len(set(names)) != len(names):
+            raise WrfRunnerException('The staged files must have unique names')
+
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            sizes = list(pool.map(self._stage_one, files))
+        seconds = time.monotonic() - start
+
+        copied = [size for size in sizes if size >= 0]
+        result = StagingResult([self.destination(file) for file in files], len(copied),
+                               len(sizes) - len(copied), sum(copied), seconds)
+
+        log.info('Staged %i files (%i already staged), %.1f MB in %.1f s, %.1f MB/s',
+                 result.copied, result.skipped, result.bytes / 2 ** 20, result.seconds,
+                 result.throughput)
+        return result
+
+
+def stage_and_link(files, scratch, directory='WPS', workers=4, checksum=True,
+                   delete_links=True) -> StagingResult:
+    """
+    Stage the files to local scratch and link the local copies into the WPS directory.
+
+    :param files: paths of the GRIB files, e.g. from select_window
+    :param scratch: local directory for the copies
+    :param directory: the directory where the GRIBFILE links are created
+    :param workers: number of files copied at the same time
+    :param checksum: record and verify the checksums of the copies, see GribStager
+    :param delete_links: passed to link_grib
+    """
+    result = GribStager(scratch, workers, checksum).stage(files)
+    link_grib(result.files, delete_links=delete_links, directory=directory)
+    return result
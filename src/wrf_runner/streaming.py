@@ -0,0 +1,42 @@
+"""
+Runs of metgrid.exe and wrf.exe that report their output files while the program is running.
+
+The functions are asynchronous generators, which need Python 3.6. The module is not imported by
+the rest of the package, import it only where the streaming is used.
+"""
+import asyncio
+
+from . import watcher, wps, wrf
+
+
+async def run_metgrid_streaming(progress=None, settle=1.0):
+    """
+    Run metgrid.exe and yield the paths of the met_em files as soon as they are complete.
+
+    The files from an earlier run are reported only if metgrid writes them again. The exception
+    of a failed run is raised after the last file was yielded.
+    """
+    run = asyncio.ensure_future(wps.run_wps_program_async('metgrid', progress=progress))
+
+    async for path in watcher.watch_outputs('WPS/', watcher.MET_EM_PATTERNS, stop=run,
+                                            settle=settle, existing=False):
+        yield path
+
+    await run
+
+
+async def run_wrf_streaming(cores, progress=None, fatal_patterns=None, settle=1.0):
+    """
+    Run wrf.exe and yield the paths of the wrfout files as soon as they are complete.
+
+    The files from an earlier run are reported only if wrf.exe writes them again. The exception
+    of a failed run is raised after the last file was yielded.
+    """
+    run = asyncio.ensure_future(wrf.run_wrf_async(cores, progress=progress,
+                                                  fatal_patterns=fatal_patterns))
+
+    async for path in watcher.watch_outputs('WRF/', watcher.WRFOUT_PATTERNS, stop=run,
+                                            settle=settle, existing=False):
+        yield path
+
+    await run
@@ -0,0 +1,111 @@
+import copy
+import io
+import logging
+import os
+
+import f90nml
+
+log = logging.getLogger('templates')
+
+# Parsed templates by absolute path, each entry is ((mtime, size), NamelistTemplate)
+_templates = {}
+
+
+class NamelistTemplate:
+    """
+    Parsed namelist that renders patched copies of itself without parsing the file again.
+
+    The text of the groups that are not touched by a patch is rendered only once. The output does
+    not keep the comments and the formatting of the template file.
+    """
+
+    def __init__(self, namelist):
+        self.namelist = namelist
+        self._group_text = {}
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(f90nml.read(str(path)))
+
+    def _render_group(self, name, group) -> str:
+        single = f90nml.Namelist()
+        single[name] = group
+
+        text = io.StringIO()
+        single.write(text)
+        return text.getvalue()
+
+    def _unpatched_group(self, name) -> str:
+        text = self._group_text.get(name)
+        if text is None:
+            text = self._render_group(name, self.namelist[name])
+            self._group_text[name] = text
+        return text
+
+    def render(self, patch) -> str:
+        """
+        Return the text of the namelist with the patch applied, the same patch as for f90nml.patch.
+        """
+        patch = {name.lower(): values for name, values in patch.items()}
+
+        parts = []
+        for name in self.namelist:
+            if name in patch:
+                group = copy.copy(self.namelist[name])
+                for variable, value in patch[name].items():
+                    group[variable] = value
+                parts.append(self._render_group(name, group))
+            else:
+                parts.append(self._unpatched_group(name))
+
+        for name, values in patch.items():
+            if name not in self.namelist:
+                parts.append(self._render_group(name, f90nml.Namelist(values)))
+
+        return '\n'.join(parts)
+
+    def write(self, path, patch) -> None:
+        with open(str(path), 'w') as f:
+            f.write(self.render(patch))
+
+    def write_many(self, jobs) -> int:
+        """
+        Write many patched namelists.
+
+        :param jobs: iterable of tuples (output path, patch)
+        :return: number of written namelists
+        """
+        count = 0
+        for path, patch in jobs:
+            self.write(path, patch)
+            count += 1
+        return count
+
+
+def get_template(path) -> NamelistTemplate:
+    """
+    Return the parsed template, the file is parsed again only if its size or mtime changed.
+    """
+    path = os.path.abspath(str(path))
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _templates.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    log.debug('Parsing template "%s"', path)
+    template = NamelistTemplate.from_file(path)
+    _templates[path] = (signature, template)
+    return template
+
+
+def load_namelist(path) -> f90nml.Namelist:
+    """
+    Parsed namelist from the template cache. The result is shared and must not be modified.
+    """
+    return get_template(path).namelist
+
+
+def clear_cache() -> None:
+    _templates.clear()
@@ -0,0 +1,305 @@
+"""
+Reader of the time series that WRF writes for the stations in tslist. Requires numpy.
+
+WRF writes one file per station and variable group: <prefix>.d<domain>.TS with the surface
+variables and the profile files (.UU, .VV, .PH, .QV, .TH, ...) with one column per model level.
+The files are parsed in parallel into one array per variable with the shape (stations, times) or
+(stations, times, levels). The reader remembers how far every file was read, so it can be
+updated while WRF is still writing.
+"""
+import collections
+import concurrent.futures
+import glob
+import io
+import logging
+import os
+
+import numpy as np
+
+from .exceptions import WrfRunnerException
+
+log = logging.getLogger('tslist')
+
+# Header line of every station file, e.g. (on one line)
+# "Cape Hallett               1  1 hallt ( -72.330, 170.250) (  81,  52) ( -72.331, 170.243)
+#  12.3 meters"
+# WRF writes the name, the domain and the station index with the fixed widths A26, I2, I3, the
+# columns run together once the index has three digits
+HEADER_NAME = slice(0, 26)
+HEADER_DOMAIN = slice(26, 28)
+HEADER_INDEX = slice(28, 31)
+
+Station = collections.namedtuple('Station', ['name', 'domain', 'index', 'prefix', 'lat', 'lon',
+                                             'i', 'j', 'grid_lat', 'grid_lon', 'elevation'])
+
+# Columns of the .TS files, newer versions of WRF append more columns which get generic names
+TS_COLUMNS = ['grid_id', 'hour', 'station_index', 'ix', 'iy', 't', 'q', 'u', 'v', 'psfc', 'glw',
+              'gsw', 'hfx', 'lh', 'tsk', 'tslb1', 'rainc', 'rainnc', 'clw']
+# Columns that are the same for all rows and are not stored
+TS_SKIPPED = {'grid_id', 'hour', 'station_index', 'ix', 'iy'}
+
+PROFILE_EXTENSIONS = ['UU', 'VV', 'WW', 'PH', 'QV', 'TH', 'PR']
+
+
+def parse_header(line) -> Station:
+    # prefix (lat, lon) (i, j) (grid_lat, grid_lon) elevation meters
+    fields = line[HEADER_INDEX.stop:].translate(str.maketrans('(),', '   ')).split()
+    try:
+        if len(fields) != 9 or fields[8] != 'meters':
+            raise ValueError
+        return Station(line[HEADER_NAME].strip(), int(line[HEADER_DOMAIN]),
+                       int(line[HEADER_INDEX]), fields[0], float(fields[1]), float(fields[2]),
+                       int(fields[3]), int(fields[4]), float(fields[5]), float(fields[6]),
+                       float(fields[7]))
+    except ValueError:
+        raise WrfRunnerException('Not a tslist header: "{}"'.format(line.strip()))
+
+
+def parse_rows(data, columns=None):
+    """
+    Parse whitespace separated numbers into a 2D float array.
+
+    The lines are parsed by the C parser of numpy.loadtxt, there is no Python loop per line.
+
+    :param data: bytes with complete lines
+    :param columns: number of columns of an empty result
+    :return: array with the shape (lines, columns)
+    """
+    if not data.strip():
+        return np.empty((0, columns or 0))
+
+    try:
+        return np.loadtxt(io.BytesIO(data), dtype=np.float64, ndmin=2)
+    except ValueError as e:
+        raise WrfRunnerException('Can not parse the rows of a tslist file: {}'.format(e))
+
+
+def read_chunk(path, offset=0):
+    """
+    Read the complete lines of a station file after offset.
+
+    :return: tuple (Station or None if the header was read before, array of the rows, new offset)
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+
+    end = data.rfind(b'\n') + 1
+    data = data[:end]
+
+    station = None
+    if offset == 0 and data:
+        header_end = data.find(b'\n') + 1
+        station = parse_header(data[:header_end].decode(errors='replace'))
+        data = data[header_end:]
+
+    return station, parse_rows(data), offset + end
+
+
+def station_files(directory='WRF/', domain=1) -> dict:
+    """
+    Files of the stations in the directory.
+
+    :return: dictionary prefix -> dictionary extension -> path
+    """
+    files = collections.defaultdict(dict)
+    for path in glob.glob(os.path.join(str(directory), '*.d{:02d}.*'.format(domain))):
+        prefix, _, extension = os.path.basename(path).rpartition('.d{:02d}.'.format(domain))
+        if extension == 'TS' or extension in PROFILE_EXTENSIONS:
+            files[prefix][extension] = path
+    return dict(files)
+
+
+class TimeSeries:
+    """
+    Columnar store of the time series of all stations.
+
+    :param stations: list of Station
+    :param hours: array of the hours since the start of the simulation
+    :param variables: dictionary name -> array (stations, times) for the surface variables and
+        (stations, times, levels) for the profiles, named by the lower case extension, e.g. 'uu'
+    """
+
+    def __init__(self, stations, hours, variables):
+        self.stations = stations
+        self.hours = hours
+        self.variables = variables
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def station(self, name) -> dict:
+        """
+        All variables of one station, by its name or prefix.
+        """
+        for index, station in enumerate(self.stations):
+            if name in (station.name, station.prefix):
+                return {variable: values[index] for variable, values in self.variables.items()}
+        raise KeyError(name)
+
+    def save(self, path) -> None:
+        """
+        Save as an uncompressed .npz file, one array per variable. The arrays are named
+        station_<field>, hours and variable_<name>, so the names never collide.
+        """
+        arrays = {'station_{}'.format(field): np.array([getattr(station, field)
+                                                        for station in self.stations])
+                  for field in Station._fields}
+        arrays['hours'] = self.hours
+        arrays.update(('variable_{}'.format(name), values)
+                      for name, values in self.variables.items())
+        np.savez(str(path), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(str(path)) as data:
+            fields = [data['station_{}'.format(field)].tolist() for field in Station._fields]
+            stations = [Station(*values) for values in zip(*fields)]
+            variables = {name[len('variable_'):]: data[name] for name in data.files
+                         if name.startswith('variable_')}
+            return cls(stations, data['hours'], variables)
+
+
+def _read_file(path, offset):
+    return path, read_chunk(path, offset)
+
+
+class TimeSeriesReader:
+    """
+    Incremental parallel reader of the station files in a directory.
+
+    Every update reads only the lines written since the previous update. Incomplete last lines
+    are left for the next update.
+
+    :param directory: directory with the station files, usually WRF/
+    :param domain: domain number
+    :param extensions: which files to read, None for TS and all profiles
+    :param workers: number of processes, 0 to parse in this process
+    """
+
+    def __init__(self, directory='WRF/', domain=1, extensions=None, workers=4):
+        self.directory = str(directory)
+        self.domain = domain
+        self.extensions = extensions
+        self.workers = workers
+
+        self.stations = {}
+        self._offsets = {}
+        # (prefix, extension) -> list of arrays of rows
+        self._chunks = collections.defaultdict(list)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _files(self) -> list:
+        result = []
+        for prefix, files in sorted(station_files(self.directory, self.domain).items()):
+            for extension, path in sorted(files.items()):
+                if self.extensions is None or extension in self.extensions:
+                    result.append((prefix, extension, path))
+        return result
+
+    def _check_rewritten(self, files) -> None:
+        """
+        Start again from the beginning of the files that are shorter than what was read, WRF
+        rewrites them when it is restarted.
+        """
+        for prefix, extension, path in files:
+            offset = self._offsets.get(path, 0)
+            if offset and os.path.getsize(path) < offset:
+                log.info('"%s" was rewritten, reading it again', path)
+                self._offsets[path] = 0
+                self._chunks.pop((prefix, extension), None)
+
+    def update(self) -> int:
+        """
+        Read the new lines of all station files.
+
+        :return: number of rows read
+        """
+        files = self._files()
+        self._check_rewritten(files)
+        offsets = [self._offsets.get(path, 0) for _, _, path in files]
+        paths = [path for _, _, path in files]
+
+        if self.workers:
+            if self._pool is None:
+                self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            chunksize = max(1, len(paths) // (4 * self.workers))
+            chunks = self._pool.map(_read_file, paths, offsets, chunksize=chunksize)
+        else:
+            chunks = map(_read_file, paths, offsets)
+
+        rows = 0
+        keys = {path: (prefix, extension) for prefix, extension, path in files}
+        for path, (station, values, offset) in chunks:
+            prefix, extension = keys[path]
+            if station is not None:
+                self.stations[prefix] = station
+            if len(values):
+                self._chunks[prefix, extension].append(values)
+                rows += len(values)
+            self._offsets[path] = offset
+
+        log.debug('%i rows read from %i station files', rows, len(files))
+        return rows
+
+    def _rows(self, prefix, extension):
+        chunks = self._chunks.get((prefix, extension))
+        if not chunks:
+            return None
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def time_series(self) -> TimeSeries:
+        """
+        The data read so far. All stations are cut to the number of times the slowest one has.
+        """
+        prefixes = sorted(self.stations, key=lambda prefix: self.stations[prefix].index)
+        stations = [self.stations[prefix] for prefix in prefixes]
+        extensions = sorted({extension for _, extension in self._chunks})
+
+        rows = {(prefix, extension): self._rows(prefix, extension)
+                for prefix in prefixes for extension in extensions}
+        available = [len(values) if values is not None else 0 for values in rows.values()]
+        times = min(available) if available else 0
+
+        variables = {}
+        hours = np.empty(0)
+        if times == 0:
+            return TimeSeries(stations, hours, variables)
+
+        for extension in extensions:
+            stacked = np.stack([rows[prefix, extension][:times] for prefix in prefixes])
+            if extension == 'TS':
+                hours = stacked[0, :, 1]
+                columns = TS_COLUMNS + ['column{}'.format(i)
+                                        for i in range(len(TS_COLUMNS), stacked.shape[2])]
+                for index, name in enumerate(columns[:stacked.shape[2]]):
+                    if name not in TS_SKIPPED:
+                        variables[name] = stacked[:, :, index]
+            else:
+                if 'TS' not in extensions:
+                    hours = stacked[0, :, 0]
+                variables[extension.lower()] = stacked[:, :, 1:]
+
+        return TimeSeries(stations, hours, variables)
+
+
+def read_time_series(directory='WRF/', domain=1, extensions=None, workers=4) -> TimeSeries:
+    """
+    Read all station files of the domain at once.
+    """
+    with TimeSeriesReader(directory, domain, extensions, workers) as reader:
+        reader.update()
+        return reader.time_series()
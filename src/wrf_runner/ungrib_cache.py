@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import logging
+import os
+import shutil
+
+import f90nml
+
+from . import wps
+from .cache import FileCache, file_hash
+from .exceptions import WrfRunnerException
+from .linkgrib import link_grib
+from .parallel import read_time_window, time_steps, to_datetime, create_time_patch
+
+log = logging.getLogger('ungrib_cache')
+
+
+def intermediate_file_name(prefix, time) -> str:
+    """
+    Name of the ungrib output for the time, e.g. FILE:2016-01-01_00
+    """
+    if time.second:
+        return '{}:{}'.format(prefix, time.strftime('%Y-%m-%d_%H:%M:%S'))
+    if time.minute:
+        return '{}:{}'.format(prefix, time.strftime('%Y-%m-%d_%H:%M'))
+    return '{}:{}'.format(prefix, time.strftime('%Y-%m-%d_%H'))
+
+
+def continuous_groups(steps, all_steps) -> list:
+    """
+    Split the steps into groups that are continuous in all_steps.
+    """
+    positions = {step: i for i, step in enumerate(all_steps)}
+
+    groups = []
+    for step in steps:
+        if groups and positions[groups[-1][-1]] + 1 == positions[step]:
+            groups[-1].append(step)
+        else:
+            groups.append([step])
+
+    return groups
+
+
+class UngribCache(FileCache):
+    """
+    Cache of ungrib intermediate files keyed by the content of the GRIB files, the Vtable and
+    the valid time.
+
+    Counts hits and misses of the lookups.
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None):
+        super().__init__(directory, max_size, max_age)
+        self.hits = 0
+        self.misses = 0
+        self.grib_hashes = {}
+
+    def grib_hash(self, path) -> str:
+        # GRIB files are large, hash every file only once per cache instance
+        stat = os.stat(str(path))
+        identity = (os.path.abspath(str(path)), stat.st_size, stat.st_mtime)
+
+        if identity not in self.grib_hashes:
+            self.grib_hashes[identity] = file_hash(path)
+
+        return self.grib_hashes[identity]
+
+    def key(self, grib_files, vtable_hash, time) -> str:
+        digest = hashlib.sha256()
+        for grib_hash in sorted(self.grib_hash(file) for file in grib_files):
+            digest.update(grib_hash.encode())
+        digest.update(vtable_hash.encode())
+        digest.update(time.isoformat().encode())
+        return digest.hexdigest()
+
+    def restore(self, key, destination, link=False, expected=None) -> bool:
+        """
+        Restore the entry, an entry without the expected file name counts as a miss.
+        """
+        found = super().restore(key, destination, link)
+        if found and expected is not None:
+            found = os.path.exists(os.path.join(str(destination), expected))
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+
+def _run_ungrib_window(files, start, end, namelist) -> None:
+    backup = namelist + '.orig'
+    shutil.copy(namelist, backup)
+    try:
+        f90nml.patch(backup, create_time_patch(backup, start, end), namelist)
+
+        link_grib([os.path.abspath(str(file)) for file in files])
+        wps.run_ungrib()
+    finally:
+        os.replace(backup, namelist)
+
+
+def input_times(step, grib_times) -> list:
+    """
+    Times of the GRIB files ungrib uses for the step: the step itself if it has GRIB files,
+    otherwise the closest times before and after it which ungrib interpolates between.
+
+    :param grib_times: sorted list of the times with GRIB files
+    """
+    if step in grib_times:
+        return [step]
+
+    before = [time for time in grib_times if time < step]
+    after = [time for time in grib_times if time > step]
+    return before[-1:] + after[:1]
+
+
+def run_ungrib_cached(cache, files_by_time) -> None:
+    """
+    Get the intermediate files from the cache and run ungrib only for the times that are not
+    cached.
+
+    Every time step of the namelist.wps window is cached, including the steps without GRIB files
+    that ungrib interpolates; their keys are built from the GRIB files on both sides. Times
+    missing in the cache are processed in continuous groups, each one by a separate run of ungrib
+    with the window of namelist.wps restricted to the GRIB files around the group.
+
+    :param cache: UngribCache instance
+    :param files_by_time: dictionary time -> file or list of files, e.g. NAM_forecast.dates
+    """
+    namelist = os.path.join('WPS', 'namelist.wps')
+    start, end, interval = read_time_window(namelist)
+    prefix = f90nml.read(namelist)['ungrib'].get('prefix', 'FILE')
+    vtable_hash = file_hash(os.path.join('WPS', 'Vtable'))
+
+    files_by_time = {to_datetime(time): files for time, files in files_by_time.items()}
+    files_by_time = {time: [files] if isinstance(files, str) else list(files)
+                     for time, files in files_by_time.items()}
+    grib_times = sorted(files_by_time)
+
+    steps = time_steps(start, end, interval)
+    inputs = {step: input_times(step, grib_times) for step in steps}
+
+    for file in glob.glob(os.path.join('WPS', prefix + ':*')):
+        os.remove(file)
+
+    def output(step):
+        return os.path.join('WPS', intermediate_file_name(prefix, step))
+
+    keys = {}
+    missing = []
+    for step in steps:
+        step_files = [file for time in inputs[step] for file in files_by_time[time]]
+        keys[step] = cache.key(step_files, vtable_hash, step)
+        if not cache.restore(keys[step], 'WPS', expected=intermediate_file_name(prefix, step)):
+            missing.append(step)
+
+    for group in continuous_groups(missing, steps):
+        window = sorted(set(inputs[group[0]] + inputs[group[-1]]))
+        if not window:
+            raise WrfRunnerException('No GRIB files around {} - {}'.format(group[0], group[-1]))
+
+        log.info('Running ungrib for %s - %s', group[0], group[-1])
+        group_files = [file for time in grib_times if window[0] <= time <= window[-1]
+                       for file in files_by_time[time]]
+        _run_ungrib_window(group_files, window[0], window[-1], namelist)
+
+        for step in group:
+            if not os.path.exists(output(step)):
+                raise WrfRunnerException('ungrib did not create {}'.format(output(step)))
+            cache.store(keys[step], [output(step)])
+
+    log.info('Ungrib cache: %i hits, %i misses', cache.hits, cache.misses)
+    cache.prune()
@@ -1,10 +1,9 @@
-import f90nml
+from . import logs, templates
 
 
 def get_last_line(file) -> str:
-    with open(file, 'r') as f:
-        return f.readlines()[-1]
+    return logs.get_last_line(file)
 
 
 def apply_namelist_patch(template_namelist, output_namelist, patch: dict) -> None:
-    f90nml.patch(template_namelist, patch, output_namelist)
+    templates.get_template(template_namelist).write(output_namelist, patch)
@@ -0,0 +1,265 @@
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import struct
+import sys
+import time
+
+log = logging.getLogger('watcher')
+
+# Constants from sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+MET_EM_PATTERNS = ['met_em.*.nc']
+WRFOUT_PATTERNS = ['wrfout_d0*']
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+_libc = _load_libc()
+
+
+def inotify_available() -> bool:
+    return _libc is not None
+
+
+class _Inotify:
+    """
+    Minimal inotify watch of one directory, the events are read when the event loop reports the
+    descriptor as readable.
+    """
+
+    def __init__(self, directory, loop):
+        self.loop = loop
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        if _libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, 'inotify_add_watch failed for "{}"'.format(directory))
+
+        self.events = asyncio.Queue()
+        loop.add_reader(self.fd, self._read)
+
+    def _read(self) -> None:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = data[position:position + length].rstrip(b'\0').decode(errors='replace')
+            position += length
+            self.events.put_nowait((name, mask))
+
+    def close(self) -> None:
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _Outputs:
+    """
+    State of the watched files: the candidates that are not complete yet and the reported files.
+    """
+
+    def __init__(self, directory, patterns, settle, use_inotify):
+        self.directory = directory
+        self.patterns = patterns
+        self.settle = settle
+        self.use_inotify = use_inotify
+
+        self.reported = set()
+        # name -> (signature, monotonic time of the last change, closed after the last write)
+        self.candidates = {}
+        # Signatures of the files from before the start that are not reported until they change
+        self.baseline = {}
+
+    def matches(self, name) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def scan(self) -> list:
+        with os.scandir(self.directory) as entries:
+            return [entry.name for entry in entries if self.matches(entry.name)]
+
+    def start(self, existing) -> None:
+        for name in self.scan():
+            if existing:
+                self.touch(name, True)
+            else:
+                self.baseline[name] = _signature(os.path.join(self.directory, name))
+
+    def touch(self, name, closed) -> None:
+        signature = _signature(os.path.join(self.directory, name))
+        if name in self.baseline:
+            if self.baseline[name] == signature:
+                return
+            del self.baseline[name]
+
+        previous = self.candidates.get(name)
+        if previous is None or previous[0] != signature:
+            self.candidates[name] = (signature, time.monotonic(), closed)
+        elif closed:
+            self.candidates[name] = (previous[0], previous[1], True)
+
+    def event(self, name, mask) -> None:
+        if name not in self.reported and self.matches(name):
+            self.touch(name, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def rescan(self, closed) -> None:
+        for name in self.scan():
+            if name not in self.reported:
+                self.touch(name, closed)
+
+    def _settled(self, closed) -> bool:
+        return closed or not self.use_inotify
+
+    def ready(self, final) -> list:
+        """
+        Paths of the files that are complete, all remaining candidates if final.
+        """
+        now = time.monotonic()
+        result = []
+        for name in sorted(self.candidates):
+            signature, changed, closed = self.candidates[name]
+            current = _signature(os.path.join(self.directory, name))
+            if current is None:
+                del self.candidates[name]
+                continue
+            if current != signature:
+                self.candidates[name] = (current, now, False)
+                if not final:
+                    continue
+            if final or (now - changed >= self.settle and self._settled(closed)):
+                result.append(os.path.join(self.directory, name))
+                del self.candidates[name]
+                self.reported.add(name)
+        return result
+
+    def timeout(self, poll_interval) -> float:
+        """
+        Seconds until the next candidate settles, at most poll_interval.
+        """
+        deadlines = [changed + self.settle for _, changed, closed in self.candidates.values()
+                     if self._settled(closed)]
+        if not deadlines:
+            return poll_interval
+        return max(0.0, min(poll_interval, min(deadlines) - time.monotonic()))
+
+
+def _drain(inotify, outputs) -> None:
+    try:
+        while True:
+            outputs.event(*inotify.events.get_nowait())
+    except asyncio.QueueEmpty:
+        pass
+
+
+async def _wait(outputs, inotify, stop, timeout) -> None:
+    """
+    Wait for the timeout, the stop future or the next inotify event.
+    """
+    waiters = [asyncio.ensure_future(asyncio.sleep(timeout))]
+    if stop is not None:
+        waiters.append(stop)
+    event = asyncio.ensure_future(inotify.events.get()) if inotify else None
+    if event is not None:
+        waiters.append(event)
+
+    done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for waiter in pending:
+        if waiter is not stop:
+            waiter.cancel()
+    if event in done:
+        outputs.event(*event.result())
+
+
+async def watch_outputs(directory, patterns, stop=None, settle=1.0, poll_interval=1.0,
+                        use_inotify=None, existing=True):
+    """
+    Yield the files in the directory that match the patterns as soon as they are complete.
+
+    A file is complete when its size and modification time did not change for `settle` seconds.
+    With inotify the file also has to be closed after its last write. Without inotify the
+    directory is scanned every poll_interval seconds.
+
+    When `stop` (a future or a task, e.g. the running program) is done, all remaining matching
+    files are yielded and the generator ends.
+
+    :param directory: watched directory
+    :param patterns: glob patterns of the file names, e.g. MET_EM_PATTERNS or WRFOUT_PATTERNS
+    :param stop: future that ends the watching, None to watch until the generator is closed
+    :param settle: seconds the file must stay unchanged
+    :param poll_interval: seconds between the checks of the files
+    :param use_inotify: None to use inotify when it is available
+    :param existing: report the files that exist at the start, otherwise they are reported only
+        after they are rewritten
+    """
+    directory = str(directory)
+    if use_inotify is None:
+        use_inotify = inotify_available()
+
+    outputs = _Outputs(directory, patterns, settle, use_inotify)
+    inotify = _Inotify(directory, asyncio.get_event_loop()) if use_inotify else None
+    try:
+        outputs.start(existing)
+
+        while True:
+            finished = stop is not None and stop.done()
+
+            if inotify:
+                _drain(inotify, outputs)
+            else:
+                outputs.rescan(closed=False)
+
+            if finished:
+                # The writer is gone, everything that is left is complete
+                outputs.rescan(closed=True)
+                for path in outputs.ready(final=True):
+                    yield path
+                return
+
+            for path in outputs.ready(final=False):
+                yield path
+
+            await _wait(outputs, inotify, stop, outputs.timeout(poll_interval))
+    finally:
+        if inotify:
+            inotify.close()
@@ -0,0 +1,145 @@
+import fnmatch
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger('workspace')
+
+# Files that are modified or created by the runner or the programs. They are never linked.
+MUTABLE_PATTERNS = [
+    'namelist.*', 'Vtable', 'tslist', '*.log', 'rsl.*',
+    'GRIBFILE.*', 'FILE:*', 'geo_em.*', 'met_em.*',
+    'wrfinput_*', 'wrfbdy_*', 'wrflowinp_*', 'wrfout_*', 'wrfrst_*',
+]
+
+# ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(source, destination) -> bool:
+    """
+    Create a copy-on-write clone of the file. Returns False if the filesystem does not support it.
+    """
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        return False
+
+    shutil.copystat(source, destination)
+    return True
+
+
+def is_mutable(name, patterns) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def contains_mutable(directory, patterns) -> bool:
+    for _, _, files in os.walk(directory):
+        if any(is_mutable(name, patterns) for name in files):
+            return True
+    return False
+
+
+class Provisioner:
+    """
+    Builds a working directory that links to the installation and copies only the mutable files.
+    """
+
+    def __init__(self, source, destination, mutable_patterns=None, use_reflink=True):
+        self.source = os.path.abspath(str(source))
+        self.destination = str(destination)
+        self.mutable_patterns = MUTABLE_PATTERNS if mutable_patterns is None else mutable_patterns
+        self.use_reflink = use_reflink
+
+        self.stats = {'linked': 0, 'copied': 0, 'reflinked': 0, 'bytes_written': 0}
+
+    def link_target(self, path) -> str:
+        """
+        Target for a link to the symbolic link `path` from the source. Relative links pointing
+        outside of the source tree are made absolute.
+        """
+        target = os.readlink(path)
+        if os.path.isabs(target):
+            return target
+
+        resolved = os.path.normpath(os.path.join(os.path.dirname(path), target))
+        if resolved == self.source or resolved.startswith(self.source + os.sep):
+            return target
+
+        return resolved
+
+    def copy(self, source, destination) -> None:
+        if self.use_reflink and reflink(source, destination):
+            self.stats['reflinked'] += 1
+            return
+
+        shutil.copy2(source, destination)
+        self.stats['copied'] += 1
+        self.stats['bytes_written'] += os.path.getsize(destination)
+
+    def link(self, source, destination) -> None:
+        os.symlink(source, destination)
+        self.stats['linked'] += 1
+
+    def provision_directory(self, source, destination) -> None:
+        os.makedirs(destination, exist_ok=True)
+
+        for entry in os.scandir(source):
+            target = os.path.join(destination, entry.name)
+
+            if entry.is_symlink() and is_mutable(entry.name, self.mutable_patterns):
+                # E.g. the Vtable link left by link_vtable. Writing the file through a link would
+                # modify the installation, the runner writes a regular file instead
+                log.debug('Skipping the mutable link "%s"', entry.path)
+            elif entry.is_symlink():
+                self.link(self.link_target(entry.path), target)
+            elif entry.is_dir():
+                if contains_mutable(entry.path, self.mutable_patterns):
+                    self.provision_directory(entry.path, target)
+                else:
+                    # Nothing inside is ever modified, link the whole directory
+                    self.link(entry.path, target)
+            elif is_mutable(entry.name, self.mutable_patterns):
+                self.copy(entry.path, target)
+            else:
+                self.link(entry.path, target)
+
+    def provision(self) -> dict:
+        shutil.rmtree(self.destination, ignore_errors=True)
+        self.provision_directory(self.source, self.destination)
+
+        log.info('Provisioned "%s" from "%s": %i linked, %i copied, %i reflinked, '
+                 '%i bytes written', self.destination, self.source, self.stats['linked'],
+                 self.stats['copied'], self.stats['reflinked'], self.stats['bytes_written'])
+
+        return self.stats
+
+
+def provision(source, destination, mutable_patterns=None, use_reflink=True) -> dict:
+    """
+    Create a working directory from a WPS or WRF installation without copying the whole tree.
+
+    Immutable files (executables, tables, static data) are symlinked, directories that contain no
+    mutable files are linked as a whole and the mutable files are copied, using reflinks where the
+    filesystem supports them. Symbolic links with mutable names, e.g. a Vtable link, are not
+    created. The destination is deleted first.
+
+    :param source: the installation directory, e.g. WPS or WRFV3
+    :param destination: the working directory to create
+    :param mutable_patterns: glob patterns of the files that must be copied, defaults to
+        MUTABLE_PATTERNS
+    :param use_reflink: try to clone the mutable files before falling back to a copy
+    :return: dictionary with the number of linked, copied and reflinked files and the bytes written
+    """
+    return Provisioner(source, destination, mutable_patterns, use_reflink).provision()
@@ -1,16 +1,26 @@
 import logging
-import subprocess
-
-import f90nml
+import os
 
 from .exceptions import WrfRunnerException
-from .utils import get_last_line
+from . import launcher, logs, templates
 
 log = logging.getLogger("wps")
 
 
-def check_wps_logfile(path_to_file) -> bool:
-    return 'Successful completion of program' in get_last_line(path_to_file)
+def check_wps_logfile(path_to_file, program=None) -> bool:
+    """
+    Check the log file of a WPS program for its success marker.
+
+    :param program: one of geogrid, ungrib or metgrid, None to take it from the name of the log
+                    file (geogrid.log, ungrib.log or metgrid.log)
+    """
+    if program is None:
+        program = os.path.basename(path_to_file).split('.')[0]
+
+    if program not in ('geogrid', 'ungrib', 'metgrid'):
+        raise WrfRunnerException('Unknown WPS program of the log file "{}"'.format(path_to_file))
+
+    return logs.check_success(path_to_file, program)
 
 
 def run_wps_program(program: str) -> None:
@@ -25,13 +35,28 @@ def run_wps_program(program: str) -> None:
     logfile = program + '.log'
 
     log.info('Starting %s', program)
-    run = subprocess.run('./{}'.format(executable), cwd='WPS/')
-    log.info('%s finished with return code %i', program, run.returncode)
-    if run.returncode or not check_wps_logfile('WPS/{}'.format(logfile)):
+    runner = launcher.get_launcher().serial()
+    returncode = runner.run(program, runner.command(executable, 'WPS/'))
+    log.info('%s finished with return code %i', program, returncode)
+    if returncode or not check_wps_logfile('WPS/{}'.format(logfile), program):
         log.error('%s error. Please see the log', program)
         raise WrfRunnerException("Execution of % failed", program)
 
 
+async def run_wps_program_async(program: str, progress=None) -> None:
+    """
+    Runs a WPS program without blocking the event loop.
+
+    :param program: one of geogrid, ungrib or metgrid
+    :param progress: callback for the progress events, see async_runner.run_program_async
+    """
+    assert not program.endswith('exe')
+
+    runner = launcher.get_launcher().serial()
+    await runner.run_async(program, runner.command('{}.exe'.format(program), 'WPS/'),
+                           '{}.log'.format(program), progress=progress)
+
+
 def run_geogrid():
     return run_wps_program('geogrid')
 
@@ -44,18 +69,21 @@ def run_metgrid():
     return run_wps_program('metgrid')
 
 
-def create_namelist_patch(initialization_time, length_hours=48) -> dict:
+def create_namelist_patch(initialization_time, length_hours=48,
+                          template='template/namelist.wps') -> dict:
     """
     Create a patch that can be applied on the WPS namelist. This patch modifies the time.
 
     :param initialization_time: the 'start_date' parameter will be set to this time
-    :param length_hours: the 'end_date' parameter will be set to the initialization_time + length_hours
+    :param length_hours: the 'end_date' parameter will be set to the initialization_time +
+        length_hours
+    :param template: the WPS namelist template, the number of domains is read from it
     :return:
     """
     assert length_hours > 0
 
     # Get number of domains
-    nml = f90nml.read('template/namelist.wps')
+    nml = templates.load_namelist(template)
     domains = nml['share']['max_dom']
 
     patch = {
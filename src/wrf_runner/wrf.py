@@ -1,17 +1,31 @@
+import copy
+import datetime
 import f90nml
 import glob
 import logging
-import subprocess
 import os
+import re
 
+from . import launcher, logs, templates
 from .exceptions import WrfRunnerException
 
 log = logging.getLogger('WRF')
 
+# The name of a restart file: "wrfrst_d01_2016-01-01_06:00:00"
+RESTART_PATTERN = re.compile(r'wrfrst_d(\d\d)_(\d{4}-\d\d-\d\d_\d\d:\d\d:\d\d)$')
+RESTART_TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
 
-def create_namelist_patch(initialization_time, length_hours=48):
+
+def create_namelist_patch(initialization_time, length_hours=48, restart_interval=None):
+    """
+    Create a patch for namelist.input with the time and the domains from namelist.wps.
+
+    :param initialization_time: arrow object, the start of the simulation
+    :param length_hours: length of the simulation
+    :param restart_interval: if set, wrf.exe writes restart files every restart_interval minutes
+    """
     # Get number of domains
-    nml = f90nml.read('template/namelist.wps')
+    nml = templates.load_namelist('template/namelist.wps')
     domains = nml['share']['max_dom']
 
     patch = {
@@ -63,13 +77,14 @@ def create_namelist_patch(initialization_time, length_hours=48):
     patch['time_control']['end_minute'] = [end_time.minute] * domains
     patch['time_control']['end_second'] = [end_time.second] * domains
 
-    for variable in ['e_we', 'e_sn', 'parent_id', 'i_parent_start', 'j_parent_start', 'parent_grid_ratio']:
-        patch['domains'][variable] = nml['geogrid'][variable]
+    for variable in ['e_we', 'e_sn', 'parent_id', 'i_parent_start', 'j_parent_start',
+                     'parent_grid_ratio']:
+        patch['domains'][variable] = copy.copy(nml['geogrid'][variable])
 
     patch['domains']['grid_id'] = list(range(1, domains + 1))
-    patch['domains']['parent_time_step_ratio'] = nml['geogrid']['parent_grid_ratio']
+    patch['domains']['parent_time_step_ratio'] = copy.copy(nml['geogrid']['parent_grid_ratio'])
 
-    wrf_nml = f90nml.read('template/namelist.input')
+    wrf_nml = templates.load_namelist('template/namelist.input')
 
     vertical_levels = wrf_nml['domains']['e_vert'][0]
     patch['domains']['e_vert'] = [vertical_levels] * domains
@@ -90,9 +105,73 @@ def create_namelist_patch(initialization_time, length_hours=48):
 
     patch['domains']['max_dom'] = domains
 
+    if restart_interval is not None:
+        assert restart_interval > 0
+        patch['time_control']['restart'] = False
+        patch['time_control']['restart_interval'] = restart_interval
+
     return patch
 
 
+def create_restart_patch(restart_time, domains) -> dict:
+    """
+    Create a patch that makes wrf.exe continue from the restart files written at restart_time.
+    """
+    patch = {'time_control': {'restart': True}}
+
+    for name in ['year', 'month', 'day', 'hour', 'minute', 'second']:
+        patch['time_control']['start_' + name] = [getattr(restart_time, name)] * domains
+
+    return patch
+
+
+def read_time_window(namelist_path='WRF/namelist.input'):
+    """
+    Start and end of the first domain in namelist.input.
+
+    :return: tuple (start, end) of naive datetimes
+    """
+    time_control = f90nml.read(str(namelist_path))['time_control']
+
+    def read_time(prefix):
+        values = [time_control.get(prefix + name, 0)
+                  for name in ['year', 'month', 'day', 'hour', 'minute', 'second']]
+        return datetime.datetime(*[value[0] if isinstance(value, list) else value
+                                   for value in values])
+
+    return read_time('start_'), read_time('end_')
+
+
+def find_latest_restart(directory='WRF/', domains=1, start=None, end=None):
+    """
+    Find the latest time for which restart files of all domains exist.
+
+    Only restart files after start and before end are considered, so stale files from another
+    cycle or the files the current run started from are ignored.
+
+    :param start: naive datetime, the start of the current run, None for no limit
+    :param end: naive datetime, the end of the current run, None for no limit
+    :return: naive datetime or None if there is no complete set of restart files
+    """
+    found = {}
+    for path in glob.glob(os.path.join(directory, 'wrfrst_d*')):
+        match = RESTART_PATTERN.search(os.path.basename(path))
+        if match is None:
+            continue
+        domain, time = match.groups()
+        time = datetime.datetime.strptime(time, RESTART_TIME_FORMAT)
+        if (start is not None and time <= start) or (end is not None and time >= end):
+            continue
+        found.setdefault(time, set()).add(int(domain))
+
+    required = set(range(1, domains + 1))
+    complete = [time for time, found_domains in found.items() if found_domains >= required]
+    if not complete:
+        return None
+
+    return max(complete)
+
+
 def link_metgrid_outputs(src, dst):
     dst_files = glob.glob(dst + '/met_em.*.nc')
     if dst_files:
@@ -111,27 +190,85 @@ def link_metgrid_outputs(src, dst):
     log.info('Files linked')
 
 
-def check_wrf_output():
-    with open('WRF/rsl.error.0000') as f:
-        last_line = f.readlines()[-1]
-        return 'SUCCESS COMPLETE' in last_line
+def check_wrf_output(program='wrf'):
+    return logs.check_success('WRF/rsl.error.0000', program)
 
 
-def run_real():
+def run_real(cores=1, threads=None):
+    """
+    :param cores: number of MPI tasks, must match nproc_x * nproc_y if they are in the namelist
+    :param threads: number of OpenMP threads per task, None to keep OMP_NUM_THREADS
+    """
     log.info('Starting real.exe')
-    run = subprocess.run(['mpirun', '-n', '1', './real.exe'], cwd='WRF/')
-    log.info('real.exe finished with return code %i', run.returncode)
+    runner = launcher.get_launcher()
+    returncode = runner.run('real', runner.command('real.exe', 'WRF/', cores, threads))
+    log.info('real.exe finished with return code %i', returncode)
 
-    if run.returncode or not check_wrf_output():
+    if returncode or not check_wrf_output('real'):
         log.error('real.exe failed. Please see the log')
         raise WrfRunnerException('real.exe failed.')
 
 
-def run_wrf(cores):
+def run_wrf(cores, threads=None):
     log.info('Starting wrf.exe')
-    run = subprocess.run(['mpirun', '-n', str(cores), './wrf.exe'], cwd='WRF/')
-    log.info('wrf.exe finished with return code %i', run.returncode)
+    runner = launcher.get_launcher()
+    returncode = runner.run('wrf', runner.command('wrf.exe', 'WRF/', cores, threads),
+                            logfile='WRF/rsl.error.0000')
+    log.info('wrf.exe finished with return code %i', returncode)
 
-    if run.returncode or not check_wrf_output():
+    if returncode or not check_wrf_output('wrf'):
         log.error('wrf.exe failed. Please see the log')
         raise WrfRunnerException('wrf.exe failed.')
+
+
+def run_wrf_with_restarts(cores, max_resubmissions=3, threads=None):
+    """
+    Run wrf.exe and resubmit it from the latest restart files if it fails.
+
+    The namelist WRF/namelist.input has to have restart_interval set, see create_namelist_patch.
+    Every resubmission patches the namelist to start from the latest complete set of restart
+    files written after the start of the failed run. If the failed run wrote none, it made no
+    progress and the failure is raised.
+
+    :param cores: number of MPI tasks
+    :param max_resubmissions: how many times wrf.exe is started again after a failure
+    :param threads: number of OpenMP threads per task
+    """
+    namelist = 'WRF/namelist.input'
+    domains = f90nml.read(namelist)['domains'].get('max_dom', 1)
+    resubmissions = 0
+
+    while True:
+        try:
+            return run_wrf(cores, threads)
+        except WrfRunnerException:
+            if resubmissions >= max_resubmissions:
+                log.error('wrf.exe failed %i times, giving up', resubmissions + 1)
+                raise
+
+            start, end = read_time_window(namelist)
+            restart_time = find_latest_restart('WRF/', domains, start, end)
+            if restart_time is None:
+                log.error('wrf.exe failed without writing restart files after %s, giving up',
+                          start.strftime(RESTART_TIME_FORMAT))
+                raise
+
+        resubmissions += 1
+        log.info('Resubmitting wrf.exe from the restart at %s (%i/%i)',
+                 restart_time.strftime(RESTART_TIME_FORMAT), resubmissions, max_resubmissions)
+
+        temporary = namelist + '.tmp'
+        f90nml.patch(namelist, create_restart_patch(restart_time, domains), temporary)
+        os.replace(temporary, namelist)
+
+
+async def run_real_async(progress=None, cores=1, threads=None):
+    runner = launcher.get_launcher()
+    await runner.run_async('real', runner.command('real.exe', 'WRF/', cores, threads),
+                           'rsl.error.0000', progress=progress)
+
+
+async def run_wrf_async(cores, progress=None, fatal_patterns=None, threads=None):
+    runner = launcher.get_launcher()
+    await runner.run_async('wrf', runner.command('wrf.exe', 'WRF/', cores, threads),
+                           'rsl.error.0000', progress=progress, fatal_patterns=fatal_patterns)
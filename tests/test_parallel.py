@@ -0,0 +1,47 @@
+import datetime
+import os
+
+import pytest
+
+import stubs
+from wrf_runner import metrics
+from wrf_runner.parallel import run_metgrid_parallel
+
+START = datetime.datetime(2016, 1, 1)
+HOURS = 12
+
+
+@pytest.fixture
+def wps_directory(tmpdir, monkeypatch):
+    monkeypatch.setenv('STUB_SLEEP', '0')
+    monkeypatch.chdir(str(tmpdir))
+    stubs.create_wps('WPS', START, HOURS)
+    return tmpdir.join('WPS')
+
+
+def expected_met_em_files():
+    return ['met_em.d01.{}.nc'.format((START + datetime.timedelta(hours=hour))
+                                      .strftime('%Y-%m-%d_%H:%M:%S'))
+            for hour in range(HOURS + 1)]
+
+
+@pytest.mark.parametrize('slices', [1, 4, 20])
+def test_every_met_em_file_once(wps_directory, slices):
+    run_metgrid_parallel(slices)
+
+    names = [name for name in os.listdir(str(wps_directory)) if name.startswith('met_em.')]
+    assert sorted(names) == expected_met_em_files()
+    assert not wps_directory.join('parallel_metgrid').check()
+
+
+def test_metrics_count_outputs_of_the_slices(wps_directory, tmpdir):
+    report = str(tmpdir.join('run_report.jsonl'))
+    metrics.configure(report)
+    try:
+        run_metgrid_parallel(4)
+    finally:
+        metrics.disable()
+
+    records = metrics.read_report(report)
+    assert len(records) == 4
+    assert sum(record['files_produced'] for record in records) == HOURS + 1
@@ -0,0 +1,85 @@
+import datetime
+import os
+
+import arrow
+import f90nml
+import pytest
+
+import stubs
+from wrf_runner import utils, wrf
+from wrf_runner.exceptions import WrfRunnerException
+
+START = datetime.datetime(2016, 1, 1)
+HOURS = 24
+RESTART_INTERVAL = 360
+
+
+def hours_after_start(*hours):
+    return ','.join((START + datetime.timedelta(hours=hour)).strftime('%Y-%m-%d_%H:%M:%S')
+                    for hour in hours)
+
+
+@pytest.fixture
+def run_directory(tmpdir, monkeypatch):
+    """
+    Working directory with the stub wrf.exe and a namelist with restart files every 6 hours.
+    """
+    monkeypatch.setenv('PATH', os.environ['PATH'])
+    monkeypatch.setenv('STUB_SLEEP', '0')
+    stubs.install_mpirun(str(tmpdir.join('bin')))
+
+    monkeypatch.chdir(str(tmpdir))
+    stubs.create_template('template', START, HOURS)
+    stubs.create_wrf('WRF')
+    patch = wrf.create_namelist_patch(arrow.get(START), length_hours=HOURS,
+                                      restart_interval=RESTART_INTERVAL)
+    utils.apply_namelist_patch('template/namelist.input', 'WRF/namelist.input', patch)
+    return tmpdir
+
+
+@pytest.fixture
+def submissions(monkeypatch):
+    """
+    time_control of namelist.input at every start of wrf.exe.
+    """
+    recorded = []
+    run_wrf = wrf.run_wrf
+
+    def recording_run_wrf(*args, **kwargs):
+        recorded.append(f90nml.read('WRF/namelist.input')['time_control'])
+        return run_wrf(*args, **kwargs)
+
+    monkeypatch.setattr(wrf, 'run_wrf', recording_run_wrf)
+    return recorded
+
+
+def test_resumes_from_latest_restart(run_directory, submissions, monkeypatch):
+    monkeypatch.setenv('STUB_FAIL_AT', hours_after_start(15))
+
+    wrf.run_wrf_with_restarts(1)
+
+    assert len(submissions) == 2
+    assert not submissions[0]['restart']
+    assert submissions[1]['restart']
+    assert submissions[1]['start_hour'] == 12
+    assert submissions[1]['start_day'] == 1
+    assert run_directory.join('WRF', 'wrfout_d01_2016-01-02_00:00:00').check()
+
+
+def test_gives_up_after_max_resubmissions(run_directory, submissions, monkeypatch):
+    monkeypatch.setenv('STUB_FAIL_AT', hours_after_start(8, 14, 20))
+
+    with pytest.raises(WrfRunnerException):
+        wrf.run_wrf_with_restarts(1, max_resubmissions=2)
+
+    assert len(submissions) == 3
+    assert [time_control['start_hour'] for time_control in submissions[1:]] == [6, 12]
+
+
+def test_gives_up_without_progress(run_directory, submissions, monkeypatch):
+    monkeypatch.setenv('STUB_FAIL_AT', hours_after_start(3))
+
+    with pytest.raises(WrfRunnerException):
+        wrf.run_wrf_with_restarts(1)
+
+    assert len(submissions) == 1